@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of email body extraction over synthetic Gmail MIME trees.
+
+Compares mime_extract.extract_text with the previous recursive extractor,
+which decoded every candidate part in full as UTF-8, and reports time and
+peak allocation per message for each kind of tree.
+
+    python benchmarks/bench_mime_extract.py [--repeat N]
+"""
+
+import os
+import sys
+import time
+import base64
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mime_extract import extract_text  # noqa: E402
+
+REPLY = ("Hello,\n\nwe need the facade of our house in Brno insulated, about 180 m2. "
+         "Could you send us a quote?\n\nThank you\nJana\n")
+QUOTED = "".join(f"> Earlier message line {i} with some quoted text in it\n" for i in range(400))
+SIGNATURE = "-- \nJana Nováková\nProjektová manažerka\n+420 123 456 789\n"
+
+
+def _encode(text, charset='utf-8'):
+    return base64.urlsafe_b64encode(text.encode(charset)).decode('ascii')
+
+
+def _part(mime_type, text, charset='utf-8', filename=''):
+    return {
+        'mimeType': mime_type,
+        'filename': filename,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': _encode(text, charset)},
+    }
+
+
+def _html(text):
+    paragraphs = ''.join(f'<p>{line}</p>' for line in text.splitlines())
+    return (f'<html><head><style>p {{margin: 0}}</style></head><body>{paragraphs}'
+            f'<div class="gmail_quote"><blockquote>{QUOTED}</blockquote></div></body></html>')
+
+
+def corpus():
+    """Synthetic MIME trees covering the shapes seen in the inbox."""
+    body = REPLY + "\nOn Mon, 3 Mar 2025 at 10:00, Bot <bot@example.com> wrote:\n" + QUOTED + SIGNATURE
+    attachment = _part('application/pdf', 'x' * 200000, filename='offer.pdf')
+    return {
+        'single plain': _part('text/plain', body),
+        'alternative': {'mimeType': 'multipart/alternative',
+                        'parts': [_part('text/plain', body), _part('text/html', _html(body))]},
+        'mixed + attachment': {'mimeType': 'multipart/mixed', 'parts': [
+            attachment,
+            {'mimeType': 'multipart/related', 'parts': [
+                {'mimeType': 'multipart/alternative',
+                 'parts': [_part('text/plain', body), _part('text/html', _html(body))]}]}]},
+        'html only': {'mimeType': 'multipart/mixed',
+                      'parts': [_part('text/html', _html(REPLY)), attachment]},
+        'latin-2 plain': _part('text/plain', body, charset='iso-8859-2'),
+        'huge plain': _part('text/plain', REPLY * 2000),
+    }
+
+
+def legacy_extract(payload):
+    """The recursive extractor extract_text replaced."""
+    content = ""
+    try:
+        if 'parts' in payload:
+            for part in payload['parts']:
+                if part['mimeType'] == 'text/plain' and 'data' in part['body']:
+                    content = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+                    break
+                elif 'parts' in part:
+                    nested_content = legacy_extract(part)
+                    if nested_content:
+                        content = nested_content
+                        break
+        elif 'body' in payload and 'data' in payload['body']:
+            content = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
+        return content
+    except Exception:
+        return ""
+
+
+def measure(function, payload, repeat):
+    """Return (microseconds per call, peak KiB allocated, output length)."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        output = function(payload)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    function(payload)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1e6, peak / 1024, len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark email body extraction')
+    parser.add_argument('--repeat', type=int, default=200, help='Calls per measurement')
+    args = parser.parse_args()
+
+    print(f"{'tree':<20} {'extractor':<8} {'us/call':>10} {'peak KiB':>10} {'chars':>8}")
+    for name, payload in corpus().items():
+        for label, function in (('legacy', legacy_extract), ('new', extract_text)):
+            micros, peak, length = measure(function, payload, args.repeat)
+            print(f"{name:<20} {label:<8} {micros:>10.1f} {peak:>10.1f} {length:>8}")
+
+
+if __name__ == '__main__':
+    main()
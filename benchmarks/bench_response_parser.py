@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of LLM response parsing on well-formed, malformed and adversarial outputs.
+
+Compares decision.parse_decision (JSON in one pass, single-scan tag
+fallback) with the previous parser, which ran four regex searches over the
+whole text, and reports the time per call and the parsed type for each case.
+
+    python benchmarks/bench_response_parser.py [--repeat N]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decision import DecisionFormatError, parse_decision  # noqa: E402
+
+REPLY = ("Dobrý den,\n\nděkujeme za poptávku zateplení fasády. Standardní cena kompletního "
+         "zateplení s polystyrenem je 700 Kč/m² včetně materiálu.\n\nJsem AI asistent, pro "
+         "kontakt s člověkem odpovězte na tento e-mail.\n")
+
+
+def corpus():
+    """Answers the LLM has produced or could produce, by name."""
+    decision = {"type": "answer", "confidence": 92, "response": REPLY,
+                "response_email": "jana@example.cz", "reason": "Facade work in Brno"}
+    as_json = json.dumps(decision, ensure_ascii=False)
+    as_tags = (f"<Type>: answer\n<Confidence>: 92\n<Response>: {REPLY}\n"
+               f"<Response email>: jana@example.cz\n<Reason>: Facade work in Brno")
+    return {
+        'json': as_json,
+        'json in fence': f"Here is my answer:\n```json\n{as_json}\n```",
+        'tags': as_tags,
+        'json truncated': as_json[:len(as_json) // 2],
+        'invalid type': as_tags.replace('<Type>: answer', '<Type>: reply'),
+        'no decision': REPLY * 5,
+        'tags repeated': as_tags * 200,
+        'many brackets': '<' * 100000 + as_tags,
+        'deep nesting': '{"type": "ignore", "x": ' + '[' * 50000 + ']' * 50000 + '}',
+        'huge response': json.dumps(dict(decision, response=REPLY * 2000), ensure_ascii=False),
+    }
+
+
+def legacy_parse(response_text):
+    """The parser parse_decision replaced, including its invalid-type reason bug."""
+    parsed = {'type': 'forward to human', 'response': '', 'response_email': '',
+              'reason': 'Failed to parse LLM response'}
+    type_match = re.search(r'<Type>:\s*(.*?)(?:\n|$)', response_text)
+    if type_match:
+        parsed['type'] = type_match.group(1).strip().lower()
+    response_match = re.search(
+        r'<Response>:\s*(.*?)(?=<Response email>|<Reason>|\Z)', response_text, re.DOTALL)
+    if response_match:
+        parsed['response'] = response_match.group(1).strip()
+    email_match = re.search(r'<Response email>:\s*(.*?)(?=<Reason>|\Z)', response_text, re.DOTALL)
+    if email_match:
+        parsed['response_email'] = email_match.group(1).strip()
+    reason_match = re.search(r'<Reason>:\s*(.*?)(?=<|\Z)', response_text, re.DOTALL)
+    if reason_match:
+        parsed['reason'] = reason_match.group(1).strip()
+    if parsed['type'] not in ['answer', 'forward to human', 'ignore']:
+        parsed['type'] = 'forward to human'
+        parsed['reason'] = f"Invalid response type: {parsed['type']}. {parsed['reason']}"
+    return parsed['type']
+
+
+def new_parse(response_text):
+    """parse_decision, with parse errors reported like the client does."""
+    try:
+        return parse_decision(response_text).type
+    except DecisionFormatError as e:
+        return f"error: {str(e)}"
+
+
+def measure(function, text, repeat):
+    """Return (microseconds per call, result)."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(text)
+    return (time.perf_counter() - started) / repeat * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark LLM response parsing')
+    parser.add_argument('--repeat', type=int, default=200, help='Calls per measurement')
+    args = parser.parse_args()
+
+    print(f"{'case':<16} {'chars':>8} {'legacy us':>10} {'new us':>10}  result (legacy / new)")
+    for name, text in corpus().items():
+        legacy_micros, legacy_result = measure(legacy_parse, text, args.repeat)
+        new_micros, new_result = measure(new_parse, text, args.repeat)
+        print(f"{name:<16} {len(text):>8} {legacy_micros:>10.1f} {new_micros:>10.1f}  "
+              f"{legacy_result} / {new_result}")
+
+
+if __name__ == '__main__':
+    main()
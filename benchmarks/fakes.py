@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+In-process fakes of the Gmail API and the OpenAI chat completions client.
+
+FakeGmail serves an in-memory mailbox through the same users().messages(),
+threads(), labels(), history() resource chain and batch requests the bot
+uses, and FakeChatClient answers chat.completions.create like the DeepSeek
+API. Both sleep a configurable latency per call and fail a configurable
+share of calls with the errors the real clients raise, so runs can be
+replayed offline with a realistic shape.
+"""
+
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import threading
+import zlib
+from collections import Counter
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import httplib2
+import openai
+from googleapiclient.errors import HttpError
+
+from gmail_service import QUOTA_UNITS, DEFAULT_QUOTA_UNITS
+
+BOT_ADDRESS = 'bot@example.com'
+SYSTEM_LABELS = ('INBOX', 'UNREAD', 'SENT')
+
+_EMAIL_BLOCK = re.compile(r'<Email id="(\d+)">\n(.*?)\n</Email>', re.DOTALL)
+_SENDER = re.compile(r'From: (.*)$', re.MULTILINE)
+_SUBJECT = re.compile(r'^Subject: (.*)$', re.MULTILINE)
+
+# Request the injected API errors carry; openai's errors only keep a reference
+# to it, so the HTTP library openai itself is built on is not needed
+_API_REQUEST = SimpleNamespace(method='POST', url='https://api.deepseek.com/chat/completions',
+                               headers={})
+
+
+def _jitter(rng, seconds):
+    """A latency around the mean, between half and one and a half times it."""
+    return seconds * rng.uniform(0.5, 1.5) if seconds > 0 else 0.0
+
+
+def http_error(status, message):
+    """An HttpError as raised by googleapiclient for a failed call."""
+    content = json.dumps({'error': {'code': status, 'message': message}}).encode()
+    return HttpError(httplib2.Response({'status': status}), content)
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def build_payload(record, timestamp):
+    """The MIME payload of a corpus message: plain text, or plain and HTML alternatives."""
+    headers = [{'name': 'From', 'value': record['from']},
+               {'name': 'Subject', 'value': record['subject']},
+               {'name': 'Date', 'value': formatdate(timestamp)},
+               {'name': 'Message-ID', 'value': f"<{record['id']}@example.com>"}]
+    plain = {'mimeType': 'text/plain', 'filename': '',
+             'headers': [{'name': 'Content-Type', 'value': 'text/plain; charset="utf-8"'}],
+             'body': {'data': _encode(record['body'])}}
+    if not record.get('html'):
+        return dict(plain, headers=headers + plain['headers'])
+    paragraphs = ''.join(f'<p>{line}</p>' for line in record['body'].splitlines())
+    html = {'mimeType': 'text/html', 'filename': '',
+            'headers': [{'name': 'Content-Type', 'value': 'text/html; charset="utf-8"'}],
+            'body': {'data': _encode(f'<html><body>{paragraphs}</body></html>')}}
+    return {'mimeType': 'multipart/alternative', 'headers': headers, 'filename': '',
+            'body': {}, 'parts': [plain, html]}
+
+
+class FakeRequest:
+    """An unexecuted API call, executed against the fake mailbox."""
+
+    def __init__(self, gmail, method_id, handler):
+        self.gmail = gmail
+        self.methodId = method_id
+        self.handler = handler
+
+    def execute(self):
+        self.gmail.wait()
+        self.gmail.maybe_fail(self.methodId)
+        return self.handler()
+
+
+class FakeBatch:
+    """A batch HTTP request: one round trip, with a result or error per call."""
+
+    def __init__(self, gmail, callback):
+        self.gmail = gmail
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.gmail.wait()
+        self.gmail.maybe_fail('batch')
+        for request_id, request in self.requests:
+            try:
+                self.gmail.maybe_fail(request.methodId)
+                response, exception = request.handler(), None
+            except HttpError as e:
+                response, exception = None, e
+            self.callback(request_id, response, exception)
+
+
+class _Resource:
+    """One level of the resource chain; each method builds a FakeRequest."""
+
+    def __init__(self, gmail, prefix, methods, children=()):
+        self._gmail = gmail
+        self._prefix = prefix
+        self._methods = methods
+        self._children = children
+
+    def __getattr__(self, name):
+        if name in self._children:
+            return lambda: self._children[name]
+        if name not in self._methods:
+            raise AttributeError(name)
+        method_id = f"{self._prefix}.{name}"
+        handler = self._methods[name]
+        return lambda **kwargs: self._gmail.request(method_id, lambda: handler(**kwargs))
+
+
+class FakeGmail:
+    """
+    An in-memory Gmail mailbox behind the API the bot calls.
+
+    Stands in for GmailService: service is the fake itself, and call_counts
+    and quota_units count the requests built, as GmailService does. The time
+    each message is first fetched and last relabelled is recorded, to
+    measure the per-message latency of a run.
+    """
+
+    def __init__(self, corpus, latency=0.0, failure_rate=0.0, seed=0):
+        """
+        Initialize the mailbox.
+
+        Args:
+            corpus: Message records (see replay.load_corpus)
+            latency: Mean seconds per API round trip (a batch is one round trip)
+            failure_rate: Share of calls failing with a 500 or 429 HttpError
+            seed: Seed of the latency and failure draws
+        """
+        self.service = self
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.call_counts = Counter()
+        self.failures = Counter()
+        self.first_fetched = {}
+        self.last_modified = {}
+        self.sent = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._labels = {name: name for name in SYSTEM_LABELS}
+        self._messages = {}
+        self._threads = {}
+        self._history_id = 1000
+
+        now = time.time()
+        for record in corpus:
+            timestamp = now - record.get('age_hours', 1) * 3600
+            message = {
+                'id': record['id'],
+                'threadId': record['thread_id'],
+                'labelIds': list(record.get('labels') or ['INBOX', 'UNREAD']),
+                'internalDate': str(int(timestamp * 1000)),
+                'payload': build_payload(record, timestamp),
+            }
+            self._messages[message['id']] = message
+            thread = self._threads.setdefault(message['threadId'], [])
+            # Earlier messages of the thread that are not in the corpus
+            for index in range(record.get('thread_size', 1) - 1 - len(thread)):
+                thread.append(f"{message['threadId']}-earlier-{index}")
+            thread.append(message['id'])
+
+        methods = {
+            'getProfile': self._get_profile,
+            'watch': lambda **kwargs: {'historyId': str(self._history_id), 'expiration': '0'},
+            'stop': lambda **kwargs: '',
+        }
+        children = {
+            'messages': _Resource(self, 'gmail.users.messages', {
+                'list': self._list_messages, 'get': self._get_message,
+                'modify': self._modify_message, 'batchModify': self._batch_modify,
+                'send': self._send_message}),
+            'threads': _Resource(self, 'gmail.users.threads', {'get': self._get_thread}),
+            'labels': _Resource(self, 'gmail.users.labels', {
+                'list': self._list_labels, 'create': self._create_label}),
+            'history': _Resource(self, 'gmail.users.history', {'list': self._list_history}),
+        }
+        self._users = _Resource(self, 'gmail.users', methods, children)
+
+    @property
+    def quota_units(self):
+        """Gmail API quota units used by the requests built so far."""
+        with self._lock:
+            return sum(QUOTA_UNITS.get(method, DEFAULT_QUOTA_UNITS) * count
+                       for method, count in self.call_counts.items())
+
+    def users(self):
+        return self._users
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def request(self, method_id, handler):
+        """Build a request, counting it like GmailService does."""
+        with self._lock:
+            self.call_counts[method_id] += 1
+        return FakeRequest(self, method_id, handler)
+
+    def wait(self):
+        """Sleep for one API round trip."""
+        with self._lock:
+            seconds = _jitter(self._rng, self.latency)
+        time.sleep(seconds)
+
+    def maybe_fail(self, method_id):
+        """Raise a server or rate limit error for the configured share of calls."""
+        with self._lock:
+            failed = self._rng.random() < self.failure_rate
+            if failed:
+                self.failures[method_id] += 1
+                status = self._rng.choice((500, 429))
+        if failed:
+            raise http_error(status, 'Backend Error' if status == 500 else 'Rate Limit Exceeded')
+
+    def label_counts(self):
+        """Number of corpus messages carrying each label, by label name."""
+        names = {label_id: name for name, label_id in self._labels.items()}
+        with self._lock:
+            return Counter(names.get(label, label) for message in self._messages.values()
+                           for label in message['labelIds'])
+
+    def _message(self, message_id):
+        message = self._messages.get(message_id)
+        if message is None:
+            raise http_error(404, 'Requested entity was not found.')
+        return message
+
+    def _get_profile(self, userId):
+        return {'emailAddress': BOT_ADDRESS, 'historyId': str(self._history_id)}
+
+    def _list_messages(self, userId, q=None, maxResults=100, pageToken=None, **kwargs):
+        # Only the bot's query is understood: unread inbox mail without Bot Read.
+        # The page token is a position in the mailbox, so messages relabelled
+        # since the previous page do not shift the next one.
+        bot_read = self._labels.get('Bot Read')
+        start = int(pageToken or 0)
+        with self._lock:
+            matching = [(position, message) for position, message in enumerate(self._messages.values())
+                        if position >= start and 'INBOX' in message['labelIds']
+                        and 'UNREAD' in message['labelIds'] and bot_read not in message['labelIds']]
+        page = matching[:maxResults]
+        response = {'messages': [{'id': message['id'], 'threadId': message['threadId']}
+                                 for _, message in page],
+                    'resultSizeEstimate': len(matching)}
+        if len(matching) > maxResults:
+            response['nextPageToken'] = str(page[-1][0] + 1)
+        return response
+
+    def _get_message(self, userId, id, format='full', **kwargs):
+        with self._lock:
+            message = self._message(id)
+            self.first_fetched.setdefault(id, time.monotonic())
+            if format == 'metadata':
+                headers = message['payload']['headers']
+                wanted = kwargs.get('metadataHeaders')
+                return {'id': id, 'threadId': message['threadId'],
+                        'labelIds': list(message['labelIds']),
+                        'internalDate': message['internalDate'],
+                        'payload': {'headers': [header for header in headers
+                                                if not wanted or header['name'] in wanted]}}
+            return {'id': id, 'threadId': message['threadId'],
+                    'labelIds': list(message['labelIds']), 'payload': message['payload']}
+
+    def _relabel(self, message_id, body):
+        """Apply a modify body to one message; the lock must be held."""
+        message = self._message(message_id)
+        for label in body.get('addLabelIds', []) + body.get('removeLabelIds', []):
+            if label not in self._labels.values():
+                raise http_error(400, f'Invalid label: {label}')
+        labels = [label for label in message['labelIds'] if label not in body.get('removeLabelIds', [])]
+        labels += [label for label in body.get('addLabelIds', []) if label not in labels]
+        message['labelIds'] = labels
+        self.last_modified[message_id] = time.monotonic()
+
+    def _modify_message(self, userId, id, body):
+        with self._lock:
+            self._relabel(id, body)
+            return {'id': id, 'labelIds': list(self._messages[id]['labelIds'])}
+
+    def _batch_modify(self, userId, body):
+        with self._lock:
+            for message_id in body['ids']:
+                self._relabel(message_id, body)
+        return ''
+
+    def _send_message(self, userId, body):
+        with self._lock:
+            message_id = f"sent-{len(self.sent) + 1}"
+            self.sent.append(body)
+            self._threads.setdefault(body.get('threadId'), []).append(message_id)
+            self._history_id += 1
+        return {'id': message_id, 'threadId': body.get('threadId'), 'labelIds': ['SENT']}
+
+    def _get_thread(self, userId, id, **kwargs):
+        with self._lock:
+            if id not in self._threads:
+                raise http_error(404, 'Requested entity was not found.')
+            return {'id': id, 'messages': [{'id': message_id} for message_id in self._threads[id]]}
+
+    def _list_labels(self, userId):
+        with self._lock:
+            return {'labels': [{'id': label_id, 'name': name} for name, label_id in self._labels.items()]}
+
+    def _create_label(self, userId, body):
+        with self._lock:
+            label_id = f"Label_{len(self._labels) + 1}"
+            self._labels[body['name']] = label_id
+            return {'id': label_id, 'name': body['name']}
+
+    def _list_history(self, userId, startHistoryId, **kwargs):
+        # Nothing changes while a replay runs
+        return {'history': [], 'historyId': str(self._history_id)}
+
+
+class FakeChatClient:
+    """
+    Answers chat completions like the DeepSeek API, with scripted decisions.
+
+    Decisions come from the corpus records, matched by sender and subject;
+    emails without one get a type drawn from a stable hash of their text.
+    Requests take the latency configured for their model, longer for
+    batches, and the configured share of them fail with a transient error.
+    """
+
+    def __init__(self, corpus=(), latency=None, failure_rate=0.0, seed=0):
+        """
+        Initialize the client.
+
+        Args:
+            corpus: Message records whose 'decision' entries script the answers
+            latency: Mean seconds per request by model name
+            failure_rate: Share of requests failing with a 503 or 429 error
+            seed: Seed of the latency and failure draws
+        """
+        self.latency = latency or {}
+        self.failure_rate = failure_rate
+        self.requests = Counter()
+        self.failures = Counter()
+        self._scripted = {(_address(record['from']), record['subject']): record['decision']
+                          for record in corpus if record.get('decision')}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cached_prefixes = set()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def close(self):
+        pass
+
+    def decide(self, email_text):
+        """The decision on one email, as a dict of the response schema."""
+        sender = _SENDER.search(email_text)
+        subject = _SUBJECT.search(email_text)
+        key = (sender.group(1).strip() if sender else '', subject.group(1).strip() if subject else '')
+        decision = self._scripted.get(key)
+        if decision is None:
+            draw = zlib.crc32(email_text.encode('utf-8')) % 100
+            decision_type = 'answer' if draw < 30 else 'forward to human' if draw < 55 else 'ignore'
+            decision = {'type': decision_type, 'confidence': 60 + draw % 40}
+        return {'type': decision['type'], 'confidence': decision.get('confidence', 90),
+                'response': decision.get('response', 'Dobrý den, děkujeme za poptávku.')
+                if decision['type'] == 'answer' else '',
+                'response_email': decision.get('response_email', ''),
+                'reason': decision.get('reason', 'Replayed decision')}
+
+    async def _create(self, model, messages, max_tokens=None, stream=False, **kwargs):
+        user_text = messages[-1]['content']
+        blocks = _EMAIL_BLOCK.findall(user_text)
+        if blocks:
+            content = json.dumps({'emails': [dict(self.decide(text), id=int(number))
+                                             for number, text in blocks]}, ensure_ascii=False)
+        else:
+            content = json.dumps(self.decide(user_text), ensure_ascii=False)
+
+        with self._lock:
+            self.requests[model] += 1
+            seconds = _jitter(self._rng, self.latency.get(model, 0.0)) * (1 + 0.25 * max(0, len(blocks) - 1))
+            failed = self._rng.random() < self.failure_rate
+            if failed:
+                self.failures[model] += 1
+                status = self._rng.choice((503, 429))
+            # The system prompt is served from the context cache after the first request
+            prefix = messages[0]['content']
+            cached = len(prefix) // 4 if (model, prefix) in self._cached_prefixes else 0
+            self._cached_prefixes.add((model, prefix))
+
+        if failed:
+            await asyncio.sleep(seconds / 10)
+            response = SimpleNamespace(status_code=status, headers={}, request=_API_REQUEST)
+            error = openai.RateLimitError if status == 429 else openai.InternalServerError
+            raise error('Replayed failure', response=response, body=None)
+
+        prompt_tokens = sum(len(message['content']) for message in messages) // 4
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4,
+                                prompt_cache_hit_tokens=cached,
+                                prompt_cache_miss_tokens=prompt_tokens - cached)
+        if stream:
+            return _FakeStream(content, usage, seconds)
+        await asyncio.sleep(seconds)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=usage)
+
+
+class _FakeStream:
+    """A streamed completion delivering its content in chunks over the request latency."""
+
+    CHUNK_CHARS = 16
+
+    def __init__(self, content, usage, seconds):
+        self.content = content
+        self.usage = usage
+        self.seconds = seconds
+
+    async def __aiter__(self):
+        pieces = [self.content[start:start + self.CHUNK_CHARS]
+                  for start in range(0, len(self.content), self.CHUNK_CHARS)]
+        for piece in pieces:
+            await asyncio.sleep(self.seconds / len(pieces))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))],
+                                  usage=None)
+        yield SimpleNamespace(choices=[], usage=self.usage)
+
+    async def close(self):
+        pass
+
+
+def _address(sender):
+    """The bare address of a From header, as the bot extracts it."""
+    return sender.split('<')[-1].split('>')[0]
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Offline replay of a mailbox through EmailBot.process_emails.
+
+The bot runs against benchmarks.fakes: an in-memory Gmail mailbox and a
+chat completions client with scripted decisions, both with configurable
+latency and failure rates. The corpus is a JSONL file with one message per
+line, or a synthetic mailbox. Each run starts from empty local state and
+reports throughput, per-message latency (first fetch to last label change),
+API call counts and peak memory; --json writes the same numbers for
+tracking regressions.
+
+    python benchmarks/replay.py [--corpus FILE | --messages N] [--json FILE]
+
+Corpus lines look like
+
+    {"id": "m1", "thread_id": "t1", "from": "Jana <jana@example.cz>",
+     "subject": "Zateplení fasády", "body": "...", "html": false, "age_hours": 2,
+     "thread_size": 1, "decision": {"type": "answer", "confidence": 92}}
+
+Only "body" is required. Files of {"request_id", "title", "body"} records,
+like requests.jsonl, are read too: the title becomes the subject.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import (DEFAULT_MAX_WORKERS, DEFAULT_PAGE_SIZE, DEFAULT_LLM_BATCH_SIZE,  # noqa: E402
+                    LLM_INPUT_TOKEN_BUDGET, LLM_MODEL, LLM_FAST_MODEL)
+from metrics import Metrics  # noqa: E402
+from benchmarks.fakes import FakeChatClient, FakeGmail  # noqa: E402
+
+INQUIRIES = [
+    ("Poptávka zateplení fasády", "Dobrý den,\n\npotřebujeme zateplit fasádu rodinného domu, "
+     "asi {size} m². Lokalita: Brno, Česká republika.\nMůžete nám poslat cenovou nabídku?\n\n"
+     "Děkuji\n{name}\n+420 777 {number}"),
+    ("Rekonstrukce koupelny", "Dobrý den,\nhledáme firmu na rekonstrukci koupelny ({size} m²) "
+     "v Praze. Termín nejlépe do konce měsíce.\n\nS pozdravem\n{name}"),
+    ("Renovation inquiry", "Hello,\n\nwe are renovating a flat in Germany, about {size} m2, "
+     "and need painters. Location: Dresden.\nCould you send a quote?\n\nThanks,\n{name}"),
+]
+FOREIGN = ("Zakázka v Polsku", "Dobrý den,\nmáme zakázku na montáž oken v Polsku (Wrocław), "
+           "{size} kusů. Máte kapacitu?\n\n{name}")
+NEWSLETTER = ("Novinky a akce tohoto týdne", "Nejlepší nabídky týdne!\n\nSleva {size} % na "
+              "vybrané zboží.\nhttps://shop.example.com/akce\n\nTento e-mail byl odeslán "
+              "automaticky.\nOdhlásit odběr: https://shop.example.com/unsubscribe\n"
+              "© 2025 Shop s.r.o. Všechna práva vyhrazena.")
+MARKETPLACE = ("Nová poptávka: malování bytu", "Nová poptávka ve vašem oboru\n\nSlužba: malování "
+               "bytu\nLokalita: Ostrava, Česká republika\nRozsah: {size} m²\n\nZobrazit poptávku\n"
+               "Reagovat na poptávku\nNastavení upozornění\nStáhněte si naši aplikaci")
+QUOTE = "\n\nOn Mon, 3 Mar 2025 at 10:00, Bot <bot@example.com> wrote:\n" + "".join(
+    f"> Earlier message line {i}\n" for i in range(30))
+NAMES = ["Jana Nováková", "Petr Svoboda", "Olena Kovalenko", "Martin Dvořák", "Eva Černá"]
+
+
+def synthetic_corpus(count, seed=0):
+    """
+    A synthetic mailbox with the mix of mail the bot sees.
+
+    About a third are inquiries to answer, a third newsletters to ignore, and
+    the rest foreign jobs to forward, marketplace notifications, follow-ups
+    in existing threads and messages too old to handle.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(1, count + 1):
+        name = rng.choice(NAMES)
+        values = {'size': rng.randint(10, 400), 'name': name, 'number': rng.randint(100000, 999999)}
+        kind = rng.choices(['inquiry', 'newsletter', 'foreign', 'marketplace', 'follow-up', 'old'],
+                           weights=[30, 35, 10, 10, 10, 5])[0]
+        sender = f"{name} <{name.split()[0].lower()}{index}@example.cz>"
+        decision = {'type': 'answer', 'confidence': rng.randint(85, 99),
+                    'reason': 'Inquiry in an operated region'}
+        if kind == 'newsletter':
+            subject, body = NEWSLETTER
+            sender = "Shop <news@shop.example.com>"
+            decision = {'type': 'ignore', 'confidence': rng.randint(60, 99), 'reason': 'Newsletter'}
+        elif kind == 'foreign':
+            subject, body = FOREIGN
+            decision = {'type': 'forward to human', 'confidence': rng.randint(60, 99),
+                        'reason': 'Job outside the operated regions'}
+        elif kind == 'marketplace':
+            subject, body = MARKETPLACE
+            sender = "Poptávky <notifikace@poptavky.example.cz>"
+        else:
+            subject, body = rng.choice(INQUIRIES)
+        body = body.format(**values)
+        if kind == 'inquiry' and rng.random() < 0.3:
+            body += QUOTE
+        corpus.append({
+            'id': f"m{index}",
+            'thread_id': f"t{index}",
+            'from': sender,
+            'subject': f"{subject} #{index}",
+            'body': body,
+            'html': rng.random() < 0.4,
+            'age_hours': 48 if kind == 'old' else rng.uniform(0, 20),
+            'thread_size': 2 if kind == 'follow-up' else 1,
+            'decision': decision,
+        })
+    return corpus
+
+
+def load_corpus(path):
+    """
+    Read a JSONL corpus and fill in the optional fields.
+
+    Returns:
+        list: Message records in file order
+    """
+    corpus = []
+    with open(path, encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'body' not in record:
+                raise ValueError(f"{path}:{line_number}: record has no body")
+            message_id = str(record.get('id') or record.get('request_id') or f"m{line_number}")
+            record.setdefault('subject', record.get('title', ''))
+            record.setdefault('from', f"Sender <sender{line_number}@example.com>")
+            record.setdefault('thread_id', f"t-{message_id}")
+            record['id'] = message_id
+            corpus.append(record)
+    return corpus
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def replay(corpus, args, run):
+    """
+    Run the bot once over a fresh copy of the corpus.
+
+    Returns:
+        dict: Measurements of the run
+    """
+    from email_bot import EmailBot
+
+    seed = args.seed + run
+    gmail = FakeGmail(corpus, latency=args.gmail_latency, failure_rate=args.gmail_failure_rate,
+                      seed=seed)
+    client = FakeChatClient(corpus, latency={LLM_FAST_MODEL: args.llm_latency,
+                                             LLM_MODEL: args.reasoner_latency},
+                            failure_rate=args.llm_failure_rate, seed=seed)
+    metrics = Metrics()
+
+    with tempfile.TemporaryDirectory(prefix='replay-') as directory:
+        bot = EmailBot(max_workers=args.workers,
+                       rate_limit=args.rate_limit,
+                       batch_requests=not args.no_batch,
+                       state_path=os.path.join(directory, 'state.json'),
+                       page_size=args.page_size,
+                       max_seconds=None,
+                       decision_cache_path=os.path.join(directory, 'decisions.sqlite'),
+                       near_duplicate_index_path=os.path.join(directory, 'near_duplicates.json'),
+                       preclassifier_path=os.path.join(directory, 'preclassifier.json'),
+                       stream_llm=args.stream,
+                       llm_batch_size=args.llm_batch_size,
+                       ledger_path=os.path.join(directory, 'ledger.sqlite'),
+                       input_token_budget=args.input_token_budget or None,
+                       fast_model=None if args.no_routing else LLM_FAST_MODEL,
+                       gmail=gmail,
+                       llm_client=client,
+                       metrics=metrics)
+        try:
+            tracemalloc.start()
+            started = time.monotonic()
+            bot.process_emails()
+            seconds = time.monotonic() - started
+            peak_traced = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            llm_usage = ({model: dict(usage) for model, usage in bot._llm.usage_by_model.items()}
+                         if bot._llm is not None else {})
+        finally:
+            bot.close()
+
+    latencies = [gmail.last_modified[message_id] - fetched
+                 for message_id, fetched in gmail.first_fetched.items()
+                 if message_id in gmail.last_modified]
+    labels = gmail.label_counts()
+    return {
+        'run': run + 1,
+        'messages': len(corpus),
+        'finished': len(latencies),
+        'seconds': round(seconds, 3),
+        'messages_per_second': round(len(latencies) / seconds, 2) if seconds else None,
+        'latency_p50': _round(percentile(latencies, 0.50)),
+        'latency_p95': _round(percentile(latencies, 0.95)),
+        'latency_max': _round(max(latencies, default=None)),
+        'gmail_calls': dict(sorted(gmail.call_counts.items())),
+        'gmail_quota_units': gmail.quota_units,
+        'gmail_failures': sum(gmail.failures.values()),
+        'llm_requests': dict(client.requests),
+        'llm_failures': sum(client.failures.values()),
+        'llm_usage': llm_usage,
+        'replies_sent': len(gmail.sent),
+        'labels': {name: labels[name] for name in
+                   ('Bot Read', 'Bot Answered', 'Bot Dismissed', 'Needs Human Attention')},
+        'stages': metrics.summary()['stages'],
+        'peak_traced_kib': round(peak_traced / 1024, 1),
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def print_run(result):
+    """Print the measurements of one run."""
+    print(f"Run {result['run']}: {result['finished']}/{result['messages']} message(s) in "
+          f"{result['seconds']:.2f}s, {result['messages_per_second']} msg/s")
+    print(f"  Latency per message: p50 {result['latency_p50']}s, p95 {result['latency_p95']}s, "
+          f"max {result['latency_max']}s")
+    calls = ", ".join(f"{method.removeprefix('gmail.users.')}={count}"
+                      for method, count in result['gmail_calls'].items())
+    print(f"  Gmail: {sum(result['gmail_calls'].values())} call(s), "
+          f"{result['gmail_quota_units']} quota units, {result['gmail_failures']} injected failure(s)")
+    print(f"    {calls}")
+    print(f"  LLM: {result['llm_requests']}, {result['llm_failures']} injected failure(s)")
+    print(f"  Outcome: {result['replies_sent']} reply(ies), labels {result['labels']}")
+    stages = ", ".join(f"{stage} {timing['seconds']}s/{timing['calls']}"
+                       for stage, timing in result['stages'].items())
+    print(f"  Stages (total/calls): {stages}")
+    print(f"  Memory: peak traced {result['peak_traced_kib']} KiB, max RSS {result['max_rss_kib']} KiB")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Replay a mailbox through the bot offline')
+    parser.add_argument('--corpus', help='JSONL file of messages (default: a synthetic mailbox)')
+    parser.add_argument('--messages', type=int, default=100,
+                        help='Size of the synthetic mailbox (default: 100)')
+    parser.add_argument('--write-corpus', metavar='FILE',
+                        help='Write the corpus as JSONL, e.g. to edit and replay it later')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the corpus and the fakes (default: 0)')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of runs (default: 1)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f'Messages processed concurrently (default: {DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Maximum messages started per second, 0 to disable (default: 0)')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f'Messages listed and processed per page (default: {DEFAULT_PAGE_SIZE})')
+    parser.add_argument('--no-batch', action='store_true', help='Do not use Gmail batch requests')
+    parser.add_argument('--llm-batch-size', type=int, default=DEFAULT_LLM_BATCH_SIZE,
+                        help=f'Emails classified per LLM request (default: {DEFAULT_LLM_BATCH_SIZE})')
+    parser.add_argument('--stream', action='store_true', help='Stream LLM responses')
+    parser.add_argument('--no-routing', action='store_true',
+                        help=f'Send every email to {LLM_MODEL} instead of {LLM_FAST_MODEL} first')
+    parser.add_argument('--input-token-budget', type=int, default=LLM_INPUT_TOKEN_BUDGET,
+                        help=f'Email body tokens sent to the LLM, 0 for no limit '
+                             f'(default: {LLM_INPUT_TOKEN_BUDGET})')
+    parser.add_argument('--gmail-latency', type=float, default=0.05,
+                        help='Mean seconds per Gmail round trip (default: 0.05)')
+    parser.add_argument('--gmail-failure-rate', type=float, default=0.0,
+                        help='Share of Gmail calls that fail (default: 0)')
+    parser.add_argument('--llm-latency', type=float, default=0.5,
+                        help=f'Mean seconds per {LLM_FAST_MODEL} request (default: 0.5)')
+    parser.add_argument('--reasoner-latency', type=float, default=2.0,
+                        help=f'Mean seconds per {LLM_MODEL} request (default: 2.0)')
+    parser.add_argument('--llm-failure-rate', type=float, default=0.0,
+                        help='Share of LLM requests that fail (default: 0)')
+    parser.add_argument('--json', metavar='FILE', help="Write the results as JSON ('-' for stdout)")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='ERROR',
+                        help='Logging level of the bot (default: ERROR)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level), format='%(levelname)-8s %(message)s')
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'offline-replay')
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.messages, args.seed)
+    if args.write_corpus:
+        with open(args.write_corpus, 'w', encoding='utf-8') as file:
+            for record in corpus:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    results = []
+    for run in range(args.repeat):
+        result = replay(corpus, args, run)
+        results.append(result)
+        if args.json != '-':
+            print_run(result)
+
+    if args.json:
+        report = {'config': {key: value for key, value in vars(args).items()
+                             if key not in ('json', 'write_corpus', 'log_level')},
+                  'runs': results}
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import time
+
+
+class RunBudget:
+    """Limits how much work a single run may do before it stops taking new messages."""
+
+    def __init__(self, max_seconds=None, max_gmail_units=None, max_llm_tokens=None, usage=None,
+                 stop_event=None):
+        """
+        Initialize the budget.
+
+        Args:
+            max_seconds: Wall-clock seconds the run may take (None for no limit)
+            max_gmail_units: Gmail API quota units the run may spend (None for no limit)
+            max_llm_tokens: LLM tokens, prompt plus completion, the run may spend (None for no limit)
+            usage: Callable returning the current (Gmail quota units, LLM tokens) totals
+            stop_event: threading.Event that ends the run early once set, e.g. on shutdown
+        """
+        self.max_seconds = max_seconds
+        self.max_gmail_units = max_gmail_units
+        self.max_llm_tokens = max_llm_tokens
+        self._usage = usage or (lambda: (0, 0))
+        self._stop_event = stop_event
+        self._started = time.monotonic()
+        self._base_units, self._base_tokens = self._usage()
+
+    def elapsed(self):
+        """Seconds since the run started."""
+        return time.monotonic() - self._started
+
+    def deadline(self):
+        """
+        When the time limit runs out.
+
+        Returns:
+            float: time.monotonic() value at which the run has to stop, or
+            None if it has no time limit
+        """
+        if self.max_seconds is None:
+            return None
+        return self._started + self.max_seconds
+
+    def spent(self):
+        """
+        Resources used since the run started.
+
+        Returns:
+            tuple: (Gmail quota units, LLM tokens)
+        """
+        units, tokens = self._usage()
+        return units - self._base_units, tokens - self._base_tokens
+
+    def exhausted(self):
+        """
+        Check whether any limit has been reached.
+
+        Returns:
+            str: Description of the exhausted limit, or None if work may continue
+        """
+        if self._stop_event is not None and self._stop_event.is_set():
+            return "shutdown request"
+        if self.max_seconds is not None and self.elapsed() >= self.max_seconds:
+            return f"time limit of {self.max_seconds}s"
+
+        units, tokens = self.spent()
+        if self.max_gmail_units is not None and units >= self.max_gmail_units:
+            return f"Gmail quota limit of {self.max_gmail_units} units"
+        if self.max_llm_tokens is not None and tokens >= self.max_llm_tokens:
+            return f"LLM token limit of {self.max_llm_tokens} tokens"
+
+        return None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Check that the LLM prompt prefix is byte-stable.
+
+DeepSeek only serves a prompt prefix from its context cache when it is
+byte-identical to earlier requests. This check fails when the prefix built
+from config.py differs between two fresh interpreters (e.g. a timestamp or
+set ordering crept into SYSTEM_PROMPT) or no longer matches the recorded
+fingerprint. After an intentional prompt change, record the new fingerprint
+with --update and commit it.
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import subprocess
+
+FINGERPRINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'prompt_prefix.sha256')
+
+# Prints the prefix digest; run in fresh interpreters so import-time values show up
+_DIGEST_SCRIPT = (
+    "import hashlib; from config import SYSTEM_PROMPT; from llm import prompt_prefix; "
+    "print(hashlib.sha256(prompt_prefix(SYSTEM_PROMPT)).hexdigest())"
+)
+
+
+def prefix_digest(env_overrides):
+    """Compute the prefix digest in a separate interpreter with the given environment."""
+    env = dict(os.environ, **env_overrides)
+    result = subprocess.run([sys.executable, '-c', _DIGEST_SCRIPT],
+                            cwd=os.path.dirname(FINGERPRINT_FILE), env=env,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def main():
+    """Compare the current prompt prefix against the recorded fingerprint."""
+    parser = argparse.ArgumentParser(description='Check LLM prompt prefix stability')
+    parser.add_argument('--update', action='store_true',
+                        help='Record the current prefix as the expected one')
+    args = parser.parse_args()
+
+    digests = {prefix_digest({'PYTHONHASHSEED': '1', 'TZ': 'UTC'}),
+               prefix_digest({'PYTHONHASHSEED': '2', 'TZ': 'Asia/Tokyo'})}
+    if len(digests) != 1:
+        print("Prompt prefix differs between runs; remove per-run values from SYSTEM_PROMPT")
+        return 1
+    digest = digests.pop()
+
+    if args.update:
+        with open(FINGERPRINT_FILE, 'w', encoding='utf-8') as f:
+            f.write(f"{digest}\n")
+        print(f"Recorded prompt prefix fingerprint {digest}")
+        return 0
+
+    try:
+        with open(FINGERPRINT_FILE, 'r', encoding='utf-8') as f:
+            expected = f.read().strip()
+    except FileNotFoundError:
+        print(f"No fingerprint at {FINGERPRINT_FILE}; run with --update")
+        return 1
+
+    if digest != expected:
+        print("Prompt prefix changed, which invalidates the LLM context cache. "
+              "If the change is intended, run `python check_prompt_prefix.py --update`.")
+        return 1
+
+    print("Prompt prefix is stable")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import re
+import logging
+
+from config import MARKETPLACE_SENDERS
+from preclassifier import OPERATED_PLACES, FOREIGN_PLACES
+
+# Approximates BPE tokenizers: short ASCII words are one token, longer ones
+# split every few letters, accented and Cyrillic text takes about a token per
+# two letters, and each punctuation mark is a token of its own
+_TOKEN = re.compile(r'[A-Za-z]{1,4}|[^\W\dA-Za-z_]{1,2}|\d{1,3}|[^\w\s]')
+
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_URL_ONLY = re.compile(r'^\W*(?:https?://|www\.)\S*\W*$', re.IGNORECASE)
+
+# Labelled fields of an inquiry: where, what and how to reach the client
+_KEY_FIELD = re.compile(
+    r'^\W*(?:lokalita|místo|misto|adresa|obec|okres|kraj|location|address|region|city|ort|'
+    r'služba|sluzba|kategorie|obor|práce|prace|service|category|job|leistung|auftrag|'
+    r'kontakt|e-?mail|telefon|phone|tel)\b[^:\n]{0,30}:',
+    re.IGNORECASE)
+_PLACES = re.compile(
+    r'\b(?:' + '|'.join(re.escape(place) for place in OPERATED_PLACES + FOREIGN_PLACES) + r')\b',
+    re.IGNORECASE)
+
+# Footers found in any mail: legal disclaimers, unsubscribe and privacy
+# lines. Only whole disclaimer phrases count, so a client asking for
+# confidentiality in their own words is not mistaken for a footer.
+_FOOTER = re.compile(
+    r'(?:this (?:e-?mail|message)(?: and any attachments)? (?:is|are|may be|contains?) (?:strictly )?'
+    r'(?:confidential|privileged)|intended (?:only|solely) for the (?:use of the )?(?:named )?'
+    r'(?:recipient|addressee|individual)|if you (?:are not the intended recipient|have received this '
+    r'(?:e-?mail|message) in error)|(?:click here to|to|you can) unsubscribe|unsubscribe (?:here|from)|'
+    r'privacy policy|all rights reserved|do not reply to this (?:e-?mail|message)|'
+    r'this (?:e-?mail|message) was (?:sent|generated) automatically|'
+    r'(?:tento e-?mail|tato zpráva|obsah této zprávy)(?: včetně příloh)? (?:je|může být|může obsahovat) '
+    r'důvěrn|nejste-li (?:zamýšleným )?adresátem|odhlásit (?:se )?(?:z )?(?:odběr|odebírání)|'
+    r'odhlasit (?:se )?(?:z )?odber|ochrana osobních údajů|všechna práva vyhrazena|'
+    r'tento e-?mail byl (?:odeslán|vygenerován) automaticky|'
+    r'diese (?:e-?mail|nachricht)(?: und (?:alle|etwaige) anhänge)? (?:ist|enthält|kann) '
+    r'vertraulich|wenn sie nicht der (?:richtige|beabsichtigte) adressat sind|'
+    r'(?:vom newsletter|hier) abmelden|newsletter abbestellen|datenschutzerklärung|'
+    r'datenschutzhinweis|alle rechte vorbehalten|^\W*©|©\s*\d{4})',
+    re.IGNORECASE)
+
+# Notification template lines of the job marketplace: calls to action,
+# account and notification settings, promotions
+_MARKETPLACE_TEMPLATE = re.compile(
+    r'(?:zobrazit (?:celou )?poptávku|reagovat na poptávku|odpovědět na poptávku|'
+    r'přihlaste se|přihlásit se|nastavení (?:upozornění|notifikací|účtu)|'
+    r'tento e-?mail (?:byl|je) (?:odeslán|zaslán)|dostáváte tento e-?mail|'
+    r'stáhněte si (?:naši )?aplikaci|kredit|tarif|premium|'
+    r'view (?:the )?(?:job|request)|reply to (?:the )?(?:job|request)|log in|sign in|'
+    r'notification settings|download (?:our|the) app|you are receiving this|'
+    r'zum auftrag|auftrag ansehen|benachrichtigungen|einstellungen|ihr .{0,30}-team)',
+    re.IGNORECASE)
+
+GAP = "[...]"
+# Smallest remainder of a line worth keeping when the budget runs out mid-line
+MIN_PARTIAL_TOKENS = 20
+
+
+def count_tokens(text):
+    """Approximate the number of LLM tokens in text without a tokenizer."""
+    return sum(1 for _ in _TOKEN.finditer(text))
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut text after its first max_tokens approximate tokens."""
+    for index, match in enumerate(_TOKEN.finditer(text)):
+        if index == max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def is_marketplace(sender_email):
+    """Whether mail from this address is a job marketplace notification."""
+    return (sender_email or '').lower() in MARKETPLACE_SENDERS
+
+
+def _is_key_line(line):
+    """Whether a line carries the location, the service or a contact address."""
+    return bool(_EMAIL.search(line) or _KEY_FIELD.search(line) or _PLACES.search(line))
+
+
+def key_lines(text):
+    """The stripped lines of an email that carry the location, the service or a contact address."""
+    return [line for line in (raw.strip() for raw in text.split('\n')) if line and _is_key_line(line)]
+
+
+def compact_email(text, sender_email=None, max_tokens=None):
+    """
+    Shrink an email body before it is sent to the LLM.
+
+    Notification template lines of the marketplace sender are dropped, as
+    are bare links and repeated lines. Only if the rest is over max_tokens
+    are footers (disclaimers, unsubscribe lines) dropped too; if it is still
+    over, lines with the location, service or a contact address are kept
+    first and the budget left over is filled with the other lines from the
+    top; omitted stretches are marked "[...]".
+
+    Args:
+        text: Extracted email body
+        sender_email: Address the email came from
+        max_tokens: Input token budget for the body (None for no limit)
+
+    Returns:
+        tuple: (compacted text, tokens before, tokens after)
+    """
+    before = count_tokens(text)
+    template = _MARKETPLACE_TEMPLATE if is_marketplace(sender_email) else None
+
+    lines = []
+    seen = set()
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if stripped:
+            if stripped in seen or _URL_ONLY.match(stripped):
+                continue
+            key = _is_key_line(stripped)
+            if not key and template and template.search(stripped):
+                continue
+            footer = not key and bool(_FOOTER.search(stripped))
+            seen.add(stripped)
+        else:
+            key = footer = False
+        lines.append((line, key, footer, count_tokens(line)))
+
+    after = sum(tokens for _, _, _, tokens in lines)
+    if max_tokens is not None and after > max_tokens:
+        lines = [entry for entry in lines if not entry[2]]
+        after = sum(tokens for _, _, _, tokens in lines)
+    lines = [(line, key, tokens) for line, key, _, tokens in lines]
+    if max_tokens is None or after <= max_tokens:
+        compacted = '\n'.join(line for line, _, _ in lines).strip()
+        return compacted, before, count_tokens(compacted) if compacted != text else before
+
+    # Over budget: key lines first, then the other lines in order from the top;
+    # the first line that does not fit is cut to the tokens left
+    kept = [line if key else None for line, key, _ in lines]
+    spent = sum(tokens for _, key, tokens in lines if key)
+    for index, (line, key, tokens) in enumerate(lines):
+        if not key:
+            if spent + tokens > max_tokens:
+                if max_tokens - spent >= MIN_PARTIAL_TOKENS:
+                    kept[index] = truncate_tokens(line, max_tokens - spent)
+                break
+            kept[index] = line
+            spent += tokens
+
+    parts = []
+    for line in kept:
+        if line is not None:
+            parts.append(line)
+        elif not parts or parts[-1] != GAP:
+            parts.append(GAP)
+    compacted = '\n'.join(parts).strip()
+    if spent > max_tokens:
+        # The key lines alone are over the budget
+        compacted = truncate_tokens(compacted, max_tokens)
+    after = count_tokens(compacted)
+    logging.debug("Email body over the input budget, kept %s of %s tokens", after, before)
+    return compacted, before, after
@@ -1,6 +1,65 @@
 #!/usr/bin/env python3
 
-# System prompt for the AI assistant
+import os
+
+# Local state kept between runs
+STATE_DIR = os.environ.get("BOT_STATE_DIR", ".bot_state")
+STATE_FILE = os.path.join(STATE_DIR, "state.json")
+DECISION_CACHE_FILE = os.path.join(STATE_DIR, "decisions.sqlite3")
+NEAR_DUPLICATE_INDEX_FILE = os.path.join(STATE_DIR, "near_duplicates.bin")
+PRECLASSIFIER_FILE = os.path.join(STATE_DIR, "preclassifier.json")
+LEDGER_FILE = os.path.join(STATE_DIR, "ledger.sqlite3")
+LEDGER_TTL = 30 * 24 * 3600  # Seconds a message's processing history is kept
+
+# LLM decision cache
+DECISION_CACHE_TTL = 14 * 24 * 3600  # Seconds a cached decision stays valid
+DECISION_CACHE_MAX_ENTRIES = 20000
+
+# DeepSeek API client
+LLM_MODEL = "deepseek-reasoner"
+LLM_FAST_MODEL = "deepseek-chat"  # Decides first; LLM_MODEL only sees escalated emails
+LLM_ESCALATION_CONFIDENCE = 80  # Fast-model confidence (0-100) below which LLM_MODEL decides
+LLM_TIMEOUT = 60.0  # Seconds per LLM_FAST_MODEL request; a run must end well within the CI job timeout
+LLM_REASONER_TIMEOUT = 180.0  # Seconds per LLM_MODEL request; the reasoner can think for a while
+LLM_MAX_RETRIES = 4  # Retries for 429, 5xx, timeouts and connection errors, until the run's deadline
+LLM_RETRY_BASE_DELAY = 1.0  # Seconds; doubles with every retry, with full jitter
+LLM_RETRY_MAX_DELAY = 30.0
+LLM_BREAKER_THRESHOLD = 3  # Consecutive failed calls that open the circuit breaker
+LLM_BREAKER_RESET = 60.0  # Seconds before a trial call is let through again
+LLM_PRICE_CACHE_HIT = 0.028  # USD per million prompt tokens served from the context cache
+LLM_PRICE_CACHE_MISS = 0.28  # USD per million prompt tokens not in the cache
+LLM_PRICE_OUTPUT = 0.42  # USD per million completion tokens, reasoning included
+
+# Near-duplicate reuse of "ignore" decisions
+NEAR_DUPLICATE_MAX_DISTANCE = 3  # Differing SimHash bits out of 64 (similarity >= 0.95)
+NEAR_DUPLICATE_MAX_ENTRIES = 500000
+
+# Local pre-classifier for obvious "ignore" emails
+PRECLASSIFIER_MIN_CONFIDENCE = 0.995  # P(ignore) needed to skip the LLM
+PRECLASSIFIER_MIN_SAMPLES = 200  # LLM decisions per class before the model is trusted
+
+# Processing settings
+DEFAULT_MAX_WORKERS = 4  # Messages processed concurrently per run
+DEFAULT_RATE_LIMIT = 5.0  # Messages started per second across all workers
+DEFAULT_PAGE_SIZE = 25  # Messages per list page; a page and its threads fit in one batch
+DEFAULT_MAX_SECONDS = 240  # Stop taking new messages well before the next cron run
+DEFAULT_LLM_BATCH_SIZE = 1  # Emails per LLM request; larger batches drain backlogs on fewer tokens
+MAX_EMAIL_CHARS = 8000  # Longest email body passed on, after quotes and signatures are removed
+LLM_INPUT_TOKEN_BUDGET = 1500  # Approximate tokens of email body sent to the LLM per message
+# Addresses of the job marketplace whose notification templates are stripped (comma-separated)
+MARKETPLACE_SENDERS = frozenset(
+    address.strip().lower() for address in os.environ.get("MARKETPLACE_SENDERS", "").split(",")
+    if address.strip())
+
+# Daemon mode
+DAEMON_LISTEN_HOST = "127.0.0.1"
+DAEMON_LISTEN_PORT = 8080  # Port of the Pub/Sub push endpoint
+DAEMON_POLL_INTERVAL = 60.0  # Seconds between checks when no notification arrives
+DAEMON_WATCH_RENEW = 24 * 3600  # Seconds between users().watch renewals; a watch lasts 7 days
+
+# System prompt for the AI assistant. It is the cached prefix of every LLM
+# request, so keep it static: no dates, counters or other per-run values.
+# After an intentional edit run `python check_prompt_prefix.py --update`.
 
 SYSTEM_PROMPT = """
 You are Krysten Trade's AI assistant.
@@ -26,13 +85,18 @@ CORE RULES:
 
 OUTPUT FORMAT:
 
-You will have to follow this format strictly:
+You will have to follow this format strictly: answer with a single JSON object
+and nothing else, with these keys in this order:
 
-<Type>: [one of three possible responses (answer, forward to human, ignore)]
-<Response>: [response to the email if output type is answer, otherwise empty]
-<Response email>: [sometimes, there is a specified email for contact in the email itself,
-so you decide who to answer] 
-<Reason>: [short explanation for the response]
+"type": one of three possible responses: "answer", "forward to human", "ignore"
+"confidence": integer 0-100, how sure you are that the type is right
+"response": response to the email if type is answer, otherwise ""
+"response_email": sometimes, there is a specified email for contact in the email itself,
+so you decide who to answer, otherwise ""
+"reason": short explanation for the response
+
+Example JSON output:
+{"type": "ignore", "confidence": 95, "response": "", "response_email": "", "reason": "The job is in Poland, where we do not operate."}
 
 Here's the list of countries we operate in:
 Czech Republic, Ukraine, Germany, Slovakia, Austria
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import base64
+import signal
+import logging
+import argparse
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import (DAEMON_LISTEN_HOST, DAEMON_LISTEN_PORT, DAEMON_POLL_INTERVAL,
+                    DAEMON_WATCH_RENEW)
+
+
+class NotificationServer:
+    """
+    Local endpoint for Gmail push notifications delivered by a Pub/Sub push subscription.
+
+    Gmail publishes {"emailAddress": ..., "historyId": ...} to the watched
+    topic and Pub/Sub POSTs it here, base64-encoded in message.data. The
+    notification only wakes the daemon; the new messages themselves are read
+    through the mailbox history.
+    """
+
+    def __init__(self, host, port, on_notification, token=None):
+        """
+        Initialize the server.
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on (0 picks a free one)
+            on_notification: Callable taking the notified history ID (or None)
+            token: Shared secret expected in the ?token= query parameter of the
+                push endpoint URL (None accepts every request)
+        """
+        self.on_notification = on_notification
+        self.token = token
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        """The (host, port) the server listens on."""
+        return self._server.server_address[:2]
+
+    def _handler(self):
+        """Build the request handler class bound to this server."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if server.token and f"token={server.token}" not in self.path.partition('?')[2].split('&'):
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+
+                length = int(self.headers.get('Content-Length') or 0)
+                history_id = parse_push_message(self.rfile.read(length))
+                server.on_notification(history_id)
+                # Any 2xx acknowledges the message, so Pub/Sub does not redeliver it
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logging.debug("Notification endpoint: " + format, *args)
+
+        return Handler
+
+    def start(self):
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="notification-server", daemon=True)
+        self._thread.start()
+        host, port = self.address
+        logging.info(f"Listening for Gmail push notifications on http://{host}:{port}/")
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+
+def parse_push_message(body):
+    """
+    Extract the history ID from a Pub/Sub push request body.
+
+    Returns:
+        int: The notified history ID, or None if the body is not a Gmail notification
+    """
+    try:
+        envelope = json.loads(body)
+        data = json.loads(base64.b64decode(envelope['message']['data']))
+        return int(data['historyId'])
+    except Exception as e:
+        logging.warning(f"Ignoring malformed push notification: {str(e)}")
+        return None
+
+
+class EmailDaemon:
+    """
+    Keeps one EmailBot warm and runs it whenever new mail is announced.
+
+    Runs are triggered by Gmail push notifications when a watch topic and
+    the notification endpoint are configured, and in any case at least every
+    poll_interval seconds, so mail is still picked up if notifications stop.
+    """
+
+    def __init__(self, bot, watch_topic=None, listen_host=DAEMON_LISTEN_HOST,
+                 listen_port=DAEMON_LISTEN_PORT, poll_interval=DAEMON_POLL_INTERVAL,
+                 webhook_token=None):
+        """
+        Initialize the daemon.
+
+        Args:
+            bot: EmailBot in incremental sync mode
+            watch_topic: Pub/Sub topic for users().watch, e.g.
+                projects/<project>/topics/<topic> (None to rely on polling
+                and notifications sent by other means)
+            listen_host: Address of the notification endpoint
+            listen_port: Port of the notification endpoint (None disables it)
+            poll_interval: Longest wait between runs, in seconds
+            webhook_token: Shared secret required on the notification endpoint
+        """
+        self.bot = bot
+        self.watch_topic = watch_topic
+        self.poll_interval = poll_interval
+        self.runs = 0
+        self.notifications = 0
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._watch_renewed_at = None
+        self.server = None
+        if listen_port is not None:
+            self.server = NotificationServer(listen_host, listen_port,
+                                             self.notify, token=webhook_token)
+
+    def notify(self, history_id=None):
+        """Wake the daemon for a run; notifications arriving during a run are coalesced."""
+        self.notifications += 1
+        logging.debug("Mailbox change notification (history ID %s)", history_id)
+        self._wake.set()
+
+    def stop(self):
+        """Ask the daemon to finish the current run and exit."""
+        if not self._stopping.is_set():
+            logging.info("Shutdown requested, finishing the current run")
+        self._stopping.set()
+        self.bot.request_stop()
+        self._wake.set()
+
+    def _handle_signal(self, signum, frame):
+        """Stop gracefully on the first signal; a second one exits immediately."""
+        signal.signal(signum, signal.SIG_DFL)
+        self.stop()
+
+    def run(self):
+        """Process mail until stopped by SIGINT/SIGTERM or stop()."""
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, self._handle_signal)
+
+        if self.server:
+            self.server.start()
+
+        try:
+            while not self._stopping.is_set():
+                self._renew_watch()
+                self._wake.clear()
+                started = time.monotonic()
+                self.bot.process_emails()
+                self.runs += 1
+                logging.debug(
+                    "Run %s took %.1fs", self.runs, time.monotonic() - started)
+
+                if not self._wake.wait(self.poll_interval) and not self._stopping.is_set():
+                    logging.debug("No notification received, polling the mailbox")
+        finally:
+            self._stop_watch()
+            if self.server:
+                self.server.stop()
+            logging.info(
+                f"Daemon stopped after {self.runs} run(s) and {self.notifications} notification(s)")
+
+    def _renew_watch(self):
+        """Start or renew the Gmail watch when it is due."""
+        if not self.watch_topic:
+            return
+        if self._watch_renewed_at is not None and time.monotonic() - self._watch_renewed_at < DAEMON_WATCH_RENEW:
+            return
+
+        try:
+            response = self.bot.gmail_service.users().watch(userId='me', body={
+                'topicName': self.watch_topic,
+                'labelIds': ['INBOX'],
+                'labelFilterBehavior': 'INCLUDE',
+            }).execute()
+            self._watch_renewed_at = time.monotonic()
+            logging.info(
+                f"Watching the inbox through {self.watch_topic} (history ID {response.get('historyId')})")
+        except Exception as e:
+            # Polling keeps working; try again before the next run
+            logging.error(f"Could not start Gmail watch, falling back to polling: {str(e)}",
+                          exc_info=logging.getLogger().level == logging.DEBUG)
+
+    def _stop_watch(self):
+        """Stop the Gmail watch so notifications no longer pile up in the topic."""
+        if self._watch_renewed_at is None:
+            return
+        try:
+            self.bot.gmail_service.users().stop(userId='me').execute()
+            logging.info("Stopped Gmail watch")
+        except Exception as e:
+            logging.warning(f"Could not stop Gmail watch: {str(e)}")
+
+
+def send_local_notification(url, history_id=0, email_address='me'):
+    """
+    Stand in for Pub/Sub: POST a Gmail notification to a running daemon.
+
+    Args:
+        url: URL of the daemon's notification endpoint
+        history_id: History ID to announce
+        email_address: Mailbox to announce
+    """
+    data = base64.b64encode(json.dumps(
+        {'emailAddress': email_address, 'historyId': history_id}).encode('utf-8')).decode('ascii')
+    body = json.dumps({'message': {'data': data, 'messageId': str(time.time_ns())},
+                       'subscription': 'local'}).encode('utf-8')
+    request = urllib.request.Request(url, data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Send a local stand-in Gmail push notification to a running daemon')
+    parser.add_argument('--url', default=f'http://{DAEMON_LISTEN_HOST}:{DAEMON_LISTEN_PORT}/',
+                        help='Notification endpoint of the daemon')
+    parser.add_argument('--history-id', type=int, default=0,
+                        help='History ID to announce')
+    args = parser.parse_args()
+    print(send_local_notification(args.url, args.history_id))
+    sys.exit(0)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import re
+import json
+from dataclasses import dataclass, asdict, fields
+
+# Decision types the bot acts on
+DECISION_TYPES = ('answer', 'forward to human', 'ignore')
+
+# Keys of the JSON object the LLM answers with, and their types
+RESPONSE_SCHEMA = {
+    'type': str,
+    'confidence': int,
+    'response': str,
+    'response_email': str,
+    'reason': str,
+}
+
+# Tags of the legacy format, "<Type>: ...", and the values they hold
+_TAG_KEYS = {'Type': 'type', 'Confidence': 'confidence', 'Response email': 'response_email',
+             'Response': 'response', 'Reason': 'reason'}
+_LONGEST_TAG = max(len(tag) for tag in _TAG_KEYS)
+_LEADING_INT = re.compile(r'\d+')
+_DECODER = json.JSONDecoder()
+
+
+@dataclass(slots=True)
+class Decision:
+    """What to do with an email, as decided by the LLM or a local shortcut."""
+
+    type: str
+    response: str = ''
+    response_email: str = ''
+    reason: str = ''
+    # 0-100, None when the model gave no confidence
+    confidence: int | None = None
+    # Model that made the decision, and why it was escalated to it ('' if not)
+    model: str = ''
+    escalation: str = ''
+
+    def to_dict(self):
+        """Plain dict for JSON storage."""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a decision stored with to_dict; unknown keys are ignored."""
+        return cls(**{field.name: data[field.name] for field in fields(cls) if field.name in data})
+
+
+class DecisionFormatError(ValueError):
+    """The LLM output holds no usable decision."""
+
+    def __init__(self, message, reason=''):
+        super().__init__(message)
+        # The reason the model gave, if any, for the fallback decision
+        self.reason = reason
+
+
+def parse_decision(text):
+    """
+    Parse an LLM answer in the JSON format, or the legacy tag format.
+
+    JSON is decoded in one pass by the json module; tagged text is split with
+    a single scan over its tags. The result is checked against RESPONSE_SCHEMA.
+
+    Args:
+        text: Raw LLM output
+
+    Returns:
+        Decision: The validated decision
+
+    Raises:
+        DecisionFormatError: If there is no decision or its type is not one of DECISION_TYPES
+    """
+    values = _scan_json(text)
+    if values is None or 'type' not in values:
+        # Braces in a tagged answer can decode as some other JSON object
+        values = _scan_tags(text) or values
+    if values is None:
+        raise DecisionFormatError("Failed to parse LLM response")
+    return validate(values)
+
+
+def validate(values):
+    """
+    Build a Decision from decoded response values.
+
+    Strings are stripped, missing ones become '', and the confidence is
+    clamped to 0-100 (None if missing or not a number).
+
+    Raises:
+        DecisionFormatError: If the type is missing or not one of DECISION_TYPES
+    """
+    if not isinstance(values, dict):
+        raise DecisionFormatError("Failed to parse LLM response")
+
+    text_values = {}
+    for key, expected in RESPONSE_SCHEMA.items():
+        if expected is str:
+            value = values.get(key)
+            text_values[key] = value.strip() if isinstance(value, str) else ''
+
+    decision_type = text_values['type'].lower()
+    if decision_type not in DECISION_TYPES:
+        raw_type = text_values['type'] or values.get('type')
+        raise DecisionFormatError(
+            f"Invalid response type: {raw_type}" if raw_type else "Failed to parse LLM response",
+            reason=text_values['reason'])
+
+    return Decision(type=decision_type,
+                    response=text_values['response'],
+                    response_email=text_values['response_email'],
+                    reason=text_values['reason'],
+                    confidence=_confidence(values.get('confidence')))
+
+
+def _confidence(value):
+    """Clamp a confidence value to 0-100, or None if it is not a number."""
+    if isinstance(value, str):
+        match = _LEADING_INT.match(value.strip())
+        value = int(match.group()) if match else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return max(0, min(100, int(value)))
+
+
+def _scan_json(text):
+    """
+    Decode the JSON object in an answer, tolerating code fences and surrounding text.
+
+    Decoding stops at the end of the first complete object, so text after it
+    may contain braces of its own.
+    """
+    start = text.find('{')
+    if start < 0:
+        return None
+    try:
+        values, _ = _DECODER.raw_decode(text, start)
+    except (ValueError, RecursionError):
+        # RecursionError: absurdly deep nesting
+        return None
+    return values if isinstance(values, dict) else None
+
+
+def _scan_tags(text):
+    """Split a legacy tagged answer into its values in one pass; the first of each tag wins."""
+    # Tag ends are found with str.find, which skips over stray '<' and other
+    # text much faster than a regex trying every position
+    markers = []
+    seen = set()
+    end = text.find('>:')
+    while end >= 0:
+        start = text.rfind('<', max(0, end - _LONGEST_TAG - 1), end)
+        key = _TAG_KEYS.get(text[start + 1:end]) if start >= 0 else None
+        if key:
+            markers.append((key, start, end + 2))
+            if key in seen and len(seen) == len(_TAG_KEYS):
+                # Every tag is known; this repeat only ends the last value
+                break
+            seen.add(key)
+        end = text.find('>:', end + 2)
+    if not markers:
+        return None
+
+    values = {}
+    for index, (key, _, value_start) in enumerate(markers):
+        value_end = markers[index + 1][1] if index + 1 < len(markers) else len(text)
+        values.setdefault(key, text[value_start:value_end])
+
+    # The type is a single line
+    if 'type' in values:
+        values['type'] = values['type'].lstrip().partition('\n')[0]
+    return values
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+
+from decision import Decision
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_content(content):
+    """Normalize email text so formatting-only differences map to the same key."""
+    content = unicodedata.normalize('NFKC', content)
+    return _WHITESPACE.sub(' ', content).strip().casefold()
+
+
+class DecisionCache:
+    """Disk-backed cache of parsed LLM decisions keyed by normalized email content."""
+
+    # How many writes happen between eviction passes
+    EVICT_EVERY = 100
+
+    def __init__(self, path, namespace, ttl_seconds, max_entries):
+        """
+        Initialize the decision cache.
+
+        Args:
+            path: SQLite database file
+            namespace: Text identifying the prompt and model; decisions made
+                with a different prompt or model are never returned
+            ttl_seconds: Age after which a cached decision is ignored and evicted
+            max_entries: Maximum number of decisions kept; least recently used go first
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._namespace = hashlib.sha256(namespace.encode('utf-8')).digest()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS decisions ('
+            ' key BLOB PRIMARY KEY,'
+            ' decision TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' last_used REAL NOT NULL)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS decisions_last_used ON decisions (last_used)')
+        logging.debug("Opened decision cache at %s", path)
+
+    def _key(self, content):
+        """Hash the prompt/model namespace together with the normalized content."""
+        digest = hashlib.sha256(self._namespace)
+        digest.update(normalize_content(content).encode('utf-8'))
+        return digest.digest()
+
+    def get(self, content):
+        """
+        Look up the decision for an email.
+
+        Args:
+            content: Email text as sent to the LLM
+
+        Returns:
+            Decision: The cached decision, or None on a miss
+        """
+        key = self._key(content)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT decision, created FROM decisions WHERE key = ?', (key,)).fetchone()
+
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                'UPDATE decisions SET last_used = ? WHERE key = ?', (now, key))
+            self.hits += 1
+
+        return Decision.from_dict(json.loads(row[0]))
+
+    def put(self, content, decision):
+        """
+        Store the decision for an email.
+
+        Args:
+            content: Email text as sent to the LLM
+            decision: Decision to store
+        """
+        key = self._key(content)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO decisions (key, decision, created, last_used) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(decision.to_dict()), now, now))
+
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        """Drop expired decisions and trim the cache to its size limit (lock held)."""
+        expired = self._conn.execute(
+            'DELETE FROM decisions WHERE created < ?', (now - self.ttl_seconds,)).rowcount
+        trimmed = self._conn.execute(
+            'DELETE FROM decisions WHERE key IN ('
+            ' SELECT key FROM decisions ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)).rowcount
+
+        if expired or trimmed:
+            logging.debug(
+                "Evicted %s expired and %s least recently used decision(s)",
+                expired, trimmed)
+
+    def reset_stats(self):
+        """Reset the hit and miss counters, e.g. at the start of a run."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """Evict stale entries and close the database."""
+        with self._lock:
+            self._evict(time.time())
+            self._conn.close()
@@ -2,49 +2,236 @@
 
 import os
 import base64
-import time
 import datetime
 import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import parsedate_to_datetime
 
-from gmail_service import GmailService
+from googleapiclient.errors import HttpError
+
+from gmail_service import GmailService, execute_batch
 from label_manager import GmailLabelManager
-from llm import DeepSeekLLM
-from config import SYSTEM_PROMPT, EMAIL_TEMPLATE
+from rate_limiter import RateLimiter
+from budget import RunBudget
+from resilience import LLMUnavailableError
+from startup import StartupTimer
+from state_store import StateStore
+from decision_cache import DecisionCache
+from near_duplicates import NearDuplicateIndex
+from preclassifier import PreClassifier
+from ledger import MessageLedger
+from mime_extract import extract_text
+from compaction import compact_email
+from decision import Decision
+from metrics import Metrics
+from config import (SYSTEM_PROMPT, EMAIL_TEMPLATE, DEFAULT_MAX_WORKERS, DEFAULT_RATE_LIMIT,
+                    DEFAULT_PAGE_SIZE, DEFAULT_MAX_SECONDS, STATE_FILE, DECISION_CACHE_FILE,
+                    DECISION_CACHE_TTL, DECISION_CACHE_MAX_ENTRIES, NEAR_DUPLICATE_INDEX_FILE,
+                    NEAR_DUPLICATE_MAX_ENTRIES, NEAR_DUPLICATE_MAX_DISTANCE, PRECLASSIFIER_FILE,
+                    PRECLASSIFIER_MIN_CONFIDENCE, PRECLASSIFIER_MIN_SAMPLES, LLM_TIMEOUT,
+                    DEFAULT_LLM_BATCH_SIZE, LLM_MODEL, LEDGER_FILE, LEDGER_TTL,
+                    LLM_INPUT_TOKEN_BUDGET, LLM_FAST_MODEL, LLM_REASONER_TIMEOUT)
+
+
+# Triage only needs labels, the date and a few headers
+METADATA_HEADERS = ['From', 'Subject', 'Date', 'Message-ID']
+METADATA_FIELDS = 'id,threadId,labelIds,internalDate,payload/headers'
+
+# Only the MIME structure, part headers (for the charset) and inline part
+# data needed to extract the text; attachment bodies are never inlined by the API
+BODY_FIELDS = ('payload(mimeType,headers,filename,body/data,'
+               'parts(mimeType,headers,filename,body/data,'
+               'parts(mimeType,headers,filename,body/data,'
+               'parts(mimeType,headers,filename,body/data,parts))))')
+
+# Frames email bodies and LLM responses in debug logs
+LOG_RULE = '=' * 50
+
+
+class PreparedMessage:
+    """A message that passed triage, with its open label transaction and decision."""
+
+    __slots__ = ('message', 'labels', 'headers', 'sender_email', 'subject',
+                 'payload', 'email_content', 'decision', 'resumed')
+
+    def __init__(self, message, labels, headers, sender_email, subject, resumed=None):
+        self.message = message
+        self.labels = labels
+        self.headers = headers
+        self.sender_email = sender_email
+        self.subject = subject
+        # Filled in once the body has been fetched
+        self.payload = None
+        self.email_content = None
+        self.decision = None
+        # Stages an earlier run recorded in the ledger for this message
+        self.resumed = resumed or {}
 
 
 class EmailBot:
     """Main email bot that processes and responds to emails."""
 
-    def __init__(self):
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, rate_limit=DEFAULT_RATE_LIMIT,
+                 batch_requests=True, sync_mode='full', state_path=STATE_FILE,
+                 page_size=DEFAULT_PAGE_SIZE, max_seconds=DEFAULT_MAX_SECONDS,
+                 max_gmail_units=None, max_llm_tokens=None,
+                 decision_cache_path=DECISION_CACHE_FILE,
+                 near_duplicate_index_path=NEAR_DUPLICATE_INDEX_FILE,
+                 preclassifier_path=PRECLASSIFIER_FILE, llm_timeout=LLM_TIMEOUT,
+                 llm_reasoner_timeout=LLM_REASONER_TIMEOUT, stream_llm=False,
+                 llm_batch_size=DEFAULT_LLM_BATCH_SIZE, startup_timer=None,
+                 ledger_path=LEDGER_FILE, input_token_budget=LLM_INPUT_TOKEN_BUDGET,
+                 fast_model=LLM_FAST_MODEL, gmail=None, llm_client=None,
+                 metrics=None):
         """
         Initialize the email bot components.
+
+        Args:
+            max_workers: Number of messages processed concurrently (1 processes them sequentially)
+            rate_limit: Maximum number of messages started per second
+            batch_requests: Fetch messages and apply label changes through the Gmail batch endpoint
+            sync_mode: 'full' searches the inbox every run, 'incremental' reads the
+                mailbox history since the previous run
+            state_path: File that keeps the sync position between runs
+            page_size: Number of messages listed and processed per page
+            max_seconds: Stop taking new messages after this many seconds (None for no limit)
+            max_gmail_units: Stop after spending this many Gmail quota units (None for no limit)
+            max_llm_tokens: Stop after spending this many LLM tokens (None for no limit)
+            decision_cache_path: SQLite file caching LLM decisions (None disables the cache)
+            near_duplicate_index_path: File of the near-duplicate index used to reuse
+                "ignore" decisions (None disables it)
+            preclassifier_path: File of the local pre-classifier model that skips the
+                LLM for obvious ignores (None disables it)
+            llm_timeout: Seconds to wait for a single LLM API request to the fast model
+            llm_reasoner_timeout: Seconds to wait for a single LLM API request to
+                the reasoning model (LLM_MODEL)
+            stream_llm: Stream LLM responses and stop reading once the email is
+                known to need no reply
+            llm_batch_size: Emails classified together in one LLM request
+            startup_timer: StartupTimer recording the initialization phases
+            ledger_path: SQLite file recording each message's processing stages,
+                so interrupted work resumes instead of starting over (None disables it)
+            input_token_budget: Approximate tokens of email body sent to the LLM
+                per message, after boilerplate is stripped (None for no limit)
+            fast_model: Model that decides first, escalating replies and
+                uncertain emails to the main model (None sends everything to the main model)
+            gmail: GmailService-like object with service, quota_units and
+                call_counts to use instead of authenticating (e.g. an offline fake)
+            llm_client: AsyncOpenAI-compatible client for the LLM requests
+                (None connects to the DeepSeek API)
+            metrics: Metrics that time the pipeline stages and count API calls,
+                tokens and decisions (exported after every run if it has a path)
         """
+        self.max_workers = max(1, max_workers)
+        # Kept for the bot's lifetime, so the worker threads and their Gmail
+        # connections survive across pages and daemon runs; threads only
+        # start once work is submitted
+        self._executor = (ThreadPoolExecutor(max_workers=self.max_workers,
+                                             thread_name_prefix='email-bot')
+                          if self.max_workers > 1 else None)
+        self.rate_limiter = RateLimiter(rate_limit, burst=self.max_workers)
+        self.batch_requests = batch_requests
+        self.sync_mode = sync_mode
+        self.state = StateStore(state_path)
+        self.page_size = max(1, page_size)
+        self.max_seconds = max_seconds
+        self.max_gmail_units = max_gmail_units
+        self.max_llm_tokens = max_llm_tokens
+        self.llm_batch_size = max(1, llm_batch_size)
+        self.input_token_budget = input_token_budget
+        self._messages = {}
+        # Number of messages per thread ID, kept for the whole run
+        self._thread_sizes = {}
+        self._processed_count = 0
+        # Approximate email body tokens before and after compaction
+        self._compaction_tokens = [0, 0]
+        self._count_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.budget = None
+        self.startup = startup_timer or StartupTimer()
+        self.metrics = metrics or Metrics()
+        # Gmail calls already added to the metrics
+        self._gmail_calls_counted = Counter()
+        self.fast_model = fast_model
+        self._llm = None
+        self._router = None
+        self._llm_lock = threading.Lock()
+
         try:
             # Set up Gmail service
             logging.info("Initializing Gmail service")
-            gmail_service_obj = GmailService()
-            self.gmail_service = gmail_service_obj.service
+            with self.startup.phase("Gmail service"):
+                self.gmail = gmail or GmailService(state=self.state)
+                self.gmail_service = self.gmail.service
 
             # Set up label manager
             logging.info("Initializing Gmail label manager")
-            self.label_manager = GmailLabelManager(self.gmail_service)
+            with self.startup.phase("Gmail labels"):
+                self.label_manager = GmailLabelManager(
+                    self.gmail_service, deferred=batch_requests, state=self.state,
+                    metrics=self.metrics)
 
-            # Set up LLM
-            logging.info("Initializing LLM client")
+            # The LLM client is created on first use, so runs without new
+            # mail never import or start it
             api_key = os.environ.get("DEEPSEEK_API_KEY")
             if not api_key:
                 logging.error(
                     "DEEPSEEK_API_KEY environment variable is not set")
                 raise ValueError(
                     "DEEPSEEK_API_KEY environment variable is not set")
-
-            self.llm = DeepSeekLLM(
-                system_prompt=SYSTEM_PROMPT,
-                api_key=api_key
-            )
+            self._llm_options = {
+                'system_prompt': SYSTEM_PROMPT,
+                'api_key': api_key,
+                'model': LLM_MODEL,
+                'timeout': llm_timeout,
+                'model_timeouts': {LLM_MODEL: llm_reasoner_timeout},
+                'stream': stream_llm,
+                'client': llm_client,
+                'metrics': self.metrics,
+                'deadline': self._llm_deadline,
+            }
+
+            # Set up decision cache
+            self.decision_cache = None
+            if decision_cache_path:
+                logging.info("Initializing LLM decision cache")
+                self.decision_cache = DecisionCache(
+                    decision_cache_path,
+                    namespace=f"{LLM_MODEL}\0{SYSTEM_PROMPT}",
+                    ttl_seconds=DECISION_CACHE_TTL,
+                    max_entries=DECISION_CACHE_MAX_ENTRIES
+                )
+
+            # Set up near-duplicate index
+            self.near_duplicates = None
+            if near_duplicate_index_path:
+                logging.info("Initializing near-duplicate index")
+                self.near_duplicates = NearDuplicateIndex(
+                    near_duplicate_index_path,
+                    namespace=f"{LLM_MODEL}\0{SYSTEM_PROMPT}",
+                    max_entries=NEAR_DUPLICATE_MAX_ENTRIES,
+                    max_distance=NEAR_DUPLICATE_MAX_DISTANCE
+                )
+
+            # Set up local pre-classifier
+            self.preclassifier = None
+            if preclassifier_path:
+                logging.info("Initializing local pre-classifier")
+                self.preclassifier = PreClassifier(
+                    preclassifier_path,
+                    min_confidence=PRECLASSIFIER_MIN_CONFIDENCE,
+                    min_samples=PRECLASSIFIER_MIN_SAMPLES
+                )
+
+            # Set up processed-message ledger
+            self.ledger = None
+            if ledger_path:
+                logging.info("Initializing message ledger")
+                self.ledger = MessageLedger(ledger_path, ttl_seconds=LEDGER_TTL)
 
             logging.info("Email bot initialized successfully")
 
@@ -53,212 +240,883 @@ class EmailBot:
             raise
 
     def process_emails(self):
-        """Process unread emails in the inbox."""
+        """
+        Process unread emails in the inbox.
+
+        Pages of messages are processed until the backlog is empty or the run
+        budget (time, Gmail quota units or LLM tokens) is used up.
+        """
+        self.budget = RunBudget(max_seconds=self.max_seconds,
+                                max_gmail_units=self.max_gmail_units,
+                                max_llm_tokens=self.max_llm_tokens,
+                                usage=self._usage,
+                                stop_event=self._stop_event)
+        self._processed_count = 0
+        self._compaction_tokens = [0, 0]
+        self._thread_sizes = {}
+        self._labels_flushed = True
+        if self.decision_cache:
+            self.decision_cache.reset_stats()
+        cache_base = ((self._llm.cache_hit_tokens, self._llm.cache_miss_tokens)
+                      if self._llm is not None else (0, 0))
+        usage_base = {}
+        if self._llm is not None:
+            usage_base = {model: dict(usage) for model, usage in self._llm.usage_by_model.items()}
+            self._router.reset_stats()
+        history_id = None
+        leftover_ids = []
+
         try:
             logging.info("Starting to process unread emails")
 
-            # Query for unread messages that don't have the Bot Read label
-            logging.debug(
-                "Querying for unread messages without Bot Read label")
-            results = self.gmail_service.users().messages().list(
-                userId='me',
-                q='in:inbox is:unread -label:"Bot Read"',
-                maxResults=10  # Limit to 10 messages per run to avoid quota issues
-            ).execute()
-
-            messages = results.get('messages', [])
-            if not messages:
-                logging.info("No unread messages found to process")
-                return
+            if self.sync_mode == 'incremental':
+                messages, history_id = self._list_history_since_last_run()
+
+                # Retry messages left over from the previous run first
+                listed_ids = {m['id'] for m in messages or []}
+                pending = [{'id': message_id} for message_id in self.state.get('pending_message_ids', [])
+                           if message_id not in listed_ids]
+                if pending:
+                    logging.info(
+                        f"Retrying {len(pending)} message(s) left over from the previous run")
+
+                if messages is not None or pending:
+                    leftover_ids = self._drain_list(
+                        pending + (messages or []))
+
+                if messages is None:
+                    drained, failed_ids = self._drain_query()
+                    leftover_ids.extend(failed_ids)
+                    if not drained:
+                        # Older unread mail is still waiting; keep using the
+                        # full query until the backlog is gone
+                        history_id = None
+            else:
+                self._drain_query()
+
+        except Exception as e:
+            logging.error(f"Error processing emails: {str(e)}", exc_info=logging.getLogger(
+            ).level == logging.DEBUG)
+            # Keep the old sync position so the next run sees these messages again
+            history_id = None
+
+        finally:
+            # Apply queued label changes even if the run was interrupted, so
+            # processed messages are not picked up again
+            self._flush_labels()
+
+            if history_id and self._labels_flushed:
+                self._save_sync_state(history_id, leftover_ids)
+
+            units, tokens = self.budget.spent()
+            logging.info(
+                f"Processed {self._processed_count} message(s) in {self.budget.elapsed():.1f}s "
+                f"({units} Gmail quota units, {tokens} LLM tokens)")
+            before, after = self._compaction_tokens
+            if before:
+                logging.info(
+                    f"Email compaction: {before} -> {after} body token(s) "
+                    f"({100 * (before - after) / before:.0f}% less LLM input)")
+            if self.decision_cache:
+                logging.info(
+                    f"Decision cache: {self.decision_cache.hits} hit(s), {self.decision_cache.misses} miss(es)")
+            if self._llm is not None:
+                self._log_llm_summary(cache_base, usage_base)
+            self._count_gmail_calls()
+            try:
+                self.metrics.export()
+            except OSError as e:
+                logging.warning(f"Could not write metrics to {self.metrics.path}: {str(e)}")
+            if self.near_duplicates is not None:
+                self.near_duplicates.save()
+            if self.preclassifier:
+                self.preclassifier.save()
+
+    @property
+    def llm(self):
+        """The LLM client, created on first use."""
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    logging.info("Initializing LLM client")
+                    with self.startup.phase("LLM client"):
+                        from llm import DeepSeekLLM
+                        from routing import ModelRouter
+                        llm = DeepSeekLLM(**self._llm_options)
+                        self._router = ModelRouter(llm, LLM_MODEL, self.fast_model)
+                        self._llm = llm
+        return self._llm
+
+    def _llm_deadline(self):
+        """Time after which failed LLM requests are not retried: the end of the run's time limit."""
+        return self.budget.deadline() if self.budget is not None else None
+
+    @property
+    def router(self):
+        """The model router deciding on emails, created with the LLM client."""
+        if self._router is None:
+            self.llm
+        return self._router
+
+    def _log_llm_summary(self, cache_base, usage_base):
+        """Log the LLM context cache, routing and streaming statistics of the run."""
+        from llm import cache_savings, usage_cost
+
+        cache_hit = self._llm.cache_hit_tokens - cache_base[0]
+        cache_miss = self._llm.cache_miss_tokens - cache_base[1]
+        if cache_hit or cache_miss:
+            logging.info(
+                f"LLM context cache: {cache_hit} of {cache_hit + cache_miss} prompt token(s) "
+                f"served from cache, ${cache_savings(cache_hit):.4f} saved")
+        usage_by_model = {}
+        for model, usage in self._llm.usage_by_model.items():
+            base = usage_base.get(model, {})
+            usage_by_model[model] = {key: value - base.get(key, 0) for key, value in usage.items()}
+        for line in self._router.summary(usage_by_model, usage_cost):
+            logging.info(line)
+        if self._llm.streamed:
+            logging.info(
+                f"Streamed {self._llm.streamed} LLM response(s), {self._llm.early_stops} stopped early, "
+                f"{self._llm.decision_seconds / self._llm.streamed:.2f}s average time to decision")
+
+    def request_stop(self):
+        """Stop taking new messages; the current run finishes the messages it started."""
+        self._stop_event.set()
+
+    def close(self):
+        """Release local resources held between runs."""
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._llm is not None:
+            self._llm.close()
+        if self.decision_cache:
+            self.decision_cache.close()
+        if self.ledger:
+            self.ledger.close()
+        if self.near_duplicates is not None:
+            self.near_duplicates.save()
+        if self.preclassifier:
+            self.preclassifier.save()
+
+    def _count_gmail_calls(self):
+        """Add the Gmail requests made since the last call to the metrics."""
+        for method, count in list(self.gmail.call_counts.items()):
+            new = count - self._gmail_calls_counted[method]
+            if new > 0:
+                self.metrics.count('gmail_api_calls', new,
+                                   method=(method or 'unknown').removeprefix('gmail.users.'))
+                self._gmail_calls_counted[method] = count
+
+    def _usage(self):
+        """Return the current (Gmail quota units, LLM tokens) totals."""
+        tokens = self._llm.total_tokens if self._llm is not None else 0
+        return self.gmail.quota_units, tokens
+
+    def _drain_list(self, messages):
+        """
+        Process a known list of messages page by page.
+
+        Args:
+            messages: Message stubs to process
+
+        Returns:
+            list: IDs of messages that failed or were not reached before the budget ran out
+        """
+        if not messages:
+            logging.info("No new unread messages found to process")
+            return []
+
+        logging.info(f"Found {len(messages)} unread message(s) to process")
+        leftover_ids = []
+
+        for start in range(0, len(messages), self.page_size):
+            page = messages[start:start + self.page_size]
+            results = self._process_page(page)
+            leftover_ids.extend(message['id'] for message, ok in zip(
+                page, results) if not ok)
+            if any(ok is None for ok in results):
+                # The budget ran out; the remaining pages stay for the next run
+                leftover_ids.extend(m['id']
+                                    for m in messages[start + self.page_size:])
+                break
+
+        if leftover_ids:
+            logging.info(
+                f"Backlog: {len(leftover_ids)} message(s) left for the next run")
+        return leftover_ids
+
+    def _drain_query(self):
+        """
+        Process unread messages found by the inbox search, following result pages.
+
+        Returns:
+            tuple: (True if every result page was processed, IDs of messages that failed)
+        """
+        page_token = None
+        estimate = None
+        handled = 0
+        failed_ids = []
+
+        while True:
+            reason = self.budget.exhausted()
+            if reason:
+                logging.info(f"Stopping before the next page: reached {reason}")
+                break
+
+            messages, page_token, page_estimate = self._list_unread(page_token)
+            if estimate is None:
+                estimate = page_estimate
+                if not messages:
+                    logging.info("No unread messages found to process")
+                    return True, failed_ids
+                logging.info(
+                    f"Found about {estimate} unread message(s) to process")
+
+            results = self._process_page(messages)
+            handled += sum(1 for ok in results if ok is not None)
+            failed_ids.extend(message['id'] for message, ok in zip(
+                messages, results) if ok is False)
+
+            if any(ok is None for ok in results):
+                break
+            if not page_token:
+                return True, failed_ids
+
+        if estimate is not None:
+            logging.info(
+                f"Backlog: about {max(estimate - handled, 0)} message(s) left for the next run")
+        return False, failed_ids
 
-            logging.info(f"Found {len(messages)} unread message(s) to process")
+    def _process_page(self, messages):
+        """
+        Process one page of messages and apply its label changes.
+
+        Args:
+            messages: Message stubs with at least an 'id'
+
+        Returns:
+            list: Per message, True if processed, False if it failed, or None if
+            it was not started because the budget ran out
+        """
+        reason = self.budget.exhausted()
+        if reason:
+            logging.info(f"Stopping before the next page: reached {reason}")
+            return [None] * len(messages)
+
+        # Skip messages an earlier run finished, without fetching them
+        done = self.ledger.completed(m['id'] for m in messages) if self.ledger else set()
+        if done:
+            logging.info(
+                f"Skipping {len(done)} message(s) already handled according to the ledger")
+            all_messages = messages
+            messages = [m for m in messages if m['id'] not in done]
+
+        if self.batch_requests:
+            self._prefetch(messages)
+
+        # Triage every message, decide on those that need the LLM, then act.
+        # A message's label changes are collected in one transaction that
+        # stays open across the phases, so they keep their order.
+        message_ids = [m['id'] for m in messages]
+        results = []
+        try:
+            if self._executor is not None:
+                logging.debug("Processing messages with %s workers", self.max_workers)
+            results = self._run_phases(message_ids, self._executor)
+        finally:
+            self._flush_labels()
+            self._record_labeled(message_ids, results)
+            self._messages = {}
+
+        if done:
+            remaining = iter(results)
+            results = [True if m['id'] in done else next(remaining) for m in all_messages]
+        return results
+
+    def _record_labeled(self, message_ids, results):
+        """Record in the ledger which processed messages got all their label changes."""
+        failed = self.label_manager.pop_failed_ids()
+        if not self.ledger:
+            return
+        for message_id, result in zip(message_ids, results):
+            if result is True and message_id not in failed:
+                self.ledger.record(message_id, 'labeled')
+
+    def _run_phases(self, message_ids, executor):
+        """Prepare, decide on and act on a page of messages, using the executor if given."""
+        def run(function, items):
+            if executor is None:
+                return [function(item) for item in items]
+            return list(executor.map(function, items))
+
+        prepared = run(self._prepare_message_id, message_ids)
+
+        # Only messages that passed triage have their bodies downloaded
+        triaged = [item for item in prepared if isinstance(item, PreparedMessage)]
+        if self.batch_requests and len(triaged) > 1:
+            self._fetch_bodies(triaged)
+        run(self._load_content, triaged)
+
+        waiting = [item for item in triaged
+                   if item.email_content is not None and item.decision is None]
+        if self.llm_batch_size > 1 and len(waiting) > 1:
+            run(self._decide_batch, [waiting[i:i + self.llm_batch_size]
+                                     for i in range(0, len(waiting), self.llm_batch_size)])
+        else:
+            run(self._decide_single, waiting)
+
+        return run(self._finish_message, prepared)
+
+    def _flush_labels(self):
+        """Send queued label changes, remembering whether any of them failed."""
+        if not self.label_manager.flush():
+            self._labels_flushed = False
+
+    def _list_history_since_last_run(self):
+        """
+        List new messages through the mailbox history.
+
+        Returns:
+            tuple: (list of message stubs, or None if the full query must be
+            used instead; mailbox history ID to store after the run)
+        """
+        history_id = self.state.get('history_id')
+        if history_id:
+            messages, new_history_id = self._list_history(history_id)
+            if messages is not None:
+                return messages, new_history_id
+
+        # Record the mailbox position before the full query, so anything
+        # arriving while we work is picked up by the next incremental run
+        logging.info("No usable sync position, falling back to full query")
+        profile = self.gmail_service.users().getProfile(userId='me').execute()
+        return None, profile['historyId']
+
+    def _list_unread(self, page_token=None):
+        """
+        Search the inbox for unread messages without the Bot Read label.
+
+        Args:
+            page_token: Token of the result page to fetch, None for the first page
+
+        Returns:
+            tuple: (list of message stubs, next page token or None, estimated total results)
+        """
+        logging.debug(
+            "Querying for unread messages without Bot Read label")
+        results = self.gmail_service.users().messages().list(
+            userId='me',
+            q='in:inbox is:unread -label:"Bot Read"',
+            maxResults=self.page_size,
+            pageToken=page_token
+        ).execute()
 
-            # Process each message
-            for message_info in messages:
-                message_id = message_info['id']
-                logging.debug(f"Processing message ID: {message_id}")
+        return (results.get('messages', []), results.get('nextPageToken'),
+                results.get('resultSizeEstimate', 0))
 
-                # Get the full message
-                logging.debug(
-                    f"Fetching full message data for ID: {message_id}")
-                full_message = self.gmail_service.users().messages().get(
+    def _list_history(self, start_history_id):
+        """
+        List unread inbox messages added since a stored history ID.
+
+        Args:
+            start_history_id: History ID saved by the previous run
+
+        Returns:
+            tuple: (list of message stubs, latest history ID), or (None, None)
+            if the stored history has expired
+        """
+        logging.debug("Reading mailbox history since %s", start_history_id)
+        bot_read_id = self.label_manager.label_ids.get("Bot Read")
+        messages = {}
+        page_token = None
+
+        try:
+            while True:
+                response = self.gmail_service.users().history().list(
                     userId='me',
-                    id=message_id,
-                    format='full'
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    labelId='INBOX',
+                    pageToken=page_token
                 ).execute()
 
-                # Process the message
-                self._process_single_message(full_message)
+                for record in response.get('history', []):
+                    for added in record.get('messagesAdded', []):
+                        message = added['message']
+                        labels = message.get('labelIds', [])
+                        if 'UNREAD' in labels and bot_read_id not in labels:
+                            messages[message['id']] = message
+
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+
+        except HttpError as e:
+            if e.resp.status == 404:
+                logging.warning(
+                    f"Stored history ID {start_history_id} has expired")
+                return None, None
+            raise
+
+        logging.debug("History returned %s new unread message(s)", len(messages))
+        return list(messages.values()), response.get('historyId', start_history_id)
+
+    def _save_sync_state(self, history_id, leftover_ids):
+        """Persist the sync position and the messages to retry next run."""
+        if self.sync_mode != 'incremental':
+            return
 
-                # Add a small delay to avoid rate limiting
-                time.sleep(1)
+        self.state.set('history_id', history_id)
+        self.state.set('pending_message_ids', leftover_ids or None)
+        self.state.save()
+        logging.debug("Saved sync position at history ID %s", history_id)
+
+    def _metadata_request(self, message_id):
+        """Build the request for the labels, date and triage headers of a message."""
+        return self.gmail_service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format='metadata',
+            metadataHeaders=METADATA_HEADERS,
+            fields=METADATA_FIELDS
+        )
+
+    def _body_request(self, message_id):
+        """Build the request for the parts of a message needed to extract its text."""
+        return self.gmail_service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format='full',
+            fields=BODY_FIELDS
+        )
+
+    def _thread_request(self, thread_id):
+        """Build the request for the message IDs of a thread, without any payloads."""
+        return self.gmail_service.users().threads().get(
+            userId='me',
+            id=thread_id,
+            format='minimal',
+            fields='messages/id'
+        )
+
+    def _thread_size(self, thread_id):
+        """Number of messages in a thread, looked up at most once per run."""
+        size = self._thread_sizes.get(thread_id)
+        if size is None:
+            with self.metrics.span('thread_check'):
+                thread = self._thread_request(thread_id).execute()
+            size = self._thread_sizes[thread_id] = len(thread.get('messages', []))
+        return size
+
+    def _prefetch(self, messages):
+        """Fetch message metadata and thread sizes for a page of IDs in one batch request."""
+        # Several listed messages in one thread already show it is a conversation
+        listed = Counter(m['threadId'] for m in messages if m.get('threadId'))
+        for thread_id, count in listed.items():
+            if count > 1:
+                self._thread_sizes[thread_id] = max(
+                    count, self._thread_sizes.get(thread_id, 0))
+
+        requests = {}
+        for message_info in messages:
+            requests[('message', message_info['id'])] = self._metadata_request(
+                message_info['id'])
+            thread_id = message_info.get('threadId')
+            if thread_id and thread_id not in self._thread_sizes and ('thread', thread_id) not in requests:
+                requests[('thread', thread_id)] = self._thread_request(thread_id)
+
+        logging.debug("Prefetching %s message(s) and thread(s)", len(requests))
+        with self.metrics.span('fetch'):
+            responses = execute_batch(self.gmail_service, requests)
+        for (kind, item_id), response in responses.items():
+            if kind == 'message':
+                self._messages[item_id] = response
+            else:
+                self._thread_sizes[item_id] = len(response.get('messages', []))
+
+    def _prepare_message_id(self, message_id):
+        """
+        Fetch and triage a single message, isolating its failures from the rest of the run.
+
+        Returns:
+            PreparedMessage for a message that still needs acting on, True if
+            the message was fully handled, False if it failed, or None if it
+            was not started because the run budget is used up
+        """
+        reason = self.budget.exhausted()
+        if reason:
+            logging.info(
+                f"Not starting message {message_id}: reached {reason}")
+            return None
+
+        try:
+            # Wait for a slot so we stay under the Gmail API rate limits
+            self.rate_limiter.acquire()
+            logging.debug("Processing message ID: %s", message_id)
+
+            # Get the message metadata, unless it was already fetched in a batch;
+            # the body is only downloaded if the message passes triage
+            full_message = self._messages.get(message_id)
+            if full_message is None:
+                logging.debug("Fetching message metadata for ID: %s", message_id)
+                with self.metrics.span('fetch'):
+                    full_message = self._metadata_request(message_id).execute()
+
+            resumed = {}
+            if self.ledger:
+                resumed = self.ledger.stages(message_id)
+                self.ledger.record(message_id, 'fetched')
+
+            # All label changes for the message are gathered in one transaction
+            # and sent as a single modify once processing is done
+            labels = self.label_manager.transaction(
+                full_message['id'], full_message.get('labelIds'))
+            prepared = self._triage_message(full_message, labels, resumed)
+            if prepared is None:
+                labels.commit()
+                self._count_processed()
+                return True
+            return prepared
 
         except Exception as e:
-            logging.error(f"Error processing emails: {str(e)}", exc_info=logging.getLogger(
+            logging.error(f"Error processing message {message_id}: {str(e)}", exc_info=logging.getLogger(
+            ).level == logging.DEBUG)
+            return False
+
+    def _fetch_bodies(self, items):
+        """Download the bodies of triaged messages in one batch request."""
+        logging.debug("Fetching %s message body(ies)", len(items))
+        requests = {item.message['id']: self._body_request(item.message['id'])
+                    for item in items}
+        with self.metrics.span('fetch'):
+            responses = execute_batch(self.gmail_service, requests)
+        for item in items:
+            response = responses.get(item.message['id'])
+            if response is not None:
+                item.payload = response['payload']
+
+    def _load_content(self, item):
+        """
+        Extract the text of a triaged message and try to decide on it locally.
+
+        The body is fetched here if it was not part of a batch. On failure the
+        message is left without content, so it is not processed further.
+        """
+        message_id = item.message['id']
+        try:
+            if item.payload is None:
+                logging.debug("Fetching message body for ID: %s", message_id)
+                with self.metrics.span('fetch'):
+                    item.payload = self._body_request(message_id).execute()['payload']
+
+            # Extract email content and strip it down to what the decision needs
+            with self.metrics.span('extract'):
+                email_content, before, after = compact_email(
+                    extract_text(item.payload), item.sender_email, self.input_token_budget)
+            logging.debug(
+                "Email body of %s: %s -> %s token(s) after compaction",
+                message_id, before, after)
+            with self._count_lock:
+                self._compaction_tokens[0] += before
+                self._compaction_tokens[1] += after
+            email_content = f"From: {item.sender_email}\nSubject: {item.subject}\n{email_content}"
+            # Log full email content in debug mode
+            logging.debug(
+                "Full email content from %s:\n%s\n%s\n%s",
+                message_id, LOG_RULE, email_content, LOG_RULE)
+            item.email_content = email_content
+
+            if 'classified' in item.resumed:
+                logging.info(
+                    f"Resuming message {message_id} with the decision recorded by an earlier run")
+                item.decision = Decision.from_dict(item.resumed['classified'])
+            else:
+                item.decision = self._classify_locally(message_id, email_content)
+
+        except Exception as e:
+            logging.error(f"Error processing message {message_id}: {str(e)}", exc_info=logging.getLogger(
             ).level == logging.DEBUG)
+            item.email_content = None
+            item.decision = None
+
+    def _finish_message(self, item):
+        """
+        Act on a prepared message's decision and commit its label changes.
+
+        Returns:
+            bool: True if the message was processed without errors; other
+            results of _prepare_message_id are passed through
+        """
+        if not isinstance(item, PreparedMessage):
+            return item
+
+        message_id = item.message['id']
+        if item.decision is None:
+            # The LLM was unavailable; leave the message untouched so a later
+            # run picks it up again
+            return False
+
+        try:
+            self._act_on_decision(item)
+            item.labels.commit()
+            self._count_processed()
+            return True
+        except Exception as e:
+            logging.error(f"Error processing message {message_id}: {str(e)}", exc_info=logging.getLogger(
+            ).level == logging.DEBUG)
+            return False
+
+    def _count_processed(self):
+        """Count a processed message."""
+        with self._count_lock:
+            self._processed_count += 1
+        self.metrics.count('messages_processed')
+
+    def _triage_message(self, message, labels, resumed):
+        """
+        Apply the rules that need no decision, recording label changes in the transaction.
+
+        Args:
+            message: Message metadata (labels, date and the triage headers)
+            labels: LabelTransaction of the message
+            resumed: Stages recorded in the ledger by an earlier run
 
-    def _process_single_message(self, message):
-        """Process a single email message."""
+        Returns:
+            PreparedMessage: The message with its headers and sender if it needs
+            a decision (its content is loaded later by _load_content), or None
+            if it is fully handled
+        """
         message_id = message['id']
         thread_id = message['threadId']
 
-        logging.debug(
-            f"Processing message ID: {message_id}, Thread ID: {thread_id}")
+        logging.debug("Processing message ID: %s, Thread ID: %s", message_id, thread_id)
 
         # Skip if already read by a human
         if self.label_manager.is_read_by_human(message):
             logging.info(
                 f"Message {message_id} has already been read by a human. Skipping.")
-            return
+            return None
+
+        # Skip if an earlier run already handled it (history and retries are
+        # not filtered by the search query)
+        if self.label_manager.label_ids.get("Bot Read") in message.get('labelIds', []):
+            logging.info(
+                f"Message {message_id} has already been processed by the bot. Skipping.")
+            return None
 
         # Check message age
         if self._is_message_too_old(message):
             logging.info(
                 f"Message {message_id} is older than 1 day. Skipping.")
             # Mark as read by bot so it won't be processed again
-            self.label_manager.mark_as_bot_read(message_id)
+            labels.mark_as_bot_read()
             # Mark for human attention
-            self.label_manager.mark_as_needs_human_attention(message_id)
-            return
+            labels.mark_as_needs_human_attention()
+            return None
 
         # Mark message as read by the bot
-        self.label_manager.mark_as_bot_read(message_id)
-        logging.debug(f"Marked message {message_id} as read by bot")
+        labels.mark_as_bot_read()
+        logging.debug("Marked message %s as read by bot", message_id)
 
         # Check if this is the first message in the thread
-        logging.debug(f"Checking if message {message_id} is first in thread")
-        thread = self.gmail_service.users().threads().get(
-            userId='me',
-            id=thread_id
-        ).execute()
+        logging.debug("Checking if message %s is first in thread", message_id)
+        thread_size = self._thread_size(thread_id)
 
-        # If there's more than one message in the thread, mark for human attention and skip
-        if len(thread.get('messages', [])) > 1:
+        # If there's more than one message in the thread, mark for human attention and skip.
+        # After a reply went out the thread always has two, so that case is exempt.
+        if thread_size > 1 and 'sent' not in resumed:
             logging.info(
-                f"Message {message_id} is a follow-up in a thread. Messages in thread: {len(thread.get('messages', []))}")
-            self.label_manager.mark_as_needs_human_attention(message_id)
-            logging.debug(
-                f"Marked message {message_id} as needing human attention and UNREAD")
-            return
+                f"Message {message_id} is a follow-up in a thread. Messages in thread: {thread_size}")
+            labels.mark_as_needs_human_attention()
+            logging.debug("Marked message %s as needing human attention and UNREAD", message_id)
+            return None
 
         # Extract email details for the response
         headers = {h['name']: h['value']
                    for h in message['payload']['headers']}
         sender_email = headers.get('From', '').split('<')[-1].split('>')[0]
         subject = headers.get('Subject', '')
-        logging.debug(f"Email from: {sender_email}, Subject: {subject}")
+        logging.debug("Email from: %s, Subject: %s", sender_email, subject)
 
-        # Extract email content
-        email_content = self._extract_email_content(message['payload'])
-        email_content = f"From: {sender_email}\nSubject: {subject}\n{email_content}"
-        # Log full email content in debug mode
-        logging.debug(
-            f"Full email content from {message_id}:\n{'='*50}\n{email_content}\n{'='*50}")
-
-        # Generate AI response
-        logging.info(f"Generating AI response for message {message_id}")
-        ai_response_text = self.llm.generate_response(email_content)
-        logging.debug(
-            f"Generated raw AI response:\n{'='*50}\n{ai_response_text}\n{'='*50}")
+        return PreparedMessage(message, labels, headers, sender_email, subject, resumed)
 
-        # Parse the structured response
-        parsed_response = self.llm.parse_response(ai_response_text)
-        logging.info(f"Response type: {parsed_response['type']}")
-        logging.debug(f"Response reason: {parsed_response['reason']}")
+    def _act_on_decision(self, item):
+        """Send the reply or record the label changes the decision calls for."""
+        message_id = item.message['id']
+        thread_id = item.message['threadId']
+        parsed_response = item.decision
+        labels = item.labels
+        logging.info(f"Response type: {parsed_response.type}")
+        logging.debug("Response reason: %s", parsed_response.reason)
+        self.metrics.count('decisions', type=parsed_response.type)
 
         # Handle based on response type
-        if parsed_response['type'] == 'answer':
+        if parsed_response.type == 'answer':
             logging.info(f"Bot decided to answer message {message_id}")
 
             # Determine which email to send the response to
-            recipient_email = sender_email  # Default to original sender
-            if parsed_response['response_email'] and parsed_response['response_email'].strip():
-                recipient_email = parsed_response['response_email'].strip()
+            recipient_email = item.sender_email  # Default to original sender
+            if parsed_response.response_email and parsed_response.response_email.strip():
+                recipient_email = parsed_response.response_email.strip()
                 logging.info(
                     f"Using client-specified email from message: {recipient_email}")
 
+            if 'sent' in item.resumed:
+                # An earlier run sent the reply but did not get to label the message
+                logging.info(
+                    f"Reply to message {message_id} was already sent by an earlier run")
+                labels.mark_as_bot_answered()
+                return
+
             # Send the response
-            self._send_response(
+            sent = self._send_response(
                 message_id,
                 thread_id,
                 recipient_email,  # Use the determined recipient email
-                subject,
-                headers,
-                parsed_response['response']
+                item.subject,
+                item.headers,
+                parsed_response.response,
+                labels
             )
+            if sent and self.ledger:
+                self.ledger.record(message_id, 'sent')
 
-        elif parsed_response['type'] == 'forward to human':
+        elif parsed_response.type == 'forward to human':
             logging.info(
                 f"Bot decided to forward message {message_id} to human")
-            self.label_manager.mark_as_needs_human_attention(message_id)
+            labels.mark_as_needs_human_attention()
             # Add a note about why it was forwarded to human
-            if parsed_response['reason']:
+            if parsed_response.reason:
                 logging.info(
-                    f"Reason for human review: {parsed_response['reason']}")
+                    f"Reason for human review: {parsed_response.reason}")
             # Log if a different email was found
-            if parsed_response['response_email']:
+            if parsed_response.response_email:
                 logging.info(
-                    f"Client email found in message: {parsed_response['response_email']}")
+                    f"Client email found in message: {parsed_response.response_email}")
 
-        elif parsed_response['type'] == 'ignore':
+        elif parsed_response.type == 'ignore':
             logging.info(f"Bot decided to ignore message {message_id}")
-            self.label_manager.mark_as_bot_dismissed(message_id)
+            labels.mark_as_bot_dismissed()
             # Log the reason for ignoring
-            if parsed_response['reason']:
+            if parsed_response.reason:
                 logging.info(
-                    f"Reason for ignoring: {parsed_response['reason']}")
+                    f"Reason for ignoring: {parsed_response.reason}")
             # Log if a different email was found
-            if parsed_response['response_email']:
+            if parsed_response.response_email:
                 logging.info(
-                    f"Client email found in message: {parsed_response['response_email']}")
+                    f"Client email found in message: {parsed_response.response_email}")
 
         else:
-            # This shouldn't happen due to validation in parse_response, but just in case
+            # This shouldn't happen due to validation in decision.py, but just in case
             logging.warning(
-                f"Unknown response type: {parsed_response['type']}")
-            self.label_manager.mark_as_needs_human_attention(message_id)
+                f"Unknown response type: {parsed_response.type}")
+            labels.mark_as_needs_human_attention()
+
+    def _classify_locally(self, message_id, email_content):
+        """
+        Get the decision for an email without asking the LLM, if possible.
 
-    def _extract_email_content(self, payload):
-        """Extract plain text content from the email payload."""
-        logging.debug("Extracting email content from payload")
-        content = ""
+        Exact repeats come from the decision cache, near-duplicates of ignored
+        emails reuse that decision, and obvious ignores are caught by the local
+        pre-classifier.
+
+        Args:
+            message_id: ID of the message, for logging
+            email_content: Email text as sent to the LLM
 
+        Returns:
+            Decision: The decision, or None if the LLM has to decide
+        """
+        if self.decision_cache:
+            cached = self.decision_cache.get(email_content)
+            if cached is not None:
+                logging.info(
+                    f"Using cached decision for message {message_id}")
+                return cached
+
+        if self.near_duplicates is not None:
+            match = self.near_duplicates.find(email_content)
+            if match and match[0] == 'ignore':
+                similarity = match[1]
+                logging.info(
+                    f"Message {message_id} is a near-duplicate of an ignored email "
+                    f"(similarity {similarity:.2f}), reusing the decision")
+                return Decision(
+                    type='ignore',
+                    reason=f"Near-duplicate (similarity {similarity:.2f}) of a previously ignored email")
+
+        if self.preclassifier:
+            reason = self.preclassifier.classify(email_content)
+            if reason:
+                logging.info(
+                    f"Pre-classifier ignored message {message_id}: {reason}")
+                return Decision(type='ignore', reason=f"Pre-classifier: {reason}")
+
+        return None
+
+    def _decide_single(self, item):
+        """Ask the LLM for the decision on one prepared message."""
+        message_id = item.message['id']
         try:
-            if 'parts' in payload:
-                logging.debug("Multipart message detected")
-                for part in payload['parts']:
-                    if part['mimeType'] == 'text/plain' and 'data' in part['body']:
-                        logging.debug("Found text/plain part")
-                        content = base64.urlsafe_b64decode(
-                            part['body']['data']).decode('utf-8')
-                        break
-                    elif 'parts' in part:
-                        # Recursive extraction for multipart messages
-                        logging.debug("Found nested multipart, recursing")
-                        nested_content = self._extract_email_content(part)
-                        if nested_content:
-                            content = nested_content
-                            break
-            elif 'body' in payload and 'data' in payload['body']:
-                logging.debug("Found single part message")
-                content = base64.urlsafe_b64decode(
-                    payload['body']['data']).decode('utf-8')
-
-            content_length = len(content)
+            logging.info(f"Generating AI response for message {message_id}")
+            with self.metrics.span('llm'):
+                ai_response_text, item.decision = self.router.classify(item.email_content)
             logging.debug(
-                f"Extracted email content of length: {content_length} characters")
+                "Generated raw AI response:\n%s\n%s\n%s",
+                LOG_RULE, ai_response_text, LOG_RULE)
 
-            if not content:
-                logging.warning("No email content could be extracted")
+            # Only remember real decisions, not failed API calls
+            if not ai_response_text.startswith("Error:"):
+                self._remember_decision(message_id, item.email_content, item.decision)
 
-            return content
+        except LLMUnavailableError as e:
+            logging.warning(
+                f"LLM unavailable, leaving message {message_id} for a later run: {str(e)}")
+        except Exception as e:
+            logging.error(f"Error classifying message {message_id}: {str(e)}", exc_info=logging.getLogger(
+            ).level == logging.DEBUG)
+            item.decision = None
 
+    def _decide_batch(self, items):
+        """Ask the LLM for the decisions on several prepared messages in one request."""
+        message_ids = [item.message['id'] for item in items]
+        try:
+            logging.info(
+                f"Generating AI responses for {len(items)} messages in one request")
+            with self.metrics.span('llm'):
+                decisions = self.router.classify_batch(
+                    {item.message['id']: item.email_content for item in items})
+        except LLMUnavailableError as e:
+            logging.warning(
+                f"LLM unavailable, leaving messages {', '.join(message_ids)} for a later run: {str(e)}")
+            return
         except Exception as e:
-            logging.error(f"Error extracting email content: {str(e)}", exc_info=logging.getLogger(
+            logging.error(f"Error classifying messages {', '.join(message_ids)}: {str(e)}", exc_info=logging.getLogger(
             ).level == logging.DEBUG)
-            return ""
+            return
 
-    def _send_response(self, message_id, thread_id, to_email, subject, headers, ai_response):
+        for item in items:
+            decision = decisions.get(item.message['id'])
+            if decision is None:
+                # Same outcome as a failed single request
+                item.decision = Decision(type='forward to human',
+                                         reason='Failed to get an LLM decision')
+            else:
+                item.decision = decision
+                self._remember_decision(item.message['id'], item.email_content, decision)
+
+    def _remember_decision(self, message_id, email_content, decision):
+        """Record an LLM decision in the ledger and feed it to the local caches and the pre-classifier."""
+        if self.ledger:
+            self.ledger.record(message_id, 'classified', decision.to_dict())
+        if self.decision_cache:
+            self.decision_cache.put(email_content, decision)
+        if self.near_duplicates is not None:
+            self.near_duplicates.add(email_content, decision.type)
+        if self.preclassifier:
+            self.preclassifier.learn(email_content, decision.type)
+
+    def _send_response(self, message_id, thread_id, to_email, subject, headers, ai_response, labels):
         """Send an email response."""
         try:
             logging.info(
@@ -289,22 +1147,22 @@ class EmailBot:
                 message.as_bytes()).decode()
 
             # Send the message via Gmail API
-            logging.debug(
-                f"Sending response via Gmail API for message ID: {message_id}")
-            result = self.gmail_service.users().messages().send(
-                userId='me',
-                body={
-                    'raw': encoded_message,
-                    'threadId': thread_id
-                }
-            ).execute()
+            logging.debug("Sending response via Gmail API for message ID: %s", message_id)
+            with self.metrics.span('send'):
+                result = self.gmail_service.users().messages().send(
+                    userId='me',
+                    body={
+                        'raw': encoded_message,
+                        'threadId': thread_id
+                    }
+                ).execute()
 
             logging.info(
                 f"Auto-response sent to {to_email} for email: {message_id}")
 
             # Mark as answered by the bot
-            self.label_manager.mark_as_bot_answered(message_id)
-            logging.debug(f"Marked message {message_id} as answered by bot")
+            labels.mark_as_bot_answered()
+            logging.debug("Marked message %s as answered by bot", message_id)
 
             return True
 
@@ -313,7 +1171,7 @@ class EmailBot:
             ).level == logging.DEBUG)
 
             # Mark as needing human attention since sending failed
-            self.label_manager.mark_as_needs_human_attention(message_id)
+            labels.mark_as_needs_human_attention()
             logging.warning(
                 f"Sending failed, marked message {message_id} for human attention")
 
@@ -331,15 +1189,14 @@ class EmailBot:
         """
         try:
             message_id = message['id']
-            logging.debug(f"Checking age of message: {message_id}")
+            logging.debug("Checking age of message: %s", message_id)
 
             # Try to get timestamp from internalDate (milliseconds since epoch)
             if 'internalDate' in message:
                 # Convert to seconds
                 msg_timestamp = int(message['internalDate']) / 1000
                 msg_date = datetime.datetime.fromtimestamp(msg_timestamp)
-                logging.debug(
-                    f"Using internalDate timestamp: {msg_date.isoformat()}")
+                logging.debug("Using internalDate timestamp: %s", msg_date.isoformat())
             else:
                 # Fallback to Date header
                 headers = {h['name']: h['value']
@@ -350,8 +1207,7 @@ class EmailBot:
                     return False  # If we can't determine age, process the message
 
                 msg_date = parsedate_to_datetime(date_str)
-                logging.debug(
-                    f"Using Date header timestamp: {msg_date.isoformat()}")
+                logging.debug("Using Date header timestamp: %s", msg_date.isoformat())
 
             # Calculate message age in days
             now = datetime.datetime.now()
@@ -2,80 +2,248 @@
 
 import os
 import json
-import pickle
 import logging
+import threading
+from collections import Counter
+import httplib2
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+
+
+# Gmail API scopes - modify permission to read, send, and manage emails
+SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+
+# Quota units charged by the Gmail API per method call
+QUOTA_UNITS = {
+    'gmail.users.getProfile': 1,
+    'gmail.users.history.list': 2,
+    'gmail.users.labels.list': 1,
+    'gmail.users.labels.create': 5,
+    'gmail.users.messages.list': 5,
+    'gmail.users.messages.get': 5,
+    'gmail.users.messages.modify': 5,
+    'gmail.users.messages.batchModify': 50,
+    'gmail.users.messages.send': 100,
+    'gmail.users.threads.get': 10,
+    'gmail.users.watch': 100,
+    'gmail.users.stop': 50,
+}
+DEFAULT_QUOTA_UNITS = 5
 
 
 class GmailService:
     """Handles Gmail API authentication and operations."""
 
-    def __init__(self):
+    def __init__(self, state=None):
         """
         Initialize the Gmail service with OAuth2 authentication.
+
+        Args:
+            state: StateStore that keeps the access token between runs (None
+                to refresh it on every start)
         """
+        self.state = state
         self.creds = None
         self.service = None
+        self._local = threading.local()
+        self.call_counts = Counter()
+        self._counts_lock = threading.Lock()
         self._authenticate()
 
+    @property
+    def quota_units(self):
+        """Gmail API quota units used by the requests built so far."""
+        with self._counts_lock:
+            return sum(QUOTA_UNITS.get(method, DEFAULT_QUOTA_UNITS) * count
+                       for method, count in self.call_counts.items())
+
+    def _thread_http(self):
+        """Return an authorized HTTP connection owned by the calling thread."""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(self.creds, http=httplib2.Http())
+            self._local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        """
+        Build an API request bound to the calling thread's connection.
+
+        httplib2 connections are not thread-safe, so requests created from
+        worker threads must not share the connection the service was built with.
+        Every request is also counted per API method for quota accounting.
+        """
+        with self._counts_lock:
+            self.call_counts[kwargs.get('methodId')] += 1
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+    def _refresh(self):
+        """Refresh the access token."""
+        # Imported here: requests is only needed when the token has expired
+        from google.auth.transport.requests import Request
+        self.creds.refresh(Request())
+
+    def _load_stored_credentials(self):
+        """
+        Return the authorized-user info kept in the state store.
+
+        Credentials from the old token.pickle are moved into the state store
+        the first time they are found there.
+        """
+        info = self.state.get('gmail_credentials') if self.state else None
+        if info is not None or not os.path.exists('token.pickle'):
+            return info
+
+        # Loaded only for this one-time migration; never written again
+        import pickle
+        try:
+            with open('token.pickle', 'rb') as token:
+                creds = pickle.load(token)
+            info = json.loads(creds.to_json())
+        except Exception as e:
+            logging.warning(f"Could not migrate token.pickle: {str(e)}")
+            return None
+
+        logging.info(
+            "Migrating credentials from token.pickle to the state store; token.pickle can be deleted")
+        return info
+
+    def _store_credentials(self, keep_refresh_token):
+        """
+        Keep the current access token and its expiry for the next run.
+
+        On GitHub Actions the state directory goes to the Actions cache, which
+        workflow runs for pull requests can restore, so the token is only
+        stored if the workflow encrypts the cache (BOT_STATE_ENCRYPTED=true).
+
+        Args:
+            keep_refresh_token: Also store the long-lived refresh token and
+                client secret; off when they come from the environment, so
+                they never end up in a CI cache
+        """
+        if not self.state:
+            return
+
+        if (os.environ.get("GITHUB_ACTIONS") == "true"
+                and os.environ.get("BOT_STATE_ENCRYPTED") != "true"):
+            if self.state.get('gmail_credentials') is not None:
+                # Left by a run before tokens were kept out of CI caches
+                self.state.set('gmail_credentials', None)
+                self.state.save()
+            return
+
+        info = json.loads(self.creds.to_json())
+        if not keep_refresh_token:
+            info.pop('refresh_token', None)
+            info.pop('client_secret', None)
+
+        if info != self.state.get('gmail_credentials'):
+            self.state.set('gmail_credentials', info)
+            self.state.save()
+            logging.debug("Stored credentials expiring at %s", self.creds.expiry)
+
     def _authenticate(self):
         """Authenticate with Gmail API using OAuth2."""
-        # Gmail API scopes - modify permission to read, send, and manage emails
-        SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
-
         try:
-            # Check if token exists from previous authentication
-            if os.path.exists('token.pickle'):
-                with open('token.pickle', 'rb') as token:
-                    self.creds = pickle.load(token)
-                logging.info("Loaded credentials from token.pickle")
-
-            # If no valid credentials found, check GitHub Actions environment
-            if not self.creds or not self.creds.valid:
-                if self.creds and self.creds.expired and self.creds.refresh_token:
-                    logging.info("Refreshing expired credentials")
-                    self.creds.refresh(Request())
-                else:
-                    # Check for GitHub Actions environment variable
-                    token_json = os.environ.get("GMAIL_TOKEN_JSON")
-                    if token_json:
-                        logging.info(
-                            "Using credentials from GMAIL_TOKEN_JSON environment variable")
-                        token_data = json.loads(token_json)
-                        self.creds = Credentials.from_authorized_user_info(
-                            token_data, SCOPES)
-                        logging.debug(
-                            "Successfully created credentials from GMAIL_TOKEN_JSON")
-
-                        if self.creds.expired and self.creds.refresh_token:
-                            logging.info(
-                                "Refreshing expired credentials from environment variable")
-                            self.creds.refresh(Request())
-                    else:
-                        # No credentials available - instruct to use the token generation script
-                        logging.error("No valid Gmail credentials found")
-                        raise ValueError(
-                            "No valid Gmail credentials found. Please run generate_token.py first to "
-                            "create valid credentials, then try again."
-                        )
-
-                # Save refreshed credentials
-                if not os.environ.get("GITHUB_ACTIONS") and self.creds and self.creds.valid:
-                    with open('token.pickle', 'wb') as token:
-                        pickle.dump(self.creds, token)
-                    logging.info("Updated credentials saved to token.pickle")
-                    logging.debug(
-                        f"Credentials expire at: {self.creds.expiry}")
+            stored = self._load_stored_credentials()
+            token_json = os.environ.get("GMAIL_TOKEN_JSON")
+
+            if token_json:
+                logging.info(
+                    "Using credentials from GMAIL_TOKEN_JSON environment variable")
+                token_data = json.loads(token_json)
+                # Reuse the access token an earlier run got for the same client
+                if stored and stored.get('token') and stored.get('client_id') == token_data.get('client_id'):
+                    token_data = dict(token_data, token=stored['token'],
+                                      expiry=stored.get('expiry'))
+                self.creds = Credentials.from_authorized_user_info(
+                    token_data, SCOPES)
+                logging.debug(
+                    "Successfully created credentials from GMAIL_TOKEN_JSON")
+            elif stored and stored.get('refresh_token'):
+                self.creds = Credentials.from_authorized_user_info(
+                    stored, SCOPES)
+                logging.info("Loaded credentials from the state store")
+            else:
+                # No credentials available - instruct to use the token generation script
+                logging.error("No valid Gmail credentials found")
+                raise ValueError(
+                    "No valid Gmail credentials found. Please run generate_token.py first to "
+                    "create valid credentials, then try again."
+                )
+
+            if not self.creds.valid:
+                if not self.creds.refresh_token:
+                    raise ValueError(
+                        "Gmail credentials have expired and cannot be refreshed")
+                logging.info("Refreshing expired credentials")
+                self._refresh()
+            else:
+                logging.debug("Reusing access token valid until %s", self.creds.expiry)
+
+            self._store_credentials(keep_refresh_token=not token_json)
 
             # Create the Gmail API service
             logging.debug("Building Gmail API service")
-            self.service = build('gmail', 'v1', credentials=self.creds)
+            # The discovery document bundled with googleapiclient is used, so
+            # building the service needs no network round trip
+            self.service = build('gmail', 'v1',
+                                 http=self._thread_http(),
+                                 requestBuilder=self._build_request,
+                                 static_discovery=True,
+                                 cache_discovery=False)
             logging.info("Gmail service initialized successfully")
 
         except Exception as e:
             logging.error(f"Authentication error: {str(e)}", exc_info=logging.getLogger(
             ).level == logging.DEBUG)
             raise
+
+
+# Gmail accepts up to 100 calls per batch, but recommends no more than 50
+BATCH_SIZE = 50
+
+
+def execute_batch(service, requests, batch_size=BATCH_SIZE, errors=None):
+    """
+    Execute several API requests through the Gmail batch endpoint.
+
+    Args:
+        service: Authenticated Gmail service
+        requests: Dict mapping a caller-chosen key to an unexecuted API request
+        batch_size: Maximum number of calls sent in one HTTP round trip
+        errors: Optional dict that receives the exception of each failed key
+
+    Returns:
+        dict: Maps each key to its response; failed requests are logged and left out
+    """
+    results = {}
+    items = list(requests.items())
+
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        keys = {str(index): key for index, (key, _) in enumerate(chunk)}
+
+        def callback(request_id, response, exception, keys=keys):
+            key = keys[request_id]
+            if exception is not None:
+                logging.error(f"Batched request {key} failed: {str(exception)}")
+                if errors is not None:
+                    errors[key] = exception
+                return
+            results[key] = response
+
+        batch = service.new_batch_http_request(callback=callback)
+        for index, (_, request) in enumerate(chunk):
+            batch.add(request, request_id=str(index))
+
+        logging.debug("Executing batch of %s request(s)", len(chunk))
+        try:
+            batch.execute()
+        except Exception as e:
+            logging.error(f"Batch request failed: {str(e)}", exc_info=logging.getLogger(
+            ).level == logging.DEBUG)
+
+    return results
@@ -1,40 +1,144 @@
 #!/usr/bin/env python3
 
 import logging
+import threading
+from collections import defaultdict
+
+from googleapiclient.errors import HttpError
+
+from gmail_service import execute_batch
+from metrics import Metrics
+
+# batchModify accepts at most 1000 message IDs per call
+BATCH_MODIFY_LIMIT = 1000
+# batchModify costs 50 quota units and modify 5, so smaller groups are sent
+# as one modify call per message inside the same batch request
+BATCH_MODIFY_MIN_MESSAGES = 10
+
+# Labels the bot uses to track its work
+REQUIRED_LABELS = ["Bot Read", "Bot Answered", "Bot Dismissed", "Needs Human Attention"]
+
+
+def is_missing_label_error(error):
+    """Check whether a failed modify call referenced a label that no longer exists."""
+    return (isinstance(error, HttpError) and error.resp.status in (400, 404)
+            and 'label' in str(error).lower())
+
+
+def has_required_labels(label_ids):
+    """Check whether a map of label names to IDs covers every label the bot uses."""
+    return all(name in label_ids for name in REQUIRED_LABELS)
+
+
+def label_ids_of(body):
+    """All label IDs a modify request body adds or removes."""
+    return body.get('addLabelIds', []) + body.get('removeLabelIds', [])
+
+
+def remap_labels(body, new_ids):
+    """Replace outdated label IDs in a modify request body."""
+    return {key: [new_ids.get(label, label) for label in value] if key.endswith('LabelIds') else value
+            for key, value in body.items()}
 
 
 class GmailLabelManager:
     """Manages Gmail labels for the email bot."""
 
-    def __init__(self, gmail_service):
+    def __init__(self, gmail_service, deferred=False, state=None, metrics=None):
         """
         Initialize the label manager.
 
         Args:
             gmail_service: Authenticated Gmail service
+            deferred: Queue label changes until flush() instead of sending them immediately
+            state: StateStore that keeps the label IDs between runs (None to
+                look them up on every start)
+            metrics: Metrics that time the label stage
         """
         self.service = gmail_service
+        self.metrics = metrics or Metrics()
+        self.deferred = deferred
+        self.state = state
+        self._pending = defaultdict(list)
+        self._pending_lock = threading.Lock()
+        self._labels_lock = threading.Lock()
+        self._label_ids = None
+        self._replaced_ids = {}
+        self._failed_ids = set()
         self.api_base = "https://gmail.googleapis.com/gmail/v1"
+
+    @property
+    def label_ids(self):
+        """
+        Map of the bot's label names to their IDs.
+
+        Loaded on first use, from the state store when it has all of them.
+        Cached IDs are not checked; a modify that fails on a missing label
+        triggers refresh_labels(). A lookup that did not find or create every
+        label (e.g. because the Gmail API failed) is not kept, so the next
+        access tries again.
+        """
+        label_ids = self._label_ids
+        if label_ids is None:
+            with self._labels_lock:
+                label_ids = self._label_ids
+                if label_ids is None:
+                    cached = self.state.get('label_ids') if self.state else None
+                    if cached and has_required_labels(cached):
+                        logging.debug("Using cached label IDs: %s", cached)
+                        label_ids = self._label_ids = cached
+                    else:
+                        label_ids = self._load_labels()
+                        if has_required_labels(label_ids):
+                            self._label_ids = label_ids
+        return label_ids
+
+    def _load_labels(self):
+        """Look up or create the labels and cache their IDs (labels lock held)."""
         logging.debug("Creating or retrieving required Gmail labels")
-        self.label_ids = self._get_or_create_labels()
-        logging.debug(f"Label IDs: {self.label_ids}")
+        label_ids = self._get_or_create_labels()
+        logging.debug("Label IDs: %s", label_ids)
+        if self.state and has_required_labels(label_ids):
+            self.state.set('label_ids', label_ids)
+            self.state.save()
+        return label_ids
+
+    def refresh_labels(self, used_ids=()):
+        """
+        Look the labels up again, e.g. after one was deleted in Gmail.
+
+        Args:
+            used_ids: Label IDs of the failed request; if another thread has
+                already replaced one of them, the lookup is not repeated
+
+        Returns:
+            dict: Maps every label ID replaced so far to its current ID
+        """
+        with self._labels_lock:
+            if any(label in self._replaced_ids for label in used_ids):
+                return dict(self._replaced_ids)
+
+            old_ids = self._label_ids or {}
+            logging.info("Label IDs are out of date, looking them up again")
+            label_ids = self._load_labels()
+            # Keep the old IDs if the lookup failed; the next failed modify retries it
+            if has_required_labels(label_ids):
+                self._label_ids = label_ids
+            changed = {old_id: label_ids[name] for name, old_id in old_ids.items()
+                       if name in label_ids and label_ids[name] != old_id}
+            self._replaced_ids = {old_id: changed.get(new_id, new_id)
+                                  for old_id, new_id in self._replaced_ids.items()}
+            self._replaced_ids.update(changed)
+            return dict(self._replaced_ids)
 
     def _get_or_create_labels(self):
         """Get or create the required labels for the email bot."""
         # Define the labels we need - using spaces instead of underscores
-        required_labels = [
-            {"name": "Bot Read", "labelListVisibility": "labelShow",
-                "messageListVisibility": "show"},
-            {"name": "Bot Answered", "labelListVisibility": "labelShow",
-                "messageListVisibility": "show"},
-            {"name": "Bot Dismissed", "labelListVisibility": "labelShow",
-                "messageListVisibility": "show"},
-            {"name": "Needs Human Attention", "labelListVisibility": "labelShow",
-                "messageListVisibility": "show"}
-        ]
-
-        logging.debug(
-            f"Required labels: {[label['name'] for label in required_labels]}")
+        required_labels = [{"name": name, "labelListVisibility": "labelShow",
+                            "messageListVisibility": "show"}
+                           for name in REQUIRED_LABELS]
+
+        logging.debug("Required labels: %s", [label['name'] for label in required_labels])
 
         # Get existing labels
         try:
@@ -45,7 +149,7 @@ class GmailLabelManager:
             # Map of label names to IDs
             label_ids = {}
             existing_label_names = [label["name"] for label in existing_labels]
-            logging.debug(f"Found {len(existing_labels)} existing labels")
+            logging.debug("Found %s existing labels", len(existing_labels))
 
             # Create or get IDs for required labels
             for label_info in required_labels:
@@ -57,7 +161,8 @@ class GmailLabelManager:
                         if label["name"] == label_name:
                             label_ids[label_name] = label["id"]
                             logging.debug(
-                                f"Found existing label: {label_name} with ID: {label['id']}")
+                                "Found existing label: %s with ID: %s",
+                                label_name, label['id'])
                             break
                 else:
                     # Label doesn't exist, create it
@@ -87,68 +192,296 @@ class GmailLabelManager:
             "Bot Read") not in label_ids
 
         if result:
-            logging.debug(
-                f"Message {message_id} appears to have been read by a human")
+            logging.debug("Message %s appears to have been read by a human", message_id)
 
         return result
 
+    def transaction(self, message_id, current_labels=None):
+        """
+        Start collecting label changes for a message.
+
+        Args:
+            message_id: ID of the message to change
+            current_labels: Label IDs the message has now, used to drop no-op changes
+
+        Returns:
+            LabelTransaction: Commits a single net modify when the with-block exits cleanly
+        """
+        return LabelTransaction(self, message_id, current_labels)
+
     def mark_as_bot_read(self, message_id):
         """Mark a message as read by the bot."""
-        logging.debug(f"Marking message {message_id} as read by bot")
-        return self._modify_labels(message_id,
-                                   add_labels=[self.label_ids["Bot Read"]],
-                                   remove_labels=["UNREAD"])
+        return self.transaction(message_id).mark_as_bot_read().commit()
 
     def mark_as_bot_answered(self, message_id):
         """Mark a message as answered by the bot."""
-        logging.debug(f"Marking message {message_id} as answered by bot")
-        return self._modify_labels(message_id,
-                                   add_labels=[self.label_ids["Bot Answered"]])
+        return self.transaction(message_id).mark_as_bot_answered().commit()
 
     def mark_as_bot_dismissed(self, message_id):
         """Mark a message as dismissed by the bot."""
-        logging.debug(f"Marking message {message_id} as dismissed by bot")
-        return self._modify_labels(message_id,
-                                   add_labels=[self.label_ids["Bot Dismissed"]])
+        return self.transaction(message_id).mark_as_bot_dismissed().commit()
 
     def mark_as_needs_human_attention(self, message_id):
         """
         Mark a message as needing human attention.
         Ensures the message is also marked as UNREAD.
         """
-        logging.debug(
-            f"Marking message {message_id} as needing human attention")
-        return self._modify_labels(message_id,
-                                   add_labels=[self.label_ids["Needs Human Attention"], "UNREAD"])
+        return self.transaction(message_id).mark_as_needs_human_attention().commit()
 
     def _modify_labels(self, message_id, add_labels=None, remove_labels=None):
         """Modify the labels of a message."""
         if not add_labels and not remove_labels:
-            logging.debug(
-                f"No label changes requested for message {message_id}")
+            logging.debug("No label changes requested for message %s", message_id)
             return True
 
         body = {}
         if add_labels:
             body["addLabelIds"] = add_labels
-            logging.debug(
-                f"Adding labels to message {message_id}: {add_labels}")
+            logging.debug("Adding labels to message %s: %s", message_id, add_labels)
         if remove_labels:
             body["removeLabelIds"] = remove_labels
-            logging.debug(
-                f"Removing labels from message {message_id}: {remove_labels}")
+            logging.debug("Removing labels from message %s: %s", message_id, remove_labels)
+
+        if self.deferred:
+            with self._pending_lock:
+                self._pending[message_id].append(body)
+            logging.debug("Queued label changes for message %s", message_id)
+            return True
 
         try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body=body
-            ).execute()
-            logging.debug(
-                f"Successfully modified labels for message {message_id}")
+            with self.metrics.span('label'):
+                try:
+                    self.service.users().messages().modify(
+                        userId='me',
+                        id=message_id,
+                        body=body
+                    ).execute()
+                except HttpError as e:
+                    if not is_missing_label_error(e):
+                        raise
+                    body = remap_labels(body, self.refresh_labels(label_ids_of(body)))
+                    self.service.users().messages().modify(
+                        userId='me',
+                        id=message_id,
+                        body=body
+                    ).execute()
+            logging.debug("Successfully modified labels for message %s", message_id)
             return True
         except Exception as e:
             logging.error(
                 f"Failed to modify labels for message {message_id}: {str(e)}",
                 exc_info=logging.getLogger().level == logging.DEBUG)
+            with self._pending_lock:
+                self._failed_ids.add(message_id)
             return False
+
+    def flush(self):
+        """
+        Send all queued label changes.
+
+        Changes are applied in rounds: round N holds the N-th change of every
+        message, so each message keeps the order of its own changes. Within a
+        round, at least BATCH_MODIFY_MIN_MESSAGES messages that get the same
+        label set share one batchModify call, smaller groups get a modify call
+        per message, and all calls of the round go out in a single batch request.
+
+        Returns:
+            bool: True if every queued change was applied
+        """
+        with self._pending_lock:
+            pending = self._pending
+            self._pending = defaultdict(list)
+
+        if not pending:
+            return True
+
+        logging.info(f"Flushing label changes for {len(pending)} message(s)")
+        success = True
+        refreshed = False
+        round_index = 0
+
+        while True:
+            groups = defaultdict(list)
+            for message_id, changes in pending.items():
+                if round_index < len(changes):
+                    body = changes[round_index]
+                    key = (tuple(sorted(body.get("addLabelIds", []))),
+                           tuple(sorted(body.get("removeLabelIds", []))))
+                    groups[key].append(message_id)
+
+            if not groups:
+                break
+
+            bodies = {}
+            for (add_labels, remove_labels), message_ids in groups.items():
+                chunk_size = BATCH_MODIFY_LIMIT if len(message_ids) >= BATCH_MODIFY_MIN_MESSAGES else 1
+                for start in range(0, len(message_ids), chunk_size):
+                    chunk = message_ids[start:start + chunk_size]
+                    body = {}
+                    if add_labels:
+                        body["addLabelIds"] = list(add_labels)
+                    if remove_labels:
+                        body["removeLabelIds"] = list(remove_labels)
+                    bodies[tuple(chunk)] = body
+
+            logging.debug("Label round %s: %s modify call(s)", round_index + 1, len(bodies))
+            errors = {}
+            failed = self._apply_modifies(bodies, errors)
+
+            # A label deleted in Gmail invalidates the cached IDs: look them up
+            # again, fix the queued changes and retry the failed calls once
+            if not refreshed and any(is_missing_label_error(errors.get(chunk)) for chunk in failed):
+                refreshed = True
+                new_ids = self.refresh_labels(
+                    [label for chunk in failed for label in label_ids_of(bodies[chunk])])
+                pending = {message_id: [remap_labels(body, new_ids) for body in changes]
+                           for message_id, changes in pending.items()}
+                failed = self._apply_modifies(
+                    {chunk: remap_labels(bodies[chunk], new_ids) for chunk in failed}, {})
+
+            for chunk in failed:
+                success = False
+                logging.error(
+                    f"Failed to modify labels for message(s): {', '.join(chunk)}")
+                with self._pending_lock:
+                    self._failed_ids.update(chunk)
+
+            round_index += 1
+
+        return success
+
+    def pop_failed_ids(self):
+        """
+        Return and forget the messages whose label changes failed so far.
+
+        Returns:
+            set: Message IDs with at least one failed modify call
+        """
+        with self._pending_lock:
+            failed, self._failed_ids = self._failed_ids, set()
+        return failed
+
+    def _apply_modifies(self, bodies, errors):
+        """
+        Send modify calls in one batch request.
+
+        Args:
+            bodies: Dict mapping a tuple of message IDs to the modify body for them
+            errors: Dict that receives the exception of each failed call
+
+        Returns:
+            list: Message ID tuples whose call failed
+        """
+        requests = {}
+        for chunk, body in bodies.items():
+            if len(chunk) == 1:
+                requests[chunk] = self.service.users().messages().modify(
+                    userId='me', id=chunk[0], body=body)
+            else:
+                requests[chunk] = self.service.users().messages().batchModify(
+                    userId='me', body=dict(body, ids=list(chunk)))
+
+        with self.metrics.span('label'):
+            results = execute_batch(self.service, requests, errors=errors)
+        return [chunk for chunk in requests if chunk not in results]
+
+
+class LabelTransaction:
+    """
+    Collects the label changes for one message and applies them as one net diff.
+
+    Later operations win over earlier ones, so contradictory pairs such as
+    removing and then re-adding UNREAD cancel out locally. Used as a context
+    manager, the transaction commits when the block exits normally and is
+    discarded if it raises, leaving the message untouched for the next run.
+    """
+
+    def __init__(self, manager, message_id, current_labels=None):
+        """
+        Initialize the transaction.
+
+        Args:
+            manager: GmailLabelManager that owns the label IDs and sends the change
+            message_id: ID of the message to change
+            current_labels: Label IDs the message has now, or None if unknown
+        """
+        self.manager = manager
+        self.message_id = message_id
+        self.current_labels = set(
+            current_labels) if current_labels is not None else None
+        self._add = {}
+        self._remove = {}
+        self.committed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            if not self.committed:
+                self.commit()
+        else:
+            logging.debug("Discarding label changes for message %s after error", self.message_id)
+        return False
+
+    def add(self, *labels):
+        """Add labels to the message."""
+        for label in labels:
+            self._remove.pop(label, None)
+            self._add[label] = True
+        return self
+
+    def remove(self, *labels):
+        """Remove labels from the message."""
+        for label in labels:
+            self._add.pop(label, None)
+            self._remove[label] = True
+        return self
+
+    def mark_as_bot_read(self):
+        """Mark the message as read by the bot."""
+        logging.debug("Marking message %s as read by bot", self.message_id)
+        return self.add(self.manager.label_ids["Bot Read"]).remove("UNREAD")
+
+    def mark_as_bot_answered(self):
+        """Mark the message as answered by the bot."""
+        logging.debug("Marking message %s as answered by bot", self.message_id)
+        return self.add(self.manager.label_ids["Bot Answered"])
+
+    def mark_as_bot_dismissed(self):
+        """Mark the message as dismissed by the bot."""
+        logging.debug("Marking message %s as dismissed by bot", self.message_id)
+        return self.add(self.manager.label_ids["Bot Dismissed"])
+
+    def mark_as_needs_human_attention(self):
+        """
+        Mark the message as needing human attention.
+        Ensures the message is also marked as UNREAD.
+        """
+        logging.debug("Marking message %s as needing human attention", self.message_id)
+        return self.add(self.manager.label_ids["Needs Human Attention"], "UNREAD")
+
+    def diff(self):
+        """
+        Compute the net change.
+
+        Returns:
+            tuple: (labels to add, labels to remove), without changes that
+            would leave the known current labels as they are
+        """
+        add_labels = list(self._add)
+        remove_labels = list(self._remove)
+        if self.current_labels is not None:
+            add_labels = [
+                label for label in add_labels if label not in self.current_labels]
+            remove_labels = [
+                label for label in remove_labels if label in self.current_labels]
+        return add_labels, remove_labels
+
+    def commit(self):
+        """Send the net change as a single modify call."""
+        add_labels, remove_labels = self.diff()
+        self.committed = True
+        return self.manager._modify_labels(self.message_id,
+                                           add_labels=add_labels,
+                                           remove_labels=remove_labels)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# Processing stages in the order a message goes through them
+STAGES = ('fetched', 'classified', 'sent', 'labeled')
+
+# SQLite allows at most 999 parameters per statement in older versions
+_QUERY_CHUNK = 500
+
+
+class MessageLedger:
+    """
+    Append-only local log of how far each message got through processing.
+
+    A message is 'fetched', then 'classified' (with the decision), possibly
+    'sent' (the reply went out) and finally 'labeled' once its label changes
+    reached Gmail. A later run resumes from the last recorded stage: the
+    decision is reused instead of asking the LLM again, a reply is never sent
+    twice, and fully handled messages are skipped before they are fetched.
+    """
+
+    def __init__(self, path, ttl_seconds):
+        """
+        Initialize the ledger.
+
+        Args:
+            path: SQLite database file
+            ttl_seconds: Age after which entries are dropped
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            ' message_id TEXT NOT NULL,'
+            ' stage TEXT NOT NULL,'
+            ' data TEXT,'
+            ' created REAL NOT NULL)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS events_message ON events (message_id, stage)')
+        logging.debug("Opened message ledger at %s", path)
+
+    def record(self, message_id, stage, data=None):
+        """
+        Append a completed stage for a message.
+
+        Args:
+            message_id: Gmail message ID
+            stage: One of STAGES
+            data: JSON-serializable details, e.g. the decision for 'classified'
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO events (message_id, stage, data, created) VALUES (?, ?, ?, ?)',
+                (message_id, stage, None if data is None else json.dumps(data), time.time()))
+
+    def stages(self, message_id):
+        """
+        Look up what is known about a message.
+
+        Returns:
+            dict: Latest data recorded for each completed stage (None if the
+            stage carried no data)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT stage, data FROM events WHERE message_id = ? ORDER BY rowid',
+                (message_id,)).fetchall()
+        return {stage: None if data is None else json.loads(data) for stage, data in rows}
+
+    def completed(self, message_ids):
+        """
+        Find messages that were fully handled by an earlier run.
+
+        Args:
+            message_ids: Message IDs to check
+
+        Returns:
+            set: The IDs among them that reached the 'labeled' stage
+        """
+        message_ids = list(message_ids)
+        done = set()
+        with self._lock:
+            for start in range(0, len(message_ids), _QUERY_CHUNK):
+                chunk = message_ids[start:start + _QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                done.update(row[0] for row in self._conn.execute(
+                    f"SELECT DISTINCT message_id FROM events "
+                    f"WHERE stage = 'labeled' AND message_id IN ({placeholders})", chunk))
+        return done
+
+    def close(self):
+        """Drop expired entries and close the database."""
+        with self._lock:
+            expired = self._conn.execute(
+                'DELETE FROM events WHERE created < ?', (time.time() - self.ttl_seconds,)).rowcount
+            if expired:
+                logging.debug("Dropped %s expired ledger entries", expired)
+            self._conn.close()
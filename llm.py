@@ -1,15 +1,146 @@
 #!/usr/bin/env python3
 
 import os
+import json
 import logging
 import re
-from openai import OpenAI
+import time
+import asyncio
+import threading
+import openai
+from types import SimpleNamespace
+from openai import AsyncOpenAI
+
+from decision import Decision, DecisionFormatError, parse_decision, validate
+from metrics import Metrics
+from resilience import (CircuitBreaker, CircuitOpenError, LLMUnavailableError, backoff_delay,
+                        parse_retry_after)
+from config import (LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+                    LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET, LLM_PRICE_CACHE_HIT,
+                    LLM_PRICE_CACHE_MISS, LLM_PRICE_OUTPUT)
+
+# Errors worth retrying: rate limits, server errors, timeouts and dropped connections
+TRANSIENT_ERRORS = (openai.RateLimitError, openai.InternalServerError,
+                    openai.APIConnectionError, asyncio.TimeoutError)
+
+# Errors that will fail for every message until someone fixes the account
+ACCOUNT_ERRORS = (openai.AuthenticationError, openai.PermissionDeniedError)
+
+
+# The complete type of a streamed answer, with the confidence after it if
+# the model gives one: as JSON, or a "<Type>: ..." line in the tag format
+_DECISION_HEAD = (
+    re.compile(r'"type"\s*:\s*"([^"\n]*)"\s*,\s*(?:"confidence"\s*:\s*"?(\d+)"?\s*[,}]|"[^c])'),
+    re.compile(r'<Type>:\s*(.*?)\s*\n(?:<Confidence>:\s*(\d+)[^\n]*\n|<[^C])'),
+)
+
+# Decision types that need no response body
+BODYLESS_TYPES = ('ignore', 'forward to human')
+
+
+# Start of every user message; part of the cached prompt prefix
+USER_PREFIX = "Generate response for: "
+
+
+def prompt_prefix(system_prompt):
+    """
+    The leading bytes shared by every request.
+
+    DeepSeek serves repeated request prefixes from its context cache at a
+    fraction of the price, but only if they are byte-identical between calls,
+    so nothing that varies per email or per run may appear in here.
+
+    Returns:
+        bytes: The system message and the start of the user message, serialized
+    """
+    return json.dumps([{"role": "system", "content": system_prompt}, USER_PREFIX],
+                      ensure_ascii=False).encode('utf-8')
+
+
+def cache_savings(cache_hit_tokens):
+    """US dollars saved by serving the given prompt tokens from the context cache."""
+    return cache_hit_tokens * (LLM_PRICE_CACHE_MISS - LLM_PRICE_CACHE_HIT) / 1_000_000
+
+
+def usage_cost(usage):
+    """US dollars charged for the token counts of a usage_by_model entry."""
+    # Estimated prompt tokens of stopped streams have no cache split; count them as misses
+    return (usage['cache_hit_tokens'] * LLM_PRICE_CACHE_HIT +
+            (usage['prompt_tokens'] - usage['cache_hit_tokens']) * LLM_PRICE_CACHE_MISS +
+            usage['completion_tokens'] * LLM_PRICE_OUTPUT) / 1_000_000
+
+
+# Asks for one answer per email when several emails share a request
+BATCH_INSTRUCTIONS = """Several emails follow, each inside an <Email id="..."> block.
+Decide on each email on its own, as if it were the only one.
+Answer with one JSON object whose "emails" list holds the usual object for every email,
+with an added "id" key carrying the id of its block, and nothing else:
+{"emails": [{"id": 1, "type": "...", "confidence": 0, "response": "...", "response_email": "...", "reason": "..."}]}
+"""
+
+# Completion tokens allowed per email, and for a whole batch
+MAX_TOKENS_PER_EMAIL = 1000
+MAX_BATCH_TOKENS = 8000
+
+_EMAIL_BLOCK = re.compile(r'<Email id="?(\d+)"?>(.*?)</Email>', re.DOTALL)
+
+
+def format_batch(emails):
+    """Pack several emails into one user message with numbered delimiters."""
+    blocks = [f'<Email id="{index}">\n{text}\n</Email>'
+              for index, text in enumerate(emails, start=1)]
+    return BATCH_INSTRUCTIONS + "\n" + "\n\n".join(blocks)
+
+
+def parse_batch_response(response_text):
+    """
+    Split a batch answer into the decisions on the individual emails.
+
+    The answer is a JSON object with an "emails" list, or <Email id="...">
+    blocks in the tag format.
+
+    Returns:
+        dict: Decision by email number (starting at 1); numbers without a
+        valid decision are left out, and a number answered twice keeps its
+        first answer
+    """
+    answers = {}
+    try:
+        entries = json.loads(response_text[response_text.find('{'):response_text.rfind('}') + 1])
+        entries = entries.get('emails') if isinstance(entries, dict) else None
+    except (ValueError, RecursionError):
+        entries = None
+
+    if isinstance(entries, list):
+        for entry in entries:
+            if isinstance(entry, dict) and isinstance(entry.get('id'), (int, str)):
+                answers.setdefault(str(entry['id']), entry)
+    else:
+        for match in _EMAIL_BLOCK.finditer(response_text):
+            answers.setdefault(match.group(1), match.group(2))
+
+    decisions = {}
+    for number, answer in answers.items():
+        try:
+            decision = validate(answer) if isinstance(answer, dict) else parse_decision(answer)
+        except DecisionFormatError:
+            continue
+        if number.isdigit():
+            decisions.setdefault(int(number), decision)
+    return decisions
+
+
+def estimate_tokens(text):
+    """Rough token count for text whose usage the API did not report."""
+    return len(text) // 4 + 1 if text else 0
 
 
 class DeepSeekLLM:
     """A simplified LLM client for generating responses."""
 
-    def __init__(self, system_prompt, api_key=None, model="deepseek-reasoner"):
+    def __init__(self, system_prompt, api_key=None, model="deepseek-reasoner",
+                 timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES, stream=False, json_mode=True,
+                 client=None, metrics=None, deadline=None, model_timeouts=None):
         """
         Initialize the LLM client.
 
@@ -17,12 +148,48 @@ class DeepSeekLLM:
             system_prompt: The system prompt to use
             api_key: API key (if None, will try to get from environment)
             model: Model to use
+            timeout: Seconds to wait for a single API request
+            max_retries: Retries for rate-limited, failed or timed out requests
+            stream: Stream completions and stop as soon as a decision that needs
+                no response body is known
+            json_mode: Ask the API for a JSON object (the system prompt has to
+                describe it), so the answer always decodes in one pass
+            client: AsyncOpenAI-compatible client to send the requests through
+                (None connects to the DeepSeek API)
+            metrics: Metrics counting requests, retries and tokens and timing the parse stage
+            deadline: Callable returning the time.monotonic() value after which
+                failed requests are no longer retried, or None for no deadline
+            model_timeouts: Seconds to wait for a single request to particular
+                models, overriding timeout (e.g. longer for a reasoning model)
         """
         self.system_prompt = system_prompt
+        self.metrics = metrics or Metrics()
+        # Built once and shared by every request to keep the prefix byte-stable
+        self._system_message = {"role": "system", "content": system_prompt}
         self.model = model
+        self.timeout = timeout
+        self.model_timeouts = dict(model_timeouts or {})
+        self.max_retries = max_retries
+        self.deadline = deadline or (lambda: None)
+        self.stream = stream
+        # Passed with every request; the schema itself is in the system prompt
+        self._request_options = {"response_format": {"type": "json_object"}} if json_mode else {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hit_tokens = 0
+        self.cache_miss_tokens = 0
+        self.retries = 0
+        self.streamed = 0
+        self.early_stops = 0
+        self.decision_seconds = 0.0
+        # Request and token counts per model
+        self.usage_by_model = {}
+        self._usage_lock = threading.Lock()
+        self.breaker = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET,
+                                      name="DeepSeek API")
 
-        logging.debug(f"Initializing DeepSeekLLM with model: {model}")
-        logging.debug(f"System prompt length: {len(system_prompt)} characters")
+        logging.debug("Initializing DeepSeekLLM with model: %s", model)
+        logging.debug("System prompt length: %s characters", len(system_prompt))
 
         # Use provided API key or try to get from environment
         self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
@@ -32,126 +199,379 @@ class DeepSeekLLM:
             raise ValueError(
                 "No DeepSeek API key provided in environment variables")
 
-        # Initialize the client
+        # Initialize the client. One async client, and with it one pool of
+        # HTTP connections, is shared by all callers through an event loop
+        # running in a background thread.
         try:
-            self.client = OpenAI(api_key=self.api_key,
-                                 base_url="https://api.deepseek.com/")
+            self.client = client or AsyncOpenAI(api_key=self.api_key,
+                                                base_url="https://api.deepseek.com/",
+                                                timeout=timeout,
+                                                max_retries=0)
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever,
+                                                 name="deepseek-llm", daemon=True)
+            self._loop_thread.start()
             logging.debug("Successfully initialized DeepSeek API client")
         except Exception as e:
             logging.error(
                 f"Failed to initialize DeepSeek API client: {str(e)}")
             raise
 
-    def generate_response(self, user_input):
+    def close(self):
+        """Close the HTTP connections and stop the background event loop."""
+        if not self._loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(
+            self.client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
+
+    def generate_response(self, user_input, model=None):
         """
         Generate a response for the given user input.
 
+        Safe to call from several threads at once; the requests share the
+        client's connection pool.
+
         Args:
             user_input: The user's message/query
+            model: Model for this request (None for the client's model)
 
         Returns:
             Generated text response
+
+        Raises:
+            LLMUnavailableError: If the API stays unreachable after retries
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.agenerate_response(user_input, model=model), self._loop).result()
+
+    def classify_batch(self, emails, model=None):
+        """
+        Classify several emails with as few requests as possible.
+
+        The emails are sent together in one request. If the answer for some of
+        them cannot be parsed, those are sent again, split in halves when the
+        whole batch failed, down to single emails in the normal format.
+
+        Args:
+            emails: Dict of email text by caller-chosen key
+            model: Model for these requests (None for the client's model)
+
+        Returns:
+            dict: Decision by key, as returned by parse_response; emails
+            whose request failed with an error are left out
+
+        Raises:
+            LLMUnavailableError: If the API stays unreachable after retries
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.aclassify_batch(emails, model=model), self._loop).result()
+
+    async def aclassify_batch(self, emails, model=None):
+        """Classify several emails (coroutine version of classify_batch)."""
+        items = list(emails.items())
+        if not items:
+            return {}
+        if len(items) == 1:
+            key, text = items[0]
+            response_text = await self.agenerate_response(text, model=model)
+            if response_text.startswith("Error:"):
+                return {}
+            return {key: self.parse_response(response_text)}
+
+        logging.debug("Classifying %s emails in one request", len(items))
+        response_text = await self.agenerate_response(
+            format_batch([text for _, text in items]),
+            max_tokens=min(MAX_TOKENS_PER_EMAIL * len(items), MAX_BATCH_TOKENS),
+            stream=False, model=model)
+        with self.metrics.span('parse'):
+            answers = parse_batch_response(response_text)
+
+        decisions = {}
+        failed = []
+        for number, (key, text) in enumerate(items, start=1):
+            if number in answers:
+                decisions[key] = answers[number]
+            else:
+                failed.append((key, text))
+
+        if not failed:
+            return decisions
+
+        if len(failed) < len(items):
+            logging.warning(
+                f"Batch answer is missing {len(failed)} of {len(items)} emails, asking again for those")
+            decisions.update(await self.aclassify_batch(dict(failed), model=model))
+        else:
+            logging.warning(
+                f"Could not parse the answer for a batch of {len(items)} emails, splitting it")
+            middle = len(items) // 2
+            for part in await asyncio.gather(self.aclassify_batch(dict(items[:middle]), model=model),
+                                             self.aclassify_batch(dict(items[middle:]), model=model)):
+                decisions.update(part)
+        return decisions
+
+    async def agenerate_response(self, user_input, max_tokens=MAX_TOKENS_PER_EMAIL, stream=None,
+                                 model=None):
+        """
+        Generate a response for the given user input (coroutine version).
+
+        Args:
+            user_input: The user's message/query
+            max_tokens: Completion token limit
+            stream: Override the client's streaming setting for this request
+            model: Model for this request (None for the client's model)
+
+        Returns:
+            Generated text response
+
+        Raises:
+            LLMUnavailableError: If the API stays unreachable after retries
         """
         try:
             input_length = len(user_input)
-            logging.debug(
-                f"Generating response for input of length {input_length} characters")
+            logging.debug("Generating response for input of length %s characters", input_length)
 
             messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": f"Generate response for: {user_input}"}
+                self._system_message,
+                {"role": "user", "content": USER_PREFIX + user_input}
             ]
 
-            logging.debug(
-                f"Sending request to DeepSeek API model: {self.model}")
+            model = model or self.model
+            logging.debug("Sending request to DeepSeek API model: %s", model)
+
+            if self.stream if stream is None else stream:
+                return await self._call_api(lambda: self._stream_completion(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    timeout=self.model_timeouts.get(model, self.timeout),
+                    **self._request_options
+                ), model)
 
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = await self._create_completion(
+                model=model,
                 messages=messages,
-                max_tokens=1000
+                max_tokens=max_tokens,
+                timeout=self.model_timeouts.get(model, self.timeout),
+                **self._request_options
             )
 
+            self._record_usage(response, model)
+
             generated_content = response.choices[0].message.content
-            logging.debug(
-                f"Received response of length {len(generated_content)} characters")
+            logging.debug("Received response of length %s characters", len(generated_content))
 
             return generated_content
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             logging.error(f"Error generating LLM response: {str(e)}", exc_info=logging.getLogger(
             ).level == logging.DEBUG)
             return f"Error: {str(e)}"
 
+    async def _stream_completion(self, **kwargs):
+        """
+        Stream a completion, stopping once the decision is known and needs no body.
+
+        Returns:
+            str: The generated text; when stopped early, the type line followed
+            by a note in place of the reason
+        """
+        started = time.monotonic()
+        stream = await self.client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **kwargs)
+
+        content = ""
+        reasoning_length = 0
+        usage = None
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+
+                delta = chunk.choices[0].delta
+                reasoning_length += len(getattr(delta,
+                                        'reasoning_content', None) or '')
+                if not delta.content:
+                    continue
+
+                content += delta.content
+                match = _DECISION_HEAD[0].search(content) or _DECISION_HEAD[1].search(content)
+                if match and match.group(1).strip().lower() in BODYLESS_TYPES:
+                    elapsed = time.monotonic() - started
+                    # The final usage chunk never arrives, so estimate it
+                    prompt_tokens = estimate_tokens(
+                        "".join(m["content"] for m in kwargs["messages"]))
+                    with self._usage_lock:
+                        self.streamed += 1
+                        self.early_stops += 1
+                        self.decision_seconds += elapsed
+                    self._add_usage(kwargs["model"], prompt_tokens,
+                                    estimate_tokens(content) + reasoning_length // 4, 0, 0)
+                    logging.debug(
+                        "Decision '%s' known after %.2fs, stopping stream",
+                        match.group(1), elapsed)
+                    confidence = int(match.group(2)) if match.group(2) is not None else None
+                    return json.dumps({"type": match.group(1).strip(), "confidence": confidence,
+                                       "reason": "Stream stopped once the decision was known"})
+        finally:
+            await stream.close()
+
+        elapsed = time.monotonic() - started
+        with self._usage_lock:
+            self.streamed += 1
+            self.decision_seconds += elapsed
+        if usage is not None:
+            self._record_usage(SimpleNamespace(usage=usage), kwargs["model"])
+
+        logging.debug(
+            "Received streamed response of length %s characters in %.2fs",
+            len(content), elapsed)
+        return content
+
+    async def _create_completion(self, **kwargs):
+        """Call the chat completions API with retries and the circuit breaker."""
+        return await self._call_api(lambda: self.client.chat.completions.create(**kwargs),
+                                    kwargs['model'])
+
+    async def _call_api(self, request, model):
+        """
+        Run an API request with retries and the circuit breaker.
+
+        Rate limits, server errors and timeouts are retried with jittered
+        exponential backoff, honouring Retry-After, as long as the retry can
+        start before the deadline; a retry waits at most until the deadline.
+        Persistent failures and account problems raise LLMUnavailableError.
+
+        Args:
+            request: Zero-argument callable returning the awaitable to retry
+            model: Model the request goes to, for the request counts
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            raise LLMUnavailableError(str(e)) from e
+
+        for attempt in range(self.max_retries + 1):
+            self.metrics.count('llm_api_calls', model=model)
+            deadline = self.deadline()
+            try:
+                if attempt and deadline is not None:
+                    response = await asyncio.wait_for(request(), deadline - time.monotonic())
+                else:
+                    response = await request()
+                self.breaker.record_success()
+                return response
+
+            except ACCOUNT_ERRORS as e:
+                self.breaker.record_failure()
+                raise LLMUnavailableError(
+                    f"DeepSeek API rejected the account: {str(e)}") from e
+
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError(
+                        f"DeepSeek API unavailable after {attempt + 1} attempt(s): {str(e)}") from e
+
+                response = getattr(e, 'response', None)
+                retry_after = parse_retry_after(
+                    response.headers.get('retry-after') if response is not None else None)
+                delay = backoff_delay(attempt, LLM_RETRY_BASE_DELAY,
+                                      LLM_RETRY_MAX_DELAY, retry_after)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError(
+                        f"DeepSeek API unavailable after {attempt + 1} attempt(s), no time left "
+                        f"in the run to retry: {str(e) or 'request timed out'}") from e
+                with self._usage_lock:
+                    self.retries += 1
+                self.metrics.count('llm_retries', model=model)
+                logging.warning(
+                    f"DeepSeek API request failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+            except Exception:
+                # The request itself is bad; the API is fine
+                self.breaker.record_success()
+                raise
+
+    @property
+    def total_tokens(self):
+        """Prompt and completion tokens used by this client so far."""
+        with self._usage_lock:
+            return self.prompt_tokens + self.completion_tokens
+
+    def _record_usage(self, response, model):
+        """Add the token usage reported with a response to the running totals."""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+
+        # DeepSeek reports context cache use in extra usage fields
+        cache_hit = getattr(usage, 'prompt_cache_hit_tokens', None)
+        cache_miss = getattr(usage, 'prompt_cache_miss_tokens', None)
+        if cache_hit is None:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            cache_hit = getattr(details, 'cached_tokens', None) or 0
+            cache_miss = (usage.prompt_tokens or 0) - cache_hit
+
+        self._add_usage(model, usage.prompt_tokens or 0, usage.completion_tokens or 0,
+                        cache_hit, cache_miss or 0)
+        logging.debug(
+            "Token usage: %s prompt (%s from cache), %s completion",
+            usage.prompt_tokens, cache_hit, usage.completion_tokens)
+
+    def _add_usage(self, model, prompt_tokens, completion_tokens, cache_hit, cache_miss):
+        """Add token counts to the running totals and to those of the model."""
+        with self._usage_lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cache_hit_tokens += cache_hit
+            self.cache_miss_tokens += cache_miss
+            usage = self.usage_by_model.setdefault(model, {
+                'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                'cache_hit_tokens': 0, 'cache_miss_tokens': 0})
+            usage['requests'] += 1
+            usage['prompt_tokens'] += prompt_tokens
+            usage['completion_tokens'] += completion_tokens
+            usage['cache_hit_tokens'] += cache_hit
+            usage['cache_miss_tokens'] += cache_miss
+        self.metrics.count('llm_tokens', prompt_tokens, model=model, direction='in')
+        self.metrics.count('llm_tokens', completion_tokens, model=model, direction='out')
+
     def parse_response(self, response_text):
         """
         Parse the structured response from the LLM.
 
-        Expected format:
-        <Type>: [answer, forward to human, ignore]
-        <Response>: [response content]
-        <Response email>: [email to send the response to]
-        <Reason>: [explanation]
+        Expected format, as a JSON object:
+        {"type": "answer" | "forward to human" | "ignore", "confidence": 0-100,
+         "response": "...", "response_email": "...", "reason": "..."}
+        The legacy tagged format (<Type>: ...) is accepted as well.
 
         Args:
             response_text: The raw response from the LLM
 
         Returns:
-            dict: Contains 'type', 'response', 'response_email', and 'reason' keys
+            Decision: The parsed decision; 'forward to human' with the parse
+            error as the reason if the response holds no valid decision
         """
+        logging.debug("Parsing structured LLM response")
         try:
-            logging.debug("Parsing structured LLM response")
-
-            # Initialize default values
-            parsed = {
-                'type': 'forward to human',  # Default to human review if parsing fails
-                'response': '',
-                'response_email': '',  # New field for recipient email
-                'reason': 'Failed to parse LLM response'
-            }
-
-            # Extract type
-            type_match = re.search(r'<Type>:\s*(.*?)(?:\n|$)', response_text)
-            if type_match:
-                parsed['type'] = type_match.group(1).strip().lower()
-                logging.debug(f"Parsed type: {parsed['type']}")
-
-            # Extract response
-            response_match = re.search(
-                r'<Response>:\s*(.*?)(?=<Response email>|<Reason>|\Z)', response_text, re.DOTALL)
-            if response_match:
-                parsed['response'] = response_match.group(1).strip()
-                logging.debug(
-                    f"Response length: {len(parsed['response'])} characters")
-
-            # Extract response email
-            email_match = re.search(
-                r'<Response email>:\s*(.*?)(?=<Reason>|\Z)', response_text, re.DOTALL)
-            if email_match:
-                parsed['response_email'] = email_match.group(1).strip()
-                logging.debug(f"Response email: {parsed['response_email']}")
-
-            # Extract reason
-            reason_match = re.search(
-                r'<Reason>:\s*(.*?)(?=<|\Z)', response_text, re.DOTALL)
-            if reason_match:
-                parsed['reason'] = reason_match.group(1).strip()
-                logging.debug(f"Reason: {parsed['reason']}")
-
-            # Validate parsed type
-            valid_types = ['answer', 'forward to human', 'ignore']
-            if parsed['type'] not in valid_types:
-                logging.warning(
-                    f"Invalid response type: {parsed['type']}. Defaulting to 'forward to human'")
-                parsed['type'] = 'forward to human'
-                parsed['reason'] = f"Invalid response type: {parsed['type']}. {parsed['reason']}"
-
-            return parsed
+            with self.metrics.span('parse'):
+                decision = parse_decision(response_text)
+        except DecisionFormatError as e:
+            logging.warning(f"{str(e)}. Defaulting to 'forward to human'")
+            return Decision(type='forward to human',
+                            reason=f"{str(e)}. {e.reason}" if e.reason else str(e))
 
-        except Exception as e:
-            logging.error(f"Error parsing LLM response: {str(e)}", exc_info=logging.getLogger(
-            ).level == logging.DEBUG)
-            return {
-                'type': 'forward to human',
-                'response': '',
-                'response_email': '',
-                'reason': f"Error parsing response: {str(e)}"
-            }
+        logging.debug(
+            "Parsed type: %s, confidence: %s, response length: %s characters, "
+            "response email: %s, reason: %s", decision.type, decision.confidence,
+            len(decision.response), decision.response_email, decision.reason)
+        return decision
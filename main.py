@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 import os
+import json
 import time
 import logging
 import argparse
-from email_bot import EmailBot
+from contextlib import nullcontext
+from startup import StartupTimer
+from config import (DEFAULT_MAX_WORKERS, DEFAULT_RATE_LIMIT, DEFAULT_PAGE_SIZE, DEFAULT_MAX_SECONDS,
+                    DECISION_CACHE_FILE, NEAR_DUPLICATE_INDEX_FILE, PRECLASSIFIER_FILE, LEDGER_FILE, LLM_TIMEOUT,
+                    DEFAULT_LLM_BATCH_SIZE, DAEMON_LISTEN_HOST, DAEMON_LISTEN_PORT,
+                    DAEMON_POLL_INTERVAL, LLM_INPUT_TOKEN_BUDGET, LLM_FAST_MODEL, LLM_REASONER_TIMEOUT)
 import sys
 if os.path.exists(".env"):
     from dotenv import load_dotenv
@@ -54,6 +60,182 @@ def parse_args():
         default='INFO',
         help='Set the logging level (default: INFO)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f'Number of messages processed concurrently (default: {DEFAULT_MAX_WORKERS})'
+    )
+    parser.add_argument(
+        '--rate-limit',
+        type=float,
+        default=DEFAULT_RATE_LIMIT,
+        help=f'Maximum messages started per second, 0 to disable (default: {DEFAULT_RATE_LIMIT})'
+    )
+    parser.add_argument(
+        '--no-batch',
+        action='store_true',
+        help='Send every Gmail request on its own instead of using batch requests'
+    )
+    parser.add_argument(
+        '--sync',
+        choices=['full', 'incremental'],
+        default='full',
+        help='Search the whole inbox, or only read mailbox history since the last run (default: full)'
+    )
+    parser.add_argument(
+        '--page-size',
+        type=int,
+        default=DEFAULT_PAGE_SIZE,
+        help=f'Messages listed and processed per page (default: {DEFAULT_PAGE_SIZE})'
+    )
+    parser.add_argument(
+        '--max-seconds',
+        type=float,
+        default=DEFAULT_MAX_SECONDS,
+        help=f'Stop taking new messages after this many seconds (default: {DEFAULT_MAX_SECONDS})'
+    )
+    parser.add_argument(
+        '--max-gmail-units',
+        type=int,
+        help='Stop taking new messages after spending this many Gmail quota units'
+    )
+    parser.add_argument(
+        '--max-llm-tokens',
+        type=int,
+        help='Stop taking new messages after spending this many LLM tokens'
+    )
+    parser.add_argument(
+        '--no-decision-cache',
+        action='store_true',
+        help='Always ask the LLM instead of reusing cached decisions'
+    )
+    parser.add_argument(
+        '--no-near-duplicates',
+        action='store_true',
+        help='Do not reuse "ignore" decisions for near-duplicate emails'
+    )
+    parser.add_argument(
+        '--no-preclassifier',
+        action='store_true',
+        help='Send every email to the LLM instead of skipping obvious ignores locally'
+    )
+    parser.add_argument(
+        '--no-ledger',
+        action='store_true',
+        help='Do not keep the local log of processed messages used to resume interrupted work'
+    )
+    parser.add_argument(
+        '--llm-timeout',
+        type=float,
+        default=LLM_TIMEOUT,
+        help=f'Seconds to wait for a single LLM API request to the fast model (default: {LLM_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--llm-reasoner-timeout',
+        type=float,
+        default=LLM_REASONER_TIMEOUT,
+        help=f'Seconds to wait for a single LLM API request to the reasoning model '
+             f'(default: {LLM_REASONER_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Stream LLM responses and stop as soon as an email is known to need no reply'
+    )
+    parser.add_argument(
+        '--llm-batch-size',
+        type=int,
+        default=DEFAULT_LLM_BATCH_SIZE,
+        help=f'Emails classified together in one LLM request (default: {DEFAULT_LLM_BATCH_SIZE})'
+    )
+    parser.add_argument(
+        '--fast-model',
+        default=LLM_FAST_MODEL,
+        help=f'Model that decides first; replies and uncertain emails go to the main model '
+             f'(default: {LLM_FAST_MODEL})'
+    )
+    parser.add_argument(
+        '--no-routing',
+        action='store_true',
+        help='Send every email straight to the main model'
+    )
+    parser.add_argument(
+        '--input-token-budget',
+        type=int,
+        default=LLM_INPUT_TOKEN_BUDGET,
+        help=f'Approximate tokens of email body sent to the LLM per message, 0 for no limit '
+             f'(default: {LLM_INPUT_TOKEN_BUDGET})'
+    )
+    parser.add_argument(
+        '--startup-report',
+        action='store_true',
+        help='Log where start-up time went: slowest imports and initialization phases'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        help='Write stage timings and API, token and decision counters to this file after '
+             'every run, e.g. for the node_exporter textfile collector'
+    )
+    parser.add_argument(
+        '--metrics-format',
+        choices=['prometheus', 'openmetrics'],
+        default='prometheus',
+        help='Format of the metrics file (default: prometheus)'
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='FILE',
+        help='Profile the run and write the result to this file (cProfile: pstats data, '
+             'pyinstrument: HTML if the name ends in .html, text otherwise)'
+    )
+    parser.add_argument(
+        '--profiler',
+        choices=['cprofile', 'pyinstrument'],
+        default='cprofile',
+        help='Profiler used by --profile; pyinstrument samples only the main thread, and '
+             'on Python 3.12+ cProfile cannot profile threads separately, so use --workers 1 '
+             'for exact numbers there (default: cprofile)'
+    )
+    parser.add_argument(
+        '--trace-alloc',
+        action='store_true',
+        help='Log the top memory allocation sites of each pipeline stage, sampled from its first '
+             'spans (slows the run; exact with --workers 1)'
+    )
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Keep running and process new mail as it arrives (implies --sync incremental)'
+    )
+    parser.add_argument(
+        '--watch-topic',
+        default=os.environ.get("GMAIL_PUBSUB_TOPIC"),
+        help='Pub/Sub topic Gmail publishes inbox changes to, projects/<project>/topics/<topic> '
+             '(default: $GMAIL_PUBSUB_TOPIC; without it the daemon polls)'
+    )
+    parser.add_argument(
+        '--listen-host',
+        default=DAEMON_LISTEN_HOST,
+        help=f'Address of the push notification endpoint (default: {DAEMON_LISTEN_HOST})'
+    )
+    parser.add_argument(
+        '--listen-port',
+        type=int,
+        default=DAEMON_LISTEN_PORT,
+        help=f'Port of the push notification endpoint (default: {DAEMON_LISTEN_PORT})'
+    )
+    parser.add_argument(
+        '--no-listen',
+        action='store_true',
+        help='Do not open the push notification endpoint'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=DAEMON_POLL_INTERVAL,
+        help=f'Longest wait between daemon runs in seconds (default: {DAEMON_POLL_INTERVAL})'
+    )
     return parser.parse_args()
 
 
@@ -71,8 +253,66 @@ def main():
         logging.info("Starting email bot with log level: %s", args.log_level)
         logging.info("GMAIL_TOKEN_JSON: %s",
                      os.environ.get("GMAIL_TOKEN_JSON"))
-        bot = EmailBot()
-        bot.process_emails()
+
+        # Imported here so the import time shows up in the start-up report
+        startup_timer = StartupTimer()
+        with startup_timer.track_imports():
+            from email_bot import EmailBot
+            from metrics import Metrics
+
+        metrics = Metrics(path=args.metrics_file, openmetrics=args.metrics_format == 'openmetrics')
+
+        bot = EmailBot(max_workers=args.workers,
+                       rate_limit=args.rate_limit,
+                       batch_requests=not args.no_batch,
+                       sync_mode='incremental' if args.daemon else args.sync,
+                       page_size=args.page_size,
+                       max_seconds=args.max_seconds,
+                       max_gmail_units=args.max_gmail_units,
+                       max_llm_tokens=args.max_llm_tokens,
+                       decision_cache_path=None if args.no_decision_cache else DECISION_CACHE_FILE,
+                       near_duplicate_index_path=None if args.no_near_duplicates else NEAR_DUPLICATE_INDEX_FILE,
+                       preclassifier_path=None if args.no_preclassifier else PRECLASSIFIER_FILE,
+                       llm_timeout=args.llm_timeout,
+                       llm_reasoner_timeout=args.llm_reasoner_timeout,
+                       stream_llm=args.stream,
+                       llm_batch_size=args.llm_batch_size,
+                       startup_timer=startup_timer,
+                       ledger_path=None if args.no_ledger else LEDGER_FILE,
+                       input_token_budget=args.input_token_budget or None,
+                       fast_model=None if args.no_routing else args.fast_model,
+                       metrics=metrics)
+        profiler = None
+        if args.profile:
+            from profiling import RunProfiler
+            profiler = RunProfiler(args.profile, args.profiler)
+        allocations = None
+        if args.trace_alloc:
+            from profiling import AllocationTracer
+            allocations = metrics.allocations = AllocationTracer()
+            allocations.start()
+        try:
+            with profiler.profile() if profiler else nullcontext():
+                if args.daemon:
+                    from daemon import EmailDaemon
+                    EmailDaemon(bot,
+                                watch_topic=args.watch_topic,
+                                listen_host=args.listen_host,
+                                listen_port=None if args.no_listen else args.listen_port,
+                                poll_interval=args.poll_interval,
+                                webhook_token=os.environ.get("DAEMON_WEBHOOK_TOKEN")).run()
+                else:
+                    bot.process_emails()
+        finally:
+            bot.close()
+            if args.startup_report:
+                for line in startup_timer.report():
+                    logging.info(line)
+            if allocations:
+                for line in allocations.report():
+                    logging.info(line)
+                allocations.stop()
+            logging.info("Run metrics: %s", json.dumps(metrics.summary()))
         logging.info("Email processing complete")
     except Exception as e:
         logging.error("Error in main function: %s", str(e),
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Prefix of the exported metric names
+NAMESPACE = 'emailbot'
+
+# Stages timed with Metrics.span, in pipeline order
+STAGES = ('fetch', 'thread_check', 'extract', 'llm', 'parse', 'send', 'label')
+
+# Help text of the exported counters
+COUNTER_HELP = {
+    'gmail_api_calls': 'Gmail API requests by method',
+    'llm_api_calls': 'LLM API request attempts by model',
+    'llm_retries': 'LLM API requests retried after a transient error',
+    'llm_tokens': 'LLM tokens by model and direction (in: prompt, out: completion)',
+    'decisions': 'Decisions acted on by type',
+    'messages_processed': 'Messages processed to completion',
+}
+
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Metrics:
+    """
+    Stage timings and counters of the bot, kept for the life of the process.
+
+    Spans time a stage of the pipeline; they may nest (the llm stage includes
+    parsing the answer) and run on several threads at once, so stage times
+    add up to more than the wall time of a run. Counters only go up, as
+    Prometheus expects.
+    """
+
+    def __init__(self, path=None, openmetrics=False):
+        """
+        Initialize the metrics.
+
+        Args:
+            path: File the metrics are exported to by export() (None to not export)
+            openmetrics: Export in the OpenMetrics format instead of the
+                Prometheus text format
+        """
+        self.path = path
+        self.openmetrics = openmetrics
+        self.stages = {}
+        self.counters = {}
+        self.started = time.time()
+        # AllocationTracer that spans report to (see profiling.py), or None
+        self.allocations = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        """Time a stage of the pipeline, and trace its allocations if enabled."""
+        tracing = self.allocations.trace(stage) if self.allocations is not None else nullcontext()
+        with tracing:
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    timing = self.stages.setdefault(stage, [0, 0.0, 0.0])
+                    timing[0] += 1
+                    timing[1] += elapsed
+                    timing[2] = max(timing[2], elapsed)
+
+    def count(self, name, value=1, **labels):
+        """Add to a counter, optionally labelled (e.g. model='deepseek-chat')."""
+        if not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self):
+        """
+        The metrics as a JSON-serializable dict.
+
+        Returns:
+            dict: 'stages' (calls, total, mean and max seconds per stage, in
+            pipeline order) and 'counters' (totals, with one entry per label
+            set as "name{label=value}")
+        """
+        with self._lock:
+            stages = {stage: list(timing) for stage, timing in self.stages.items()}
+            counters = dict(self.counters)
+
+        order = {stage: index for index, stage in enumerate(STAGES)}
+        return {
+            'uptime_seconds': round(time.time() - self.started, 3),
+            'stages': {
+                stage: {'calls': calls, 'seconds': round(total, 3),
+                        'mean_ms': round(total / calls * 1000, 1), 'max_ms': round(longest * 1000, 1)}
+                for stage, (calls, total, longest) in sorted(
+                    stages.items(), key=lambda item: order.get(item[0], len(order)))
+            },
+            'counters': {
+                name + ('{' + ','.join(f'{label}={value}' for label, value in labels) + '}'
+                        if labels else ''): value
+                for (name, labels), value in sorted(counters.items())
+            },
+        }
+
+    def render(self):
+        """The metrics in the Prometheus text format, or OpenMetrics if configured."""
+        with self._lock:
+            stages = {stage: list(timing) for stage, timing in self.stages.items()}
+            counters = dict(self.counters)
+
+        lines = []
+        stage_name = f'{NAMESPACE}_stage_seconds'
+        lines.append(f'# HELP {stage_name} Time spent in each pipeline stage')
+        lines.append(f'# TYPE {stage_name} summary')
+        for stage, (calls, total, _) in sorted(stages.items()):
+            lines.append(f'{stage_name}_sum{_labels([("stage", stage)])} {total:.6f}')
+            lines.append(f'{stage_name}_count{_labels([("stage", stage)])} {calls}')
+        max_name = f'{NAMESPACE}_stage_max_seconds'
+        lines.append(f'# HELP {max_name} Longest single span of each pipeline stage')
+        lines.append(f'# TYPE {max_name} gauge')
+        for stage, (_, _, longest) in sorted(stages.items()):
+            lines.append(f'{max_name}{_labels([("stage", stage)])} {longest:.6f}')
+
+        by_name = {}
+        for (name, labels), value in sorted(counters.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        for name, samples in by_name.items():
+            # OpenMetrics names the counter without the _total its samples carry
+            family = f'{NAMESPACE}_{name}' if self.openmetrics else f'{NAMESPACE}_{name}_total'
+            lines.append(f'# HELP {family} {COUNTER_HELP.get(name, name)}')
+            lines.append(f'# TYPE {family} counter')
+            for labels, value in samples:
+                lines.append(f'{NAMESPACE}_{name}_total{_labels(labels)} {value}')
+
+        if self.openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Write the metrics to the configured file, replacing it atomically."""
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            file.write(self.render())
+        os.replace(temporary, self.path)
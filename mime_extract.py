@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import re
+import codecs
+import base64
+import logging
+
+from config import MAX_EMAIL_CHARS
+
+# HTML carries far more bytes than the text it renders to
+_HTML_BYTES_PER_CHAR = 16
+# Czech and Cyrillic letters take two bytes in UTF-8
+_TEXT_BYTES_PER_CHAR = 2
+
+_CHARSET = re.compile(r'charset\s*=\s*"?([\w.:-]+)', re.IGNORECASE)
+_BLANK_LINES = re.compile(r'\n\s*\n\s*(?:\n\s*)+')
+
+# Lines that introduce the quoted previous message (English, Czech, Slovak,
+# German and Ukrainian mail clients) or an Outlook-style forwarded header.
+# Anchored on '\n' rather than '^' with re.MULTILINE, which lets the regex
+# engine skip ahead to line breaks instead of trying every position.
+_QUOTE_HEADER = re.compile(
+    r'\n(?:On\s[^\n]{0,200}\swrote:'
+    r'|Dne\s[^\n]{0,200}\snapsal(?:\(a\)|a)?:'
+    r'|Dňa\s[^\n]{0,200}\snapísal(?:\(a\)|a)?:'
+    r'|Am\s[^\n]{0,200}\sschrieb\s[^\n]{0,200}:'
+    r'|[^\n]{0,200}\sпише:'
+    r'|-{2,}[ \t]*(?:Original Message|Původní zpráva|Ursprüngliche Nachricht)[ \t]*-{2,}'
+    r'|_{20,})[ \t]*(?=\n|$)',
+    re.IGNORECASE)
+# RFC 3676 signature delimiter and the usual mobile footers
+_SIGNATURE = re.compile(
+    r'\n(?:--[ \t]?|Sent from my \w[^\n]*|Odesláno z \w[^\n]*|Von meinem \w[^\n]* gesendet)'
+    r'[ \t]*(?=\n|$)')
+
+
+def extract_text(payload, max_chars=MAX_EMAIL_CHARS):
+    """
+    Extract the readable text of a Gmail message payload.
+
+    The MIME tree is walked once without recursion. Only the chosen part is
+    decoded, and only as much of it as max_chars can use: the first
+    text/plain part, or the first text/html part converted to text when the
+    message has no plain part. Quoted replies and signatures are removed.
+
+    Args:
+        payload: The message payload (mimeType, headers, filename, body, parts)
+        max_chars: Longest text returned
+
+    Returns:
+        str: The extracted text, or "" if there is none
+    """
+    logging.debug("Extracting email content from payload")
+    try:
+        part = html_part = None
+        stack = [payload]
+        while stack:
+            node = stack.pop()
+            if node.get('parts'):
+                # Reversed, so parts are visited in their original order
+                stack.extend(reversed(node['parts']))
+                continue
+            if node.get('filename') or 'data' not in node.get('body', {}):
+                continue
+            mime_type = node.get('mimeType', '').lower()
+            if mime_type == 'text/plain':
+                part = node
+                break
+            if mime_type == 'text/html' and html_part is None:
+                html_part = node
+
+        if part is not None:
+            logging.debug("Found text/plain part")
+            text = _decode_part(part, max_chars * _TEXT_BYTES_PER_CHAR)
+        elif html_part is not None:
+            logging.debug("No text/plain part, converting text/html")
+            text = html_to_text(_decode_part(html_part, max_chars * _HTML_BYTES_PER_CHAR))
+        else:
+            logging.warning("No email content could be extracted")
+            return ""
+
+        content = _normalize(strip_quotes(text[:max_chars]))
+        logging.debug("Extracted email content of length: %s characters", len(content))
+        return content
+
+    except Exception as e:
+        logging.error(f"Error extracting email content: {str(e)}", exc_info=logging.getLogger(
+        ).level == logging.DEBUG)
+        return ""
+
+
+def part_charset(part):
+    """
+    Look up the declared charset of a MIME part.
+
+    Returns:
+        str: The codec name for the charset, or 'utf-8' if it is missing or unknown
+    """
+    for header in part.get('headers') or ():
+        if header['name'].lower() == 'content-type':
+            match = _CHARSET.search(header['value'])
+            if match:
+                try:
+                    return codecs.lookup(match.group(1)).name
+                except LookupError:
+                    logging.debug("Unknown charset %s, assuming UTF-8", match.group(1))
+            break
+    return 'utf-8'
+
+
+def _decode_part(part, max_bytes):
+    """Decode at most max_bytes of a part's base64url body data into text."""
+    data = part['body']['data']
+    # Four base64 characters encode three bytes
+    data = data[:(max_bytes + 2) // 3 * 4]
+    data += '=' * (-len(data) % 4)
+    return base64.urlsafe_b64decode(data).decode(part_charset(part), errors='replace')
+
+
+def html_to_text(html):
+    """Render HTML to plain text, leaving out scripts, styles and quoted replies."""
+    # Imported here: most mail has a text/plain part and never needs the parser
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for element in soup(['script', 'style', 'head', 'blockquote']):
+        element.decompose()
+    for element in soup.select('.gmail_quote, .gmail_signature, #divRplyFwdMsg'):
+        element.decompose()
+    return soup.get_text('\n')
+
+
+def strip_quotes(text):
+    """
+    Remove quoted replies and the signature from a plain-text body.
+
+    Everything after a reply header ("On ... wrote:") or a signature
+    delimiter is dropped, as are lines quoted with '>'. When that would leave
+    nothing (e.g. a bare forward), the text is returned unchanged.
+    """
+    cut = len(text)
+    for pattern in (_QUOTE_HEADER, _SIGNATURE):
+        match = pattern.search(text, 0, cut)
+        if match:
+            cut = match.start()
+
+    stripped = '\n'.join(line for line in text[:cut].splitlines()
+                         if not line.lstrip().startswith('>'))
+    return stripped if stripped.strip() else text
+
+
+def _normalize(text):
+    """Trim trailing whitespace on lines and collapse runs of blank lines."""
+    text = '\n'.join(line.rstrip() for line in text.replace('\r\n', '\n').split('\n'))
+    return _BLANK_LINES.sub('\n\n', text).strip()
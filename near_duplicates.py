@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+from compaction import key_lines
+
+# Masks for the parts that change between otherwise identical notifications
+_EMAILS = re.compile(r'\S+@\S+')
+_URLS = re.compile(r'https?://\S+')
+_NUMBERS = re.compile(r'\d+')
+_WORDS = re.compile(r'\w+')
+
+SHINGLE_SIZE = 3
+SIGNATURE_BITS = 64
+BANDS = 4
+BAND_BITS = SIGNATURE_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Decision types are stored as one byte each
+TYPE_CODES = {'answer': 1, 'forward to human': 2, 'ignore': 3}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+_MAGIC = b'SIMH'
+_VERSION = 2
+_HEADER = struct.Struct('<4sI8sI')
+
+
+def _mask(text):
+    """Casefold text and mask the email addresses, URLs and numbers in it."""
+    text = _EMAILS.sub(' email ', text.casefold())
+    text = _URLS.sub(' url ', text)
+    return _NUMBERS.sub('0', text)
+
+
+def simhash(text):
+    """
+    Compute a 64-bit SimHash of an email's word shingles.
+
+    Email addresses, URLs and numbers are masked first, so notifications
+    that differ only in request IDs, dates or contact details hash close together.
+    """
+    words = _WORDS.findall(_mask(text))
+
+    if len(words) < SHINGLE_SIZE:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + SHINGLE_SIZE])
+                    for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * SIGNATURE_BITS
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(
+            shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for bit in range(SIGNATURE_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    signature = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def key_digest(text):
+    """
+    Compute a 64-bit digest of an email's location, service and contact lines.
+
+    A single place name barely moves the SimHash of a long template, so two
+    notifications only count as near-duplicates if these lines match exactly
+    (after the same masking as simhash, so contact addresses may differ).
+    """
+    lines = [' '.join(_WORDS.findall(_mask(line))) for line in key_lines(text)]
+    return int.from_bytes(hashlib.blake2b(
+        '\n'.join(lines).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class NearDuplicateIndex:
+    """
+    Persistent SimHash index of previously classified emails.
+
+    Signatures are split into four 16-bit bands. Any two signatures within
+    three bits of each other share at least one band exactly, so lookups
+    only compare against entries found by binary search in the per-band
+    sorted arrays instead of scanning the whole index. An entry only matches
+    if its key lines digest (see key_digest) is equal as well.
+    """
+
+    def __init__(self, path, namespace, max_entries, max_distance=3):
+        """
+        Initialize the index.
+
+        Args:
+            path: Binary file the index is stored in
+            namespace: Text identifying the prompt and model; an index built
+                with a different prompt or model is discarded
+            max_entries: Maximum number of signatures kept; the oldest go first
+            max_distance: Largest Hamming distance that counts as a near-duplicate
+                (at most BANDS - 1 for lookups to be exact)
+        """
+        self.path = path
+        self._namespace = hashlib.blake2b(
+            namespace.encode('utf-8'), digest_size=8).digest()
+        self.max_entries = max_entries
+        self.max_distance = min(max_distance, BANDS - 1)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._signatures = array('Q')
+        self._types = array('B')
+        self._keys = array('Q')
+        self._bands = [array('Q') for _ in range(BANDS)]
+        self._load()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _load(self):
+        """Load the index file, starting empty if it is missing or unusable."""
+        if not os.path.exists(self.path):
+            logging.debug("No near-duplicate index at %s, starting empty", self.path)
+            return
+
+        try:
+            with open(self.path, 'rb') as f:
+                magic, version, namespace, count = _HEADER.unpack(
+                    f.read(_HEADER.size))
+                if magic != _MAGIC or version != _VERSION:
+                    logging.warning(
+                        f"Ignoring near-duplicate index {self.path} with unsupported format")
+                    return
+                if namespace != self._namespace:
+                    logging.info(
+                        "Prompt or model changed, starting a new near-duplicate index")
+                    return
+
+                signatures = array('Q')
+                signatures.fromfile(f, count)
+                types = array('B')
+                types.fromfile(f, count)
+                keys = array('Q')
+                keys.fromfile(f, count)
+                bands = []
+                for _ in range(BANDS):
+                    band = array('Q')
+                    band.fromfile(f, count)
+                    bands.append(band)
+        except Exception as e:
+            logging.warning(
+                f"Could not read near-duplicate index {self.path}: {str(e)}")
+            return
+
+        if sys.byteorder != 'little':
+            for values in [signatures, keys] + bands:
+                values.byteswap()
+
+        self._signatures, self._types, self._keys, self._bands = signatures, types, keys, bands
+        logging.debug("Loaded near-duplicate index with %s signature(s)", count)
+
+    def save(self):
+        """Write the index to disk atomically if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            arrays = [self._signatures, self._types, self._keys] + self._bands
+            if sys.byteorder != 'little':
+                arrays = [array(values.typecode, values) for values in arrays]
+                for values in arrays:
+                    if values.typecode == 'Q':
+                        values.byteswap()
+
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(_HEADER.pack(_MAGIC, _VERSION, self._namespace,
+                                         len(self._signatures)))
+                    for values in arrays:
+                        values.tofile(f)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+                logging.debug(
+                    "Saved near-duplicate index with %s signature(s)",
+                    len(self._signatures))
+            except Exception as e:
+                logging.error(
+                    f"Could not save near-duplicate index {self.path}: {str(e)}")
+
+    def find(self, text):
+        """
+        Find the closest previously classified email.
+
+        Args:
+            text: Email text as sent to the LLM
+
+        Returns:
+            tuple: (decision type, similarity between 0 and 1) of the closest
+            entry within max_distance with the same key lines, or None if
+            there is none
+        """
+        signature = simhash(text)
+        key = key_digest(text)
+        best = None
+
+        with self._lock:
+            for band_index, band in enumerate(self._bands):
+                value = signature >> (band_index * BAND_BITS) & BAND_MASK
+                position = bisect_left(band, value << 32)
+                while position < len(band) and band[position] >> 32 == value:
+                    entry = band[position] & 0xFFFFFFFF
+                    position += 1
+                    if self._keys[entry] != key:
+                        continue
+                    distance = (self._signatures[entry] ^ signature).bit_count()
+                    # On ties prefer the decision that involves a human
+                    rank = (distance, self._types[entry] ==
+                            TYPE_CODES['ignore'])
+                    if distance <= self.max_distance and (best is None or rank < best[0]):
+                        best = (rank, entry)
+
+            if best is None:
+                return None
+
+            (distance, _), entry = best
+            return TYPE_NAMES[self._types[entry]], 1 - distance / SIGNATURE_BITS
+
+    def add(self, text, decision_type):
+        """
+        Record the decision made for an email.
+
+        Args:
+            text: Email text as sent to the LLM
+            decision_type: One of 'answer', 'forward to human' or 'ignore'
+        """
+        code = TYPE_CODES.get(decision_type)
+        if code is None:
+            return
+
+        signature = simhash(text)
+        key = key_digest(text)
+        with self._lock:
+            entry = len(self._signatures)
+            self._signatures.append(signature)
+            self._types.append(code)
+            self._keys.append(key)
+            for band_index, band in enumerate(self._bands):
+                value = signature >> (band_index * BAND_BITS) & BAND_MASK
+                insort(band, value << 32 | entry)
+            self._dirty = True
+
+            if len(self._signatures) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        """Drop the oldest tenth of the index and rebuild the bands (lock held)."""
+        drop = max(1, self.max_entries // 10)
+        self._signatures = self._signatures[drop:]
+        self._types = self._types[drop:]
+        self._keys = self._keys[drop:]
+
+        for band_index in range(BANDS):
+            shift = band_index * BAND_BITS
+            self._bands[band_index] = array('Q', sorted(
+                (signature >> shift & BAND_MASK) << 32 | entry
+                for entry, signature in enumerate(self._signatures)))
+
+        logging.debug("Evicted %s oldest near-duplicate signature(s)", drop)
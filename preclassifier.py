@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import math
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+# Place names (with common Czech, German and Ukrainian forms) of the countries
+# we operate in: Czech Republic, Ukraine, Germany, Slovakia, Austria
+OPERATED_PLACES = [
+    'czech republic', 'czechia', 'česko', 'česku', 'česká republika', 'české republice',
+    'ceska republika', 'tschechien', 'чехія',
+    'ukraine', 'ukrajina', 'ukrajině', 'україна', 'україні', 'украина',
+    'germany', 'deutschland', 'německo', 'německu', 'nemecko', 'німеччина',
+    'slovakia', 'slovensko', 'slovensku', 'slowakei', 'словаччина',
+    'austria', 'österreich', 'rakousko', 'rakousku', 'rakúsko', 'австрія',
+    'praha', 'praze', 'prahy', 'prague', 'prag', 'brno', 'brně', 'brne', 'ostrava',
+    'ostravě', 'plzeň', 'plzen', 'plzni', 'olomouc', 'liberec', 'pardubice',
+    'hradec králové', 'české budějovice', 'kladno', 'zlín', 'jihlava',
+    'kyiv', 'kiev', 'київ', 'києві', 'lviv', 'львів', 'odesa', 'одеса', 'kharkiv', 'харків',
+    'dnipro', 'дніпро',
+    'berlin', 'münchen', 'munich', 'hamburg', 'köln', 'cologne', 'frankfurt', 'dresden',
+    'leipzig', 'stuttgart', 'nürnberg', 'nuremberg',
+    'bratislava', 'bratislave', 'košice', 'kosice', 'žilina', 'nitra',
+    'wien', 'vienna', 'vídeň', 'vídni', 'graz', 'linz', 'salzburg', 'innsbruck',
+]
+
+# Place names of countries we do not operate in
+FOREIGN_PLACES = [
+    'poland', 'polska', 'polsko', 'polsku', 'polen', 'польща',
+    'hungary', 'magyarország', 'maďarsko', 'madarsko', 'ungarn',
+    'romania', 'rumunsko', 'rumänien', 'bulgaria', 'bulharsko',
+    'france', 'francie', 'frankreich', 'italy', 'itálie', 'italien',
+    'spain', 'španělsko', 'spanien', 'portugal', 'portugalsko',
+    'netherlands', 'nizozemsko', 'niederlande', 'belgium', 'belgie', 'belgien',
+    'switzerland', 'švýcarsko', 'schweiz', 'united kingdom', 'velká británie',
+    'england', 'anglie', 'ireland', 'irsko', 'united states', 'usa', 'spojené státy',
+    'russia', 'rusko', 'russland', 'belarus', 'bělorusko', 'moldova',
+    'croatia', 'chorvatsko', 'kroatien', 'slovenia', 'slovinsko', 'slowenien',
+    'denmark', 'dánsko', 'sweden', 'švédsko', 'norway', 'norsko', 'finland', 'finsko',
+    'warsaw', 'warszawa', 'varšava', 'kraków', 'krakow', 'krakov', 'wrocław', 'wroclaw',
+    'katowice', 'gdańsk', 'budapest', 'budapešť', 'paris', 'paříž', 'london', 'londýn',
+    'rome', 'řím', 'madrid', 'barcelona', 'amsterdam', 'brussels', 'zurich',
+    'zürich', 'geneva', 'dublin', 'bucharest',
+]
+
+# Words that mark a line as describing where the job is
+LOCATION_CUES = [
+    'location', 'address', 'city', 'region', 'country', 'place', 'site',
+    'lokalita', 'místo', 'misto', 'adresa', 'město', 'mesto', 'obec', 'kraj', 'země', 'zeme',
+    'ort', 'standort', 'stadt', 'adresse', 'land',
+    'місце', 'адреса', 'місто', 'країна',
+]
+
+
+def _phrase_pattern(phrases):
+    """Compile a case-insensitive whole-word alternation, longest phrases first."""
+    alternatives = '|'.join(re.escape(phrase)
+                            for phrase in sorted(phrases, key=len, reverse=True))
+    return re.compile(rf'(?<!\w)(?:{alternatives})(?!\w)')
+
+
+_OPERATED = _phrase_pattern(OPERATED_PLACES)
+_FOREIGN = _phrase_pattern(FOREIGN_PLACES)
+_LOCATION_CUE = _phrase_pattern(LOCATION_CUES)
+_TOKENS = re.compile(r'[^\W\d_]{2,}')
+
+# Largest number of tokens taken from one email for the naive Bayes model
+MAX_TOKENS = 500
+
+
+def tokenize(text):
+    """
+    Split text into word tokens for the naive Bayes model.
+
+    Words are casefolded and replaced by a short hash, so the stored model
+    holds no readable names, streets or other words from customer emails.
+    """
+    return [hashlib.blake2b(word.encode('utf-8'), digest_size=6).hexdigest()
+            for word in _TOKENS.findall(text.casefold())[:MAX_TOKENS]]
+
+
+class PreClassifier:
+    """
+    Offline, deterministic filter that catches obvious "ignore" emails before the LLM.
+
+    Two checks can short-circuit an email, and both only ever produce "ignore":
+
+    - Gazetteer: a line that describes the job location names a country or
+      city we don't operate in, and no place we do operate in appears anywhere.
+    - Naive Bayes: a word model trained on earlier LLM decisions is very
+      confident the email is an ignore. Its posteriors are far from
+      calibrated (templated mail pushes them to 1.0 whatever the job's
+      location), so it is only used for emails with no location line and
+      no known place name at all, where the location cannot decide.
+
+    Anything less certain is left to the LLM.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path, min_confidence, min_samples):
+        """
+        Initialize the pre-classifier.
+
+        Args:
+            path: JSON file storing the naive Bayes word counts
+            min_confidence: Posterior probability of "ignore" needed to skip the LLM
+            min_samples: Training emails needed in each class before the model is used
+        """
+        self.path = path
+        self.min_confidence = min_confidence
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._docs = {'ignore': 0, 'other': 0}
+        self._words = {'ignore': Counter(), 'other': Counter()}
+        self._load()
+        self._totals = {label: sum(counts.values())
+                        for label, counts in self._words.items()}
+        self._vocabulary = len(set(self._words['ignore']) |
+                               set(self._words['other']))
+
+    def _load(self):
+        """Load the model file, starting untrained if it is missing or unusable."""
+        if not os.path.exists(self.path):
+            logging.debug("No pre-classifier model at %s, starting untrained", self.path)
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except Exception as e:
+            logging.warning(
+                f"Could not read pre-classifier model {self.path}: {str(e)}")
+            return
+
+        if stored.get('version') != self.VERSION:
+            logging.warning(
+                f"Ignoring pre-classifier model {self.path} with unsupported version")
+            # Version 1 stored plain words; overwrite it on the next save
+            self._dirty = True
+            return
+
+        self._docs = stored['docs']
+        self._words = {label: Counter(counts)
+                       for label, counts in stored['words'].items()}
+        logging.debug(
+            "Loaded pre-classifier model trained on %s email(s)",
+            sum(self._docs.values()))
+
+    def save(self):
+        """Write the model to disk atomically if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            payload = {'version': self.VERSION, 'docs': self._docs,
+                       'words': {label: dict(counts) for label, counts in self._words.items()}}
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                logging.error(
+                    f"Could not save pre-classifier model {self.path}: {str(e)}")
+
+    def classify(self, text):
+        """
+        Decide whether an email is an obvious ignore.
+
+        Args:
+            text: Email text as sent to the LLM
+
+        Returns:
+            str: Reason for ignoring the email, or None if the LLM should decide
+        """
+        reason = self._check_location(text)
+        if reason:
+            return reason
+
+        if self._mentions_location(text):
+            return None
+
+        probability = self._ignore_probability(text)
+        if probability is not None and probability >= self.min_confidence:
+            return f"naive Bayes model gives P(ignore) = {probability:.4f}"
+
+        return None
+
+    def _check_location(self, text):
+        """Apply the gazetteer rule (see class docstring)."""
+        text = text.casefold()
+        if _OPERATED.search(text):
+            return None
+
+        for line in text.splitlines():
+            if not _LOCATION_CUE.search(line):
+                continue
+            match = _FOREIGN.search(line)
+            if match:
+                return f"job location mentions '{match.group(0)}', outside the countries we operate in"
+
+        return None
+
+    @staticmethod
+    def _mentions_location(text):
+        """Whether any line describes a location or any known place is named."""
+        text = text.casefold()
+        if _OPERATED.search(text) or _FOREIGN.search(text):
+            return True
+        return any(_LOCATION_CUE.search(line) for line in text.splitlines())
+
+    def _ignore_probability(self, text):
+        """Posterior probability of "ignore" under the naive Bayes model, or None if untrained."""
+        with self._lock:
+            if min(self._docs.values()) < self.min_samples:
+                return None
+
+            total_docs = sum(self._docs.values())
+            tokens = tokenize(text)
+            scores = {}
+            for label, counts in self._words.items():
+                denominator = self._totals[label] + self._vocabulary
+                score = math.log(self._docs[label] / total_docs)
+                for token in tokens:
+                    score += math.log((counts.get(token, 0) + 1) / denominator)
+                scores[label] = score
+
+        # Normalize the two log scores into a probability without overflow
+        difference = scores['other'] - scores['ignore']
+        if difference > 700:
+            return 0.0
+        return 1 / (1 + math.exp(difference))
+
+    def learn(self, text, decision_type):
+        """
+        Update the model with a decision made by the LLM.
+
+        Args:
+            text: Email text as sent to the LLM
+            decision_type: Type of the LLM decision
+        """
+        label = 'ignore' if decision_type == 'ignore' else 'other'
+        tokens = tokenize(text)
+        with self._lock:
+            for token in set(tokens):
+                if token not in self._words['ignore'] and token not in self._words['other']:
+                    self._vocabulary += 1
+            self._docs[label] += 1
+            self._words[label].update(tokens)
+            self._totals[label] += len(tokens)
+            self._dirty = True
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Python 3.12+ runs cProfile on sys.monitoring, which allows one active
+# profiler per interpreter, so threads cannot each get their own profile
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+# Allocations made by the tracing and the span bookkeeping are left out of the report
+_IGNORED_FILES = frozenset([
+    tracemalloc.__file__, __file__,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.py'),
+    '<unknown>',
+])
+
+
+def pyinstrument_available():
+    """Whether the optional pyinstrument sampling profiler is installed."""
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class RunProfiler:
+    """
+    Profiles a block of code and writes the result to a file.
+
+    cProfile is deterministic and follows every thread started inside the
+    block (worker threads, the LLM event loop), merging them into one pstats
+    file for snakeviz or `python -m pstats`. On Python 3.12+ only one
+    cProfile can be active, so the threads get no profiles of their own:
+    the main thread's profile picks up their calls too, but interleaved on
+    one call stack, which makes cumulative times unreliable; use --workers 1
+    there for exact numbers. pyinstrument samples only the
+    thread that entered the block, so it suits runs with --workers 1; it
+    writes an HTML report if the file name ends in .html, text otherwise.
+    """
+
+    def __init__(self, path, kind='cprofile'):
+        """
+        Initialize the profiler.
+
+        Args:
+            path: File the profile is written to
+            kind: 'cprofile', or 'pyinstrument' (falls back to cProfile if
+                pyinstrument is not installed)
+        """
+        if kind == 'pyinstrument' and not pyinstrument_available():
+            logging.warning("pyinstrument is not installed, profiling with cProfile")
+            kind = 'cprofile'
+        self.path = path
+        self.kind = kind
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self):
+        """Profile the block and write the result when it ends."""
+        if self.kind == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(self.path, 'w', encoding='utf-8') as file:
+                    file.write(profiler.output_html() if self.path.endswith('.html')
+                               else profiler.output_text(unicode=True))
+                logging.info(f"Wrote pyinstrument profile to {self.path}")
+            return
+
+        main = cProfile.Profile()
+        self._profiles = [main]
+        if PER_THREAD_PROFILES:
+            # Threads started in the block call this once and switch to their own profile
+            threading.setprofile(self._profile_thread)
+        else:
+            logging.info("Python %s.%s allows one cProfile at a time; calls of other threads are "
+                         "mixed into the main thread's profile", *sys.version_info[:2])
+        main.enable()
+        try:
+            yield
+        finally:
+            main.disable()
+            if PER_THREAD_PROFILES:
+                threading.setprofile(None)
+            stats = self._stats()
+            stats.dump_stats(self.path)
+            logging.info(f"Wrote cProfile stats of {len(self._profiles)} thread(s) to {self.path}")
+            for line in self.report(stats):
+                logging.info(line)
+
+    def _profile_thread(self, frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _stats(self):
+        """Merge the profiles of all threads."""
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            # Threads still running (e.g. the LLM event loop) are cut off here
+            profile.disable()
+            try:
+                stats.add(profile)
+            except TypeError:
+                # The thread never made a call while profiled
+                continue
+        return stats
+
+    @staticmethod
+    def report(stats, top=15):
+        """The functions with the most cumulative time, as log lines."""
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        return [line for line in output.getvalue().splitlines() if line.strip()]
+
+
+class AllocationTracer:
+    """
+    Attributes memory allocated with tracemalloc to the pipeline stages.
+
+    The first spans of each stage take a snapshot when they start and when
+    they end and add the growth per source line to the stage. Spans on other
+    threads allocate in between, so attribution is only exact with
+    --workers 1. Comparing snapshots takes time proportional to the traced
+    heap, so only a sample of spans is traced; this is meant for diagnosing
+    a run, not for production.
+    """
+
+    def __init__(self, frames=1, max_spans=10):
+        """
+        Initialize the tracer.
+
+        Args:
+            frames: Stack frames stored per allocation
+            max_spans: Spans traced per stage; later ones are only timed
+        """
+        self.frames = frames
+        self.max_spans = max_spans
+        self.sites = defaultdict(lambda: defaultdict(int))
+        self.spans = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start tracing allocations."""
+        tracemalloc.start(self.frames)
+
+    def stop(self):
+        """Stop tracing and free the traces."""
+        tracemalloc.stop()
+
+    @contextmanager
+    def trace(self, stage):
+        """Record the memory a stage allocated and did not free."""
+        with self._lock:
+            sampled = tracemalloc.is_tracing() and self.spans[stage] < self.max_spans
+            if sampled:
+                self.spans[stage] += 1
+        if not sampled:
+            yield
+            return
+
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            growth = [(str(stat.traceback[0]), stat.size_diff)
+                      for stat in after.compare_to(before, 'lineno')
+                      if stat.size_diff > 0 and stat.traceback[0].filename not in _IGNORED_FILES]
+            with self._lock:
+                for site, size in growth:
+                    self.sites[stage][site] += size
+
+    def report(self, top=5):
+        """
+        The allocation sites that grew the most in each stage.
+
+        Args:
+            top: Number of sites listed per stage
+
+        Returns:
+            list: Report lines
+        """
+        lines = []
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"Allocations: {current / 1024:.0f} KiB traced now, peak {peak / 1024:.0f} KiB")
+        with self._lock:
+            stages = {stage: dict(sites) for stage, sites in self.sites.items()}
+            spans = dict(self.spans)
+        for stage, sites in stages.items():
+            total = sum(sites.values())
+            lines.append(f"  {stage}: {total / 1024:.1f} KiB retained over {spans[stage]} sampled span(s)")
+            for site, size in sorted(sites.items(), key=lambda item: -item[1])[:top]:
+                lines.append(f"    {size / 1024:>8.1f} KiB  {site}")
+        return lines
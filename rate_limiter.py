@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+import logging
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting how often work may start."""
+
+    def __init__(self, rate, burst=1):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            rate: Sustained number of permits per second (None or <= 0 disables limiting)
+            burst: Maximum number of permits that can be taken back to back
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a permit is available, then take it."""
+        if not self.rate or self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst,
+                                   self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            logging.debug("Rate limit reached, waiting %.2fs", wait)
+            time.sleep(wait)
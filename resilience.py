@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the LLM cannot be reached; the email should be retried later, not sent to a human."""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while instead of waiting on every request.
+
+    After failure_threshold consecutive failures the breaker opens and refuses
+    calls for reset_timeout seconds. Then a single trial call is let through:
+    success closes the breaker again, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, name="service"):
+        """
+        Initialize the circuit breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds the breaker stays open before a trial call
+            name: Name of the protected service, for logging
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not be made now."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(
+                    f"{self.name} circuit breaker is open, retry in {max(remaining, 0):.0f}s")
+
+            logging.info(f"Letting a trial call through to {self.name}")
+            self._trial_running = True
+
+    def record_success(self):
+        """Record a successful call, closing the breaker."""
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info(f"{self.name} recovered, closing circuit breaker")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """Record a failed call, opening the breaker once the threshold is reached."""
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                logging.warning(
+                    f"Opening {self.name} circuit breaker for {self.reset_timeout}s "
+                    f"after {self._failures} consecutive failure(s)")
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header.
+
+    Args:
+        value: Header value, either seconds or an HTTP date
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay, max_delay, retry_after=None):
+    """
+    Delay before a retry, using exponential backoff with full jitter.
+
+    Args:
+        attempt: Number of the retry, starting at 0
+        base_delay: Delay scale for the first retry, in seconds
+        max_delay: Upper bound for the delay, in seconds
+        retry_after: Server-requested delay, which takes precedence when given
+
+    Returns:
+        float: Seconds to wait
+    """
+    if retry_after is not None:
+        return min(retry_after, max_delay)
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
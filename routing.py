@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import time
+import logging
+import threading
+from statistics import median
+
+from config import LLM_ESCALATION_CONFIDENCE
+from decision import DecisionFormatError, parse_decision
+
+
+class ModelRouter:
+    """
+    Decides on emails with a fast model first and escalates to a stronger one.
+
+    The fast model's decision stands when it is a confident "ignore" or
+    "forward to human". Replies are always written by the strong model, and
+    emails the fast model could not classify, or was unsure about, go to it
+    as well. Every routing decision and the latency and token use of each
+    tier are recorded for tuning the threshold.
+    """
+
+    def __init__(self, llm, strong_model, fast_model=None,
+                 min_confidence=LLM_ESCALATION_CONFIDENCE):
+        """
+        Initialize the router.
+
+        Args:
+            llm: DeepSeekLLM client used for both tiers
+            strong_model: Model for replies and escalated emails
+            fast_model: Model asked first (None sends everything to strong_model)
+            min_confidence: Fast-model confidence (0-100) needed to keep its decision
+        """
+        self.llm = llm
+        self.strong_model = strong_model
+        self.fast_model = fast_model
+        self.min_confidence = min_confidence
+        self.routes = {}
+        self.tier_seconds = {}
+        self.message_seconds = []
+        self._lock = threading.Lock()
+
+    def reset_stats(self):
+        """Forget the routing statistics, e.g. at the start of a run."""
+        with self._lock:
+            self.routes = {}
+            self.tier_seconds = {}
+            self.message_seconds = []
+
+    def classify(self, email_text):
+        """
+        Decide on one email.
+
+        Returns:
+            tuple: (raw response text of the deciding model, Decision); the
+            decision carries the deciding model and the escalation reason
+            ('' when the fast model decided)
+
+        Raises:
+            LLMUnavailableError: If the API stays unreachable after retries
+        """
+        seconds = 0.0
+        escalation = ''
+        if self.fast_model:
+            response_text, elapsed = self._timed(self.llm.generate_response, email_text,
+                                                 self.fast_model)
+            seconds += elapsed
+            try:
+                with self.llm.metrics.span('parse'):
+                    decision = parse_decision(response_text)
+                escalation = self._escalation(decision)
+            except DecisionFormatError:
+                escalation = 'unparsed'
+            if not escalation:
+                return response_text, self._finish(decision, self.fast_model, '', seconds)
+            logging.debug("Escalating email to %s: %s", self.strong_model, escalation)
+
+        response_text, elapsed = self._timed(self.llm.generate_response, email_text,
+                                             self.strong_model)
+        seconds += elapsed
+        decision = self.llm.parse_response(response_text)
+        return response_text, self._finish(decision, self.strong_model, escalation, seconds)
+
+    def classify_batch(self, emails):
+        """
+        Decide on several emails, each tier answering in batched requests.
+
+        Args:
+            emails: Dict of email text by caller-chosen key
+
+        Returns:
+            dict: Decision by key, as from classify(); emails whose request
+            failed with an error are left out
+
+        Raises:
+            LLMUnavailableError: If the API stays unreachable after retries
+        """
+        decisions = {}
+        escalations = dict.fromkeys(emails, '')
+        fast_seconds = 0.0
+        if self.fast_model:
+            fast, fast_seconds = self._timed(self.llm.classify_batch, emails, self.fast_model)
+            escalations = {}
+            for key in emails:
+                decision = fast.get(key)
+                escalation = 'request failed' if decision is None else self._escalation(decision)
+                if escalation:
+                    escalations[key] = escalation
+                else:
+                    decisions[key] = self._finish(decision, self.fast_model, '', fast_seconds)
+            if escalations:
+                logging.debug(
+                    "Escalating %s of %s emails to %s",
+                    len(escalations), len(emails), self.strong_model)
+
+        if escalations:
+            strong, strong_seconds = self._timed(
+                self.llm.classify_batch, {key: emails[key] for key in escalations},
+                self.strong_model)
+            for key, escalation in escalations.items():
+                if key in strong:
+                    decisions[key] = self._finish(strong[key], self.strong_model, escalation,
+                                                  fast_seconds + strong_seconds)
+        return decisions
+
+    def _escalation(self, decision):
+        """The reason to ask the strong model about a fast-model decision, or ''."""
+        if decision.type == 'answer':
+            return 'answer'
+        if decision.confidence is None or decision.confidence < self.min_confidence:
+            return 'low confidence'
+        return ''
+
+    def _timed(self, method, payload, model):
+        """Call an LLM method with a model and record its latency under that tier."""
+        started = time.monotonic()
+        try:
+            return method(payload, model=model), time.monotonic() - started
+        finally:
+            with self._lock:
+                self.tier_seconds.setdefault(model, []).append(time.monotonic() - started)
+
+    def _finish(self, decision, model, escalation, seconds):
+        """Record the route an email took and stamp it on the decision."""
+        route = f"{model} ({escalation})" if escalation else model
+        with self._lock:
+            self.routes[route] = self.routes.get(route, 0) + 1
+            self.message_seconds.append(seconds)
+        decision.model = model
+        decision.escalation = escalation
+        return decision
+
+    def summary(self, usage_by_model, cost):
+        """
+        Describe the routing of the run.
+
+        Args:
+            usage_by_model: Token counts per model since the start of the run
+            cost: Callable returning the US dollar cost of a usage entry
+
+        Returns:
+            list: Log lines
+        """
+        with self._lock:
+            routes = dict(self.routes)
+            tier_seconds = {model: list(seconds) for model, seconds in self.tier_seconds.items()}
+            message_seconds = list(self.message_seconds)
+        if not routes:
+            return []
+
+        lines = ["LLM routing: " + ", ".join(
+            f"{count} to {route}" for route, count in sorted(routes.items(), key=lambda item: -item[1]))]
+        for model, seconds in tier_seconds.items():
+            usage = usage_by_model.get(model)
+            spent = f", ${cost(usage):.4f}" if usage else ""
+            lines.append(
+                f"  {model}: {len(seconds)} request(s), median {median(seconds):.2f}s, "
+                f"max {max(seconds):.2f}s{spent}")
+        lines.append(f"  Median LLM time per message: {median(message_seconds):.2f}s")
+        return lines
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """
+    Records where start-up time goes: module imports and initialization phases.
+
+    Import timing works like `python -X importtime`, but is collected in
+    process so it can be logged next to the phases: each first-time import
+    gets its own time (excluding the imports it triggers) and its cumulative time.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.imports = {}
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a named initialization phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, time.perf_counter() - started))
+
+    @contextmanager
+    def track_imports(self):
+        """Time the modules first imported inside the block (main thread only)."""
+        original_import = builtins.__import__
+        owner = threading.get_ident()
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules or threading.get_ident() != owner:
+                return original_import(name, globals, locals, fromlist, level)
+
+            started = time.perf_counter()
+            self._stack.append(0.0)
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                elapsed = time.perf_counter() - started
+                nested = self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += elapsed
+                self.imports[name] = (elapsed - nested, elapsed)
+
+        builtins.__import__ = timed_import
+        try:
+            with self.phase("imports"):
+                yield
+        finally:
+            builtins.__import__ = original_import
+
+    def report(self, top=8):
+        """
+        Summarize the recorded timings.
+
+        Args:
+            top: Number of slowest top-level packages to list
+
+        Returns:
+            list: Report lines
+        """
+        lines = [f"Start-up: {time.process_time():.2f}s CPU time in this process so far"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name}: {seconds * 1000:.0f} ms")
+
+        # Cumulative time of each top-level package, as imported from our code
+        packages = {}
+        for name, (_, cumulative) in self.imports.items():
+            package = name.partition('.')[0]
+            packages[package] = max(packages.get(package, 0.0), cumulative)
+        for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"  import {package}: {seconds * 1000:.0f} ms")
+        return lines
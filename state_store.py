@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+import threading
+
+
+class StateStore:
+    """
+    Small versioned JSON file that keeps bot state between runs.
+
+    The file can hold an access token, so it is only readable by its owner.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        """
+        Initialize the state store.
+
+        Args:
+            path: Location of the JSON state file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self):
+        """Load the state file, starting empty if it is missing or unusable."""
+        if not os.path.exists(self.path):
+            logging.debug("No state file at %s, starting empty", self.path)
+            return {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not read state file {self.path}: {str(e)}")
+            return {}
+
+        if stored.get('version') != self.VERSION:
+            logging.warning(
+                f"Ignoring state file {self.path} with unsupported version {stored.get('version')}")
+            return {}
+
+        logging.debug("Loaded state from %s", self.path)
+        return stored.get('data', {})
+
+    def get(self, key, default=None):
+        """Return a stored value."""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value):
+        """Store a value in memory; call save() to persist it."""
+        with self._lock:
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                self._data[key] = value
+
+    def save(self):
+        """Write the state to disk atomically."""
+        with self._lock:
+            payload = {'version': self.VERSION, 'data': self._data}
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_path = f"{self.path}.tmp"
+            try:
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with open(fd, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                logging.debug("Saved state to %s", self.path)
+            except Exception as e:
+                logging.error(f"Could not save state file {self.path}: {str(e)}")